@@ -3,7 +3,10 @@ from flask import Flask, render_template, request, jsonify, redirect, url_for, s
 from flask_cors import CORS
 import json
 import os
+import base64
 from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
 # from dotenv import load_dotenv  # .envファイルは使用しない
 from modules.site_manager import SiteManager, Site
 from modules.affiliate_manager import AffiliateManager, AffiliateProgram, AffiliateProduct
@@ -12,6 +15,13 @@ from modules.wordpress_publisher import WordPressPublisher
 from modules.unsplash_fetcher import UnsplashFetcher
 from modules.category_selector import CategorySelector
 from modules.article_variation import ArticleVariationGenerator
+from modules.article_store import ArticleStore
+from modules.publish_outbox import PublishOutbox
+from modules.generation_jobs import GenerationJobQueue
+from modules.provider_limits import get_provider_limiter
+from modules.rate_limiter import get_rate_limiter
+from services.image_pipeline import get_image_pipeline
+from modules.transport import install_from_env as install_transport_from_env
 
 # ログ設定
 import logging
@@ -40,6 +50,9 @@ try:
 except Exception as e:
     logger.error(f"API設定ファイルの読み込みエラー: {str(e)}")
 
+# PAE_TRANSPORT=record/replay/synthetic で外部API通信を記録・再生・合成に切り替え
+install_transport_from_env()
+
 app = Flask(__name__)
 app.config['SECRET_KEY'] = os.getenv('FLASK_SECRET_KEY', 'your-secret-key-here')
 CORS(app)
@@ -47,17 +60,13 @@ CORS(app)
 # マネージャーのインスタンス
 site_manager = SiteManager()
 affiliate_manager = AffiliateManager()
+article_store = ArticleStore()
+publish_outbox = PublishOutbox(article_store)
+# 記事生成ジョブ（同時実行数は GENERATION_WORKERS で指定）
+generation_jobs = GenerationJobQueue(max_workers=int(os.getenv('GENERATION_WORKERS', '2')))
 
 # 実際の統計データを取得する関数
 def get_real_stats():
-    # 記事データを読み込む
-    try:
-        with open('data/generated_articles.json', 'r', encoding='utf-8') as f:
-            articles_data = json.load(f)
-            articles = articles_data.get('articles', [])
-    except:
-        articles = []
-    
     # 自動化統計を読み込む
     try:
         with open('data/automation_stats.json', 'r', encoding='utf-8') as f:
@@ -65,18 +74,25 @@ def get_real_stats():
     except:
         auto_stats = {'total_generated': 0, 'total_published': 0}
     
-    # 今日の投稿数を計算
-    today = datetime.now().strftime('%Y-%m-%d')
-    today_posts = len([a for a in articles if a.get('created_at', '').startswith(today)])
+    # 今日の投稿数を計算（集計テーブルから取得）
+    today = datetime.now().date()
+    today_posts = article_store.get_rollup_totals(
+        day_from=today.isoformat(),
+        day_to=(today + timedelta(days=1)).isoformat()
+    )['generated']
     
     # 今月の投稿数を計算
-    this_month = datetime.now().strftime('%Y-%m')
-    monthly_articles = len([a for a in articles if a.get('created_at', '').startswith(this_month)])
+    month_start = today.replace(day=1)
+    next_month = (month_start + timedelta(days=32)).replace(day=1)
+    monthly_articles = article_store.get_rollup_totals(
+        day_from=month_start.isoformat(),
+        day_to=next_month.isoformat()
+    )['generated']
     
     return {
         'total_sites': len(site_manager.get_all_sites()),
         'active_sites': len([s for s in site_manager.get_all_sites()]),
-        'total_articles': len(articles),
+        'total_articles': article_store.get_rollup_totals()['generated'],
         'monthly_articles': monthly_articles,
         'today_posts': today_posts,
         'scheduled_posts': 0,  # 実装予定
@@ -89,11 +105,7 @@ def get_recent_activities():
     
     # 記事データから最近の活動を取得
     try:
-        with open('data/generated_articles.json', 'r', encoding='utf-8') as f:
-            articles_data = json.load(f)
-            articles = sorted(articles_data.get('articles', []), 
-                            key=lambda x: x.get('created_at', ''), 
-                            reverse=True)[:5]  # 最新5件
+        articles = article_store.list_articles(limit=5)  # 最新5件
             
         for article in articles:
             created_at = datetime.fromisoformat(article.get('created_at', ''))
@@ -145,21 +157,13 @@ def get_site_status():
     sites = site_manager.get_all_sites()
     site_status = []
     
-    # 記事データを読み込む
-    try:
-        with open('data/generated_articles.json', 'r', encoding='utf-8') as f:
-            articles_data = json.load(f)
-            articles = articles_data.get('articles', [])
-    except:
-        articles = []
-    
     for site in sites[:3]:
-        # サイトごとの記事を取得
-        site_articles = [a for a in articles if a.get('site_id') == site.site_id]
+        # サイトの最新記事を取得
+        site_articles = article_store.list_articles(site_id=site.site_id, limit=1)
         
         # 最後の投稿時間を計算
         if site_articles:
-            latest_article = max(site_articles, key=lambda x: x.get('created_at', ''))
+            latest_article = site_articles[0]
             created_at = datetime.fromisoformat(latest_article.get('created_at', ''))
             time_diff = datetime.now() - created_at
             
@@ -171,8 +175,12 @@ def get_site_status():
                 last_post = f'{time_diff.seconds // 60}分前'
                 
             # 今日の投稿数で進捗を計算
-            today = datetime.now().strftime('%Y-%m-%d')
-            today_posts = len([a for a in site_articles if a.get('created_at', '').startswith(today)])
+            today = datetime.now().date()
+            today_posts = article_store.get_rollup_totals(
+                day_from=today.isoformat(),
+                day_to=(today + timedelta(days=1)).isoformat(),
+                site_id=site.site_id
+            )['generated']
             progress = min(today_posts * 20, 100)  # 1記事20%として計算
         else:
             last_post = '未投稿'
@@ -191,18 +199,15 @@ def get_site_status():
 
 def get_performance_data():
     """過去7日間のパフォーマンスデータを取得"""
-    # 記事データを読み込む
-    try:
-        with open('data/generated_articles.json', 'r', encoding='utf-8') as f:
-            articles_data = json.load(f)
-            articles = articles_data.get('articles', [])
-    except:
-        articles = []
-    
     # 過去7日間の日付リストを作成
     today = datetime.now().date()
     dates = [(today - timedelta(days=i)) for i in range(6, -1, -1)]
     
+    # 日別の生成数・公開数を集計テーブルから取得
+    daily_counts = article_store.get_daily_counts(
+        dates[0].isoformat(), (today + timedelta(days=1)).isoformat()
+    )
+    
     # 日本語の曜日
     weekdays = ['月', '火', '水', '木', '金', '土', '日']
     labels = []
@@ -210,18 +215,13 @@ def get_performance_data():
     published_counts = []
     
     for date in dates:
-        date_str = date.strftime('%Y-%m-%d')
         # 曜日を取得
         weekday = weekdays[date.weekday()]
         labels.append(f"{date.month}/{date.day}({weekday})")
         
-        # その日の記事を数える
-        day_articles = [a for a in articles if a.get('created_at', '').startswith(date_str)]
-        generated_counts.append(len(day_articles))
-        
-        # 公開済みの記事を数える
-        published = len([a for a in day_articles if a.get('status') == '公開済み'])
-        published_counts.append(published)
+        counts = daily_counts.get(date.isoformat(), {})
+        generated_counts.append(counts.get('generated', 0))
+        published_counts.append(counts.get('published', 0))
     
     return {
         'labels': labels,
@@ -339,315 +339,407 @@ def delete_site(site_id):
     else:
         return jsonify({'success': False, 'error': 'Failed to delete site'}), 400
 
-@app.route('/api/generate', methods=['POST'])
-def generate_articles():
-    """記事生成"""
-    logger.info("記事生成API呼び出し開始")
-    data = request.json
-    logger.info(f"リクエストデータ: {data}")
+def load_batch_workers():
+    """バッチ内の記事を並列生成するワーカー数を設定から取得"""
+    try:
+        with open('config/automation_settings.json', 'r') as f:
+            settings = json.load(f)
+        return max(1, int(settings.get('global', {}).get('concurrency', {}).get('batch_workers', 4)))
+    except Exception:
+        return 4
+
+def generate_batch_article(job, generator, variation_generator, site, i, count, article_length, user_keywords,
+                           image_prefetch=None):
+    """
+    バッチ内の1記事を生成（並列実行される）
+
+    ストリーミングで受信し、タイトルと本文の受信文字数をジョブの進捗に反映する。
+    image_prefetch があればタイトルとタグの受信時点でアイキャッチ画像の生成を始める
+
+    Returns:
+        生成された記事（ID・作成日時は保存時に付与）
+    """
+    limiter = get_provider_limiter()
+    provider = 'venice' if site.ai_model == 'venice' else 'openai'
+    
+    def on_field(tag, value):
+        if tag == 'title':
+            job.update_article(i, title=value)
+        if image_prefetch:
+            image_prefetch.on_field(tag, value)
+    
+    def on_progress(received_chars):
+        job.update_article(i, received_chars=received_chars)
+    
+    # アフィリエイト商品をランダムに選択（ある場合）
+    all_products = affiliate_manager.get_all_products()
+    affiliate_products = all_products[:2] if all_products else None
+    
+    # バリエーションを生成
+    # ユーザー指定のキーワードがある場合はそれを優先
+    if user_keywords:
+        base_keywords = [k.strip() for k in user_keywords.split(',') if k.strip()]
+    else:
+        base_keywords = site.keywords_focus.split(',') if site.keywords_focus else []
+    unique_keywords = variation_generator.get_unique_keywords(base_keywords, i)
+    # ユーザーが指定した文字数を使用（バリエーションを加える）
+    varied_article_length = variation_generator.get_article_length_variation(article_length, i)
     
-    site_id = data.get('site_id')
-    count = int(data.get('count', 1))  # 整数に変換
-    auto_publish = data.get('auto_publish', False)  # 自動投稿フラグ
-    article_length = int(data.get('length', 5000))  # 文字数設定
-    user_keywords = data.get('keywords', '')  # ユーザー指定のキーワード
+    # site_infoにバリエーションプロンプトを追加
+    site_info_with_variation = site.to_dict()
+    site_info_with_variation['variation_prompt'] = variation_generator.generate_variation_prompt(
+        base_topic=site.genre_details or site.genre,
+        index=i,
+        total_count=count
+    )
     
+    # 記事を生成（エラー時はより短い長さで再試行）
     try:
-        # バリデーション
-        if not site_id:
-            return jsonify({'success': False, 'error': 'サイトIDが指定されていません'}), 400
-            
-        # countが有効な数値か確認
-        if count < 1 or count > 10:
-            return jsonify({'success': False, 'error': '記事数は1〜10の範囲で指定してください'}), 400
+        with limiter.slot(provider):
+            article = generator.generate_article(
+                site_info=site_info_with_variation,
+                keywords=unique_keywords,
+                length=varied_article_length,
+                tone='friendly',
+                affiliate_products=[p.to_dict() for p in affiliate_products] if affiliate_products else None,
+                stream=True,
+                on_field=on_field,
+                on_progress=on_progress
+            )
+    except Exception as first_error:
+        print(f"{varied_article_length}文字での生成に失敗。より短い文字数で再試行: {str(first_error)}")
+        # より短い長さで再試行
+        # ユーザー指定のキーワードを使用
+        retry_keywords = base_keywords if user_keywords else (site.keywords_focus.split(',') if site.keywords_focus else [])
+        with limiter.slot(provider):
+            article = generator.generate_article(
+                site_info=site.to_dict(),
+                keywords=retry_keywords,
+                length=min(3000, article_length // 2),  # 半分または3000文字の小さい方
+                tone='friendly',
+                affiliate_products=[p.to_dict() for p in affiliate_products] if affiliate_products else None,
+                stream=True,
+                on_field=on_field,
+                on_progress=on_progress
+            )
+    
+    return article
+
+def auto_publish_generated_article(job, i, site, article, image_prefetch=None):
+    """
+    生成済み記事をWordPressに自動投稿（並列実行される）
+
+    WordPressへのリクエストはホストごとの同時実行枠内で行う。
+    image_prefetch があれば本文と並行して生成したアイキャッチ画像を使う
+    """
+    limiter = get_provider_limiter()
+    logger.info(f"自動投稿を開始: {article['title']}")
+    job.update_article(i, status='publishing')
+    
+    try:
+        # WordPressに投稿
+        publisher = WordPressPublisher.for_site(
+            site.url,
+            site.wordpress_username,
+            site.wordpress_app_password
+        )
         
-        # サイト情報を取得
-        site = site_manager.get_site_by_id(site_id)
-        if not site:
-            return jsonify({'success': False, 'error': 'サイトが見つかりません'}), 404
+        with limiter.wordpress_slot(site.url):
+            connected = publisher.ensure_connection()
+            wp_categories = publisher.get_categories() if connected else []
         
-        # 記事生成器を初期化（サイトのAIモデル設定に応じて選択）
-        if site.ai_model == 'venice':
-            from modules.venice_generator import VeniceArticleGenerator
-            generator = VeniceArticleGenerator()
-        else:
-            generator = ArticleGenerator()
-        variation_generator = ArticleVariationGenerator()
+        if not connected:
+            logger.error("WordPress接続失敗")
+            job.update_article(i, status='generated', error='WordPress接続失敗')
+            return
         
-        # 生成された記事を保存するファイル
-        articles_file = 'data/generated_articles.json'
+        # カテゴリ選択
+        category_ids = []
         
-        # 既存の記事を読み込む
-        try:
-            with open(articles_file, 'r', encoding='utf-8') as f:
-                articles_data = json.load(f)
-        except:
-            articles_data = {'articles': []}
+        if wp_categories:
+            selector = CategorySelector()
+            selected_category_id = selector.select_category(
+                title=article['title'],
+                content=article['content'],
+                tags=article['tags'],
+                available_categories=wp_categories
+            )
+            
+            if selected_category_id:
+                category_ids.append(selected_category_id)
+                for cat in wp_categories:
+                    if cat['id'] == selected_category_id:
+                        logger.info(f"カテゴリ選択: {cat['name']}")
+                        break
         
-        generated_count = 0
-        generated_article_ids = []
+        # アイキャッチ画像（サイト設定に基づく、アウトボックスが画像アップロード前の段階の場合のみ実行）
+        def upload_featured_media():
+            featured_media_id = None
+            
+            logger.info(f"画像サービス設定: {site.image_service}")
+            if site.image_service != 'none':
+                # 新しい画像生成システムを使用（本文と並行して生成済みならその結果を使う）
+                if site.image_service in ['auto', 'gemini_image', 'gpt_image']:
+                    if image_prefetch:
+                        image_path = image_prefetch.result(article['title'], article['tags'])
+                    else:
+                        from services.image_generation import generate_site_image
+                        image_path = generate_site_image(site, article['title'], article['tags'])
+                    
+                    if image_path:
+                        # 生成された画像を最適化したバリエーションでアップロード
+                        upload_path = get_image_pipeline().prepare_upload(image_path)
+                        with limiter.wordpress_slot(site.url):
+                            featured_media_id = publisher.upload_media_from_file(
+                                file_path=upload_path,
+                                alt_text=article['title']
+                            )
+                        logger.info(f"生成画像をアップロード: {image_path}, ID: {featured_media_id}")
+                
+                # Unsplashを使用（フォールバックまたは指定された場合）
+                if site.image_service == 'unsplash' or (not featured_media_id and site.image_service != 'none'):
+                    unsplash = UnsplashFetcher()
+                    if unsplash.is_configured():
+                        with limiter.slot('unsplash'):
+                            photo = unsplash.get_photo_for_article(
+                                title=article['title'],
+                                keywords=article['tags'],
+                                content=article['content'][:500]
+                            )
+                        
+                        if photo:
+                            with limiter.wordpress_slot(site.url):
+                                featured_media_id = publisher.upload_media(
+                                    image_url=photo['url'],
+                                    alt_text=photo.get('alt_description', article['title'])
+                                )
+                            unsplash.download_photo(photo['id'])
+            return featured_media_id
+        
+        # 投稿（前回の試行で投稿済みなら再投稿しない）
+        result = publish_outbox.publish(
+            publisher,
+            article,
+            upload_media=upload_featured_media,
+            categories=category_ids,
+            status='publish',
+            request_slot=lambda: limiter.wordpress_slot(site.url)
+        )
         
-        # 指定された数の記事を生成
+        if result:
+            # 記事ストアのステータスはアウトボックスが更新済み
+            job.update_article(i, status='published', wordpress_url=result['link'])
+            logger.info(f"自動投稿成功: {result['link']}")
+        else:
+            logger.error("自動投稿失敗")
+            job.update_article(i, status='generated', error='自動投稿失敗')
+            
+    except Exception as publish_error:
+        logger.error(f"自動投稿エラー: {str(publish_error)}")
+        # 投稿エラーでも記事生成は成功とする
+        job.update_article(i, status='generated', error=f'自動投稿エラー: {str(publish_error)}')
+
+def run_generation_job(job, site, count, auto_publish, article_length, user_keywords):
+    """
+    記事生成ジョブ本体（ジョブキューのワーカースレッドで実行）
+
+    バッチ内の記事は並列に生成し、ストアへはバッチ内の順序どおりに保存する。
+    記事ごとの進捗は job.update_article で記録する
+    """
+    site_id = site.site_id
+    
+    # 記事生成器を初期化（サイトのAIモデル設定に応じて選択）
+    if site.ai_model == 'venice':
+        from modules.venice_generator import VeniceArticleGenerator
+        generator = VeniceArticleGenerator()
+    else:
+        generator = ArticleGenerator()
+    variation_generator = ArticleVariationGenerator()
+    
+    can_publish = auto_publish and site.wordpress_username and site.wordpress_app_password
+    workers = min(count, load_batch_workers())
+    
+    # 自動投稿する場合はアイキャッチ画像を本文の生成と並行して用意する
+    # （バッチ内の画像はまとめて生成し、選択履歴はバッチ全体で1回だけ記録する）
+    image_batch = None
+    image_prefetches = [None] * count
+    if can_publish and site.image_service in ['auto', 'gemini_image', 'gpt_image']:
+        from services.image_generation import FeaturedImageBatch
+        image_batch = FeaturedImageBatch(site)
+        image_prefetches = [image_batch.prefetch(i) for i in range(count)]
+    
+    with image_batch or nullcontext(), \
+            ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"generate-{job.job_id}") as executor:
+        # 指定された数の記事を並列に生成
+        futures = []
         for i in range(count):
+            job.update_article(i, status='generating')
+            futures.append(executor.submit(
+                generate_batch_article, job, generator, variation_generator,
+                site, i, count, article_length, user_keywords, image_prefetches[i]
+            ))
+        
+        # 生成順に関わらず、バッチ内の順序で保存する
+        publish_futures = []
+        for i, future in enumerate(futures):
             try:
-                # アフィリエイト商品をランダムに選択（ある場合）
-                all_products = affiliate_manager.get_all_products()
-                affiliate_products = all_products[:2] if all_products else None
-                
-                # バリエーションを生成
-                # ユーザー指定のキーワードがある場合はそれを優先
-                if user_keywords:
-                    base_keywords = [k.strip() for k in user_keywords.split(',') if k.strip()]
-                else:
-                    base_keywords = site.keywords_focus.split(',') if site.keywords_focus else []
-                unique_keywords = variation_generator.get_unique_keywords(base_keywords, i)
-                # ユーザーが指定した文字数を使用（バリエーションを加える）
-                varied_article_length = variation_generator.get_article_length_variation(article_length, i)
-                
-                # site_infoにバリエーションプロンプトを追加
-                site_info_with_variation = site.to_dict()
-                site_info_with_variation['variation_prompt'] = variation_generator.generate_variation_prompt(
-                    base_topic=site.genre_details or site.genre,
-                    index=i,
-                    total_count=count
-                )
-                
-                # 記事を生成（エラー時はより短い長さで再試行）
-                try:
-                    article = generator.generate_article(
-                        site_info=site_info_with_variation,
-                        keywords=unique_keywords,
-                        length=varied_article_length,
-                        tone='friendly',
-                        affiliate_products=[p.to_dict() for p in affiliate_products] if affiliate_products else None
-                    )
-                except Exception as first_error:
-                    print(f"{varied_article_length}文字での生成に失敗。より短い文字数で再試行: {str(first_error)}")
-                    # より短い長さで再試行
-                    # ユーザー指定のキーワードを使用
-                    retry_keywords = base_keywords if user_keywords else (site.keywords_focus.split(',') if site.keywords_focus else [])
-                    article = generator.generate_article(
-                        site_info=site.to_dict(),
-                        keywords=retry_keywords,
-                        length=min(3000, article_length // 2),  # 半分または3000文字の小さい方
-                        tone='friendly',
-                        affiliate_products=[p.to_dict() for p in affiliate_products] if affiliate_products else None
-                    )
+                article = future.result()
                 
                 # 記事にIDとサイト情報を追加
-                article['id'] = f"article_{datetime.now().strftime('%Y%m%d%H%M%S')}_{i}"
+                article['id'] = f"article_{datetime.now().strftime('%Y%m%d%H%M%S')}_{job.job_id}_{i}"
                 article['site_id'] = site_id
                 article['site_name'] = site.name
                 article['status'] = '下書き'
                 article['created_at'] = datetime.now().isoformat()
                 
                 # 記事を保存
-                articles_data['articles'].insert(0, article)
-                generated_count += 1
-                generated_article_ids.append(article['id'])
-                
-                # 自動投稿が有効な場合
-                if auto_publish and site.wordpress_username and site.wordpress_app_password:
-                    logger.info(f"自動投稿を開始: {article['title']}")
-                    
-                    try:
-                        # WordPressに投稿
-                        publisher = WordPressPublisher(
-                            site.url,
-                            site.wordpress_username,
-                            site.wordpress_app_password
-                        )
-                        
-                        if publisher.test_connection():
-                            # カテゴリ選択
-                            wp_categories = publisher.get_categories()
-                            category_ids = []
-                            
-                            if wp_categories:
-                                selector = CategorySelector()
-                                selected_category_id = selector.select_category(
-                                    title=article['title'],
-                                    content=article['content'],
-                                    tags=article['tags'],
-                                    available_categories=wp_categories
-                                )
-                                
-                                if selected_category_id:
-                                    category_ids.append(selected_category_id)
-                                    for cat in wp_categories:
-                                        if cat['id'] == selected_category_id:
-                                            logger.info(f"カテゴリ選択: {cat['name']}")
-                                            break
-                            
-                            # アイキャッチ画像（サイト設定に基づく）
-                            featured_media_id = None
-                            
-                            logger.info(f"画像サービス設定: {site.image_service}")
-                            if site.image_service != 'none':
-                                # 新しい画像生成システムを使用
-                                if site.image_service in ['auto', 'gemini_image', 'gpt_image']:
-                                    try:
-                                        logger.info("画像生成システムを初期化中...")
-                                        from services.image_generation import ImageGenerationManager
-                                        image_manager = ImageGenerationManager()
-                                        
-                                        # サイト設定に基づいてプロンプトを調整
-                                        if image_manager.config.get('image_generation', {}).get('enabled', False):
-                                            logger.info("画像生成が有効です")
-                                            # ユーザー選択サービスまたは自動選択
-                                            user_preference = None if site.image_service == 'auto' else site.image_service
-                                            logger.info(f"画像生成サービス: {user_preference or 'auto'}")
-                                            
-                                            # プロンプト生成時にサイト設定を反映
-                                            image_manager.prompt_generator.default_style = site.image_style
-                                            image_manager.prompt_generator.quality = site.image_quality
-                                            image_manager.prompt_generator.additional_instructions = site.image_instructions
-                                            image_manager.prompt_generator.tone = site.image_tone
-                                            image_manager.prompt_generator.avoid_terms = site.image_avoid_terms.split(',')
-                                            
-                                            image_path = image_manager.generate_article_image(
-                                                article_title=article['title'],
-                                                keywords=article['tags'],
-                                                genre=site.genre,
-                                                user_preference=user_preference
-                                            )
-                                            
-                                            if image_path and os.path.exists(image_path):
-                                                logger.info(f"画像生成成功: {image_path}")
-                                                # 生成された画像をアップロード
-                                                featured_media_id = publisher.upload_media_from_file(
-                                                    file_path=image_path,
-                                                    alt_text=article['title']
-                                                )
-                                                logger.info(f"生成画像をアップロード: {image_path}, ID: {featured_media_id}")
-                                            else:
-                                                logger.warning("画像生成に失敗しました")
-                                        else:
-                                            logger.warning("画像生成が無効になっています")
-                                    except Exception as e:
-                                        logger.error(f"画像生成エラー: {str(e)}")
-                                        import traceback
-                                        logger.error(traceback.format_exc())
-                                
-                                # Unsplashを使用（フォールバックまたは指定された場合）
-                                if site.image_service == 'unsplash' or (not featured_media_id and site.image_service != 'none'):
-                                    unsplash = UnsplashFetcher()
-                                    if unsplash.is_configured():
-                                        photo = unsplash.get_photo_for_article(
-                                            title=article['title'],
-                                            keywords=article['tags'],
-                                            content=article['content'][:500]
-                                        )
-                                        
-                                        if photo:
-                                            featured_media_id = publisher.upload_media(
-                                                image_url=photo['url'],
-                                                alt_text=photo.get('alt_description', article['title'])
-                                            )
-                                            unsplash.download_photo(photo['id'])
-                            
-                            # 投稿
-                            result = publisher.publish_post(
-                                title=article['title'],
-                                content=article['content'],
-                                excerpt=article.get('excerpt', ''),
-                                categories=category_ids,
-                                tags=article['tags'],
-                                featured_media_id=featured_media_id,
-                                status='publish'
-                            )
-                            
-                            if result:
-                                # ステータスを更新
-                                article['status'] = '公開済み'
-                                article['wordpress_url'] = result['link']
-                                article['wordpress_id'] = result['id']
-                                article['published_at'] = datetime.now().isoformat()
-                                logger.info(f"自動投稿成功: {result['link']}")
-                            else:
-                                logger.error("自動投稿失敗")
-                        else:
-                            logger.error("WordPress接続失敗")
-                            
-                    except Exception as publish_error:
-                        logger.error(f"自動投稿エラー: {str(publish_error)}")
-                        # 投稿エラーでも記事生成は成功とする
-                
+                article_store.add_article(article)
+                job.update_article(i, status='generated', article_id=article['id'], title=article.get('title'))
             except Exception as e:
                 import traceback
                 logger.error(f"記事生成エラー: {str(e)}")
                 print(f"記事生成エラー: {str(e)}")
                 traceback.print_exc()
+                job.update_article(i, status='failed', error=str(e))
+                # 本文と並行して始めたアイキャッチ画像の生成は不要になる
+                if image_prefetches[i]:
+                    image_prefetches[i].cancel()
                 continue
+            
+            # 自動投稿が有効な場合
+            if can_publish:
+                publish_futures.append(executor.submit(
+                    auto_publish_generated_article, job, i, site, article, image_prefetches[i]
+                ))
+        
+        for future in publish_futures:
+            future.result()
+    
+    generated_count = len(job.article_ids)
+    logger.info(f"記事生成完了: {generated_count}件")
+    
+    # 記事が1件も生成されていない場合はエラー
+    if generated_count == 0:
+        raise Exception('記事の生成に失敗しました。APIキーとモデル設定を確認してください。')
+
+@app.route('/api/generate', methods=['POST'])
+def generate_articles():
+    """記事生成ジョブを登録（生成はバックグラウンドで実行し、job_idを即座に返す）"""
+    logger.info("記事生成API呼び出し開始")
+    data = request.json or {}
+    logger.info(f"リクエストデータ: {data}")
+    
+    try:
+        site_id = data.get('site_id')
+        count = int(data.get('count', 1))  # 整数に変換
+        auto_publish = data.get('auto_publish', False)  # 自動投稿フラグ
+        article_length = int(data.get('length', 5000))  # 文字数設定
+        user_keywords = data.get('keywords', '')  # ユーザー指定のキーワード
+    except (TypeError, ValueError):
+        return jsonify({'success': False, 'error': '記事数または文字数が不正です'}), 400
+    
+    # バリデーション
+    if not site_id:
+        return jsonify({'success': False, 'error': 'サイトIDが指定されていません'}), 400
         
-        # ファイルに保存
-        logger.info(f"記事を保存中... 生成数: {generated_count}")
-        with open(articles_file, 'w', encoding='utf-8') as f:
-            json.dump(articles_data, f, ensure_ascii=False, indent=2)
-        
-        logger.info(f"記事生成完了: {generated_count}件")
-        
-        # ファイルが正しく保存されたか確認
-        with open(articles_file, 'r', encoding='utf-8') as f:
-            saved_data = json.load(f)
-            logger.info(f"保存された記事数: {len(saved_data.get('articles', []))}")
-        
-        # 記事が1件も生成されていない場合はエラー
-        if generated_count == 0:
-            return jsonify({
-                'success': False,
-                'error': '記事の生成に失敗しました。APIキーとモデル設定を確認してください。',
-                'generated_count': 0
-            }), 500
-        
-        # レスポンスを即座に返す（長時間の処理でタイムアウトを防ぐ）
-        response_data = {
-            'success': True,
-            'message': f'{generated_count}件の記事を生成しました',
-            'generated_count': generated_count,
-            'article_ids': generated_article_ids
+    # countが有効な数値か確認
+    if count < 1 or count > 10:
+        return jsonify({'success': False, 'error': '記事数は1〜10の範囲で指定してください'}), 400
+    
+    # サイト情報を取得
+    site = site_manager.get_site_by_id(site_id)
+    if not site:
+        return jsonify({'success': False, 'error': 'サイトが見つかりません'}), 404
+    
+    job = generation_jobs.submit(
+        site_id=site_id,
+        count=count,
+        runner=lambda job: run_generation_job(job, site, count, auto_publish, article_length, user_keywords),
+        params={
+            'auto_publish': auto_publish,
+            'length': article_length,
+            'keywords': user_keywords
         }
-        
-        logger.info(f"記事生成レスポンス: {response_data}")
-        return jsonify(response_data)
-        
-    except Exception as e:
-        import traceback
-        error_trace = traceback.format_exc()
-        logger.error(f"記事生成エラー: {str(e)}\n{error_trace}")
-        
-        # 部分的に成功している場合も考慮
-        return jsonify({
-            'success': False, 
-            'error': str(e),
-            'generated_count': generated_count if 'generated_count' in locals() else 0,
-            'partial_success': generated_count > 0 if 'generated_count' in locals() else False
-        }), 500
+    )
+    
+    return jsonify({
+        'success': True,
+        'message': f'{count}件の記事生成を開始しました',
+        'job_id': job.job_id,
+        'status': job.status
+    }), 202
+
+@app.route('/api/generate/jobs', methods=['GET'])
+def list_generation_jobs():
+    """記事生成ジョブ一覧（新しい順）"""
+    limit = min(request.args.get('limit', 20, type=int) or 20, 100)
+    return jsonify({'jobs': [job.to_dict() for job in generation_jobs.list_jobs(limit)]})
+
+@app.route('/api/generate/jobs/<job_id>', methods=['GET'])
+def get_generation_job(job_id):
+    """記事生成ジョブの進捗と結果"""
+    job = generation_jobs.get_job(job_id)
+    if not job:
+        return jsonify({'success': False, 'error': 'ジョブが見つかりません'}), 404
+    return jsonify(job.to_dict())
+
+
+# 記事一覧APIの1ページあたりの最大件数
+ARTICLE_PAGE_MAX_LIMIT = 100
+
+def encode_article_cursor(cursor):
+    """ページングカーソル (created_at, id) を文字列に変換"""
+    if not cursor:
+        return None
+    raw = json.dumps(list(cursor), ensure_ascii=False).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii')
+
+def decode_article_cursor(value):
+    """文字列のページングカーソルを (created_at, id) に変換"""
+    if not value:
+        return None
+    try:
+        created_at, article_id = json.loads(base64.urlsafe_b64decode(value.encode('ascii')))
+        return str(created_at), str(article_id)
+    except Exception:
+        raise ValueError('カーソルの形式が不正です')
+
+def get_article_page(default_limit, default_fields=None):
+    """
+    クエリパラメータ（limit, cursor, fields, site_id, status）に従って記事一覧の1ページを取得
+    
+    Returns:
+        (記事リスト, 次ページのカーソル文字列)
+    """
+    limit = min(max(int(request.args.get('limit', default_limit)), 1), ARTICLE_PAGE_MAX_LIMIT)
+    fields = [f.strip() for f in request.args.get('fields', '').split(',') if f.strip()]
+    
+    articles, next_cursor = article_store.list_articles_page(
+        site_id=request.args.get('site_id') or None,
+        status=request.args.get('status') or None,
+        limit=limit,
+        after=decode_article_cursor(request.args.get('cursor')),
+        fields=fields or default_fields
+    )
+    return articles, encode_article_cursor(next_cursor)
 
 @app.route('/api/articles/recent', methods=['GET'])
 def get_recent_articles():
     """最近の記事を取得"""
     try:
-        limit = int(request.args.get('limit', 10))
-        
-        with open('data/generated_articles.json', 'r', encoding='utf-8') as f:
-            articles_data = json.load(f)
-        
-        articles = articles_data.get('articles', [])[:limit]
+        articles, next_cursor = get_article_page(
+            default_limit=10,
+            default_fields=['id', 'title', 'site_name', 'status', 'created_at', 'wordpress_url']
+        )
         
-        # 記事データを整形
-        formatted_articles = []
+        # ステータス未設定の記事は下書きとして扱う
         for article in articles:
-            formatted_articles.append({
-                'id': article.get('id'),
-                'title': article.get('title'),
-                'site_name': article.get('site_name'),
-                'status': article.get('status', '下書き'),
-                'created_at': article.get('created_at'),
-                'wordpress_url': article.get('wordpress_url')
-            })
+            if 'status' in article and not article['status']:
+                article['status'] = '下書き'
         
-        return jsonify({'articles': formatted_articles})
+        return jsonify({'articles': articles, 'next_cursor': next_cursor})
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -656,16 +748,7 @@ def publish_article_to_wordpress(article_id):
     """記事をWordPressに投稿"""
     try:
         # 記事データを取得
-        with open('data/generated_articles.json', 'r', encoding='utf-8') as f:
-            articles_data = json.load(f)
-        
-        article = None
-        article_index = None
-        for i, a in enumerate(articles_data.get('articles', [])):
-            if a['id'] == article_id:
-                article = a
-                article_index = i
-                break
+        article = article_store.get_article(article_id)
         
         if not article:
             return jsonify({'success': False, 'error': '記事が見つかりません'}), 404
@@ -682,15 +765,15 @@ def publish_article_to_wordpress(article_id):
                 'error': 'WordPress認証情報が設定されていません。サイト設定を確認してください。'
             }), 400
         
-        # WordPressPublisherを初期化
-        publisher = WordPressPublisher(
+        # サイト共有のWordPressPublisherを取得
+        publisher = WordPressPublisher.for_site(
             site.url,
             site.wordpress_username,
             site.wordpress_app_password
         )
         
-        # 接続テスト
-        if not publisher.test_connection():
+        # 接続確認（直近の確認結果があれば再利用）
+        if not publisher.ensure_connection():
             return jsonify({
                 'success': False,
                 'error': 'WordPressに接続できません。認証情報を確認してください。'
@@ -730,52 +813,44 @@ def publish_article_to_wordpress(article_id):
                     logger.info(f"デフォルトカテゴリを使用: {cat['name']}")
                     break
         
-        # Unsplashから画像を取得
-        featured_media_id = None
-        unsplash = UnsplashFetcher()
-        
-        if unsplash.is_configured():
-            # 記事に適した画像を検索
-            photo = unsplash.get_photo_for_article(
-                title=article.get('title', ''),
-                keywords=article.get('tags', []),
-                content=article.get('content', '')[:500]  # 最初の500文字
-            )
+        # アイキャッチ画像（アウトボックスが画像アップロード前の段階の場合のみ実行）
+        def upload_featured_media():
+            # Unsplashから画像を取得
+            featured_media_id = None
+            unsplash = UnsplashFetcher()
             
-            if photo:
-                # WordPressにアップロード
-                featured_media_id = publisher.upload_media(
-                    image_url=photo['url'],
-                    alt_text=photo.get('alt_description', article.get('title', ''))
+            if unsplash.is_configured():
+                # 記事に適した画像を検索
+                photo = unsplash.get_photo_for_article(
+                    title=article.get('title', ''),
+                    keywords=article.get('tags', []),
+                    content=article.get('content', '')[:500]  # 最初の500文字
                 )
                 
-                # Unsplashダウンロード通知
-                unsplash.download_photo(photo['id'])
-                
-                logger.info(f"アイキャッチ画像設定: {photo['attribution']}")
-        
-        # 記事を投稿
-        result = publisher.publish_post(
-            title=article.get('title', 'Untitled'),
-            content=article.get('content', ''),
-            excerpt=article.get('excerpt', ''),
+                if photo:
+                    # WordPressにアップロード
+                    featured_media_id = publisher.upload_media(
+                        image_url=photo['url'],
+                        alt_text=photo.get('alt_description', article.get('title', ''))
+                    )
+                    
+                    # Unsplashダウンロード通知
+                    unsplash.download_photo(photo['id'])
+                    
+                    logger.info(f"アイキャッチ画像設定: {photo['attribution']}")
+            return featured_media_id
+        
+        # 記事を投稿（前回の試行で投稿済みなら再投稿しない）
+        result = publish_outbox.publish(
+            publisher,
+            article,
+            upload_media=upload_featured_media,
             categories=category_ids,
-            tags=article.get('tags', []),
-            featured_media_id=featured_media_id,
             status='publish'
         )
         
         if result:
-            # 記事のステータスを更新
-            articles_data['articles'][article_index]['status'] = '公開済み'
-            articles_data['articles'][article_index]['wordpress_url'] = result['link']
-            articles_data['articles'][article_index]['wordpress_id'] = result['id']
-            articles_data['articles'][article_index]['published_at'] = datetime.now().isoformat()
-            
-            # ファイルに保存
-            with open('data/generated_articles.json', 'w', encoding='utf-8') as f:
-                json.dump(articles_data, f, ensure_ascii=False, indent=2)
-            
+            # 記事のステータスはアウトボックスが更新済み
             return jsonify({
                 'success': True,
                 'url': result['link'],
@@ -812,29 +887,27 @@ def generate():
     
     # 生成された記事を読み込む
     try:
-        with open('data/generated_articles.json', 'r', encoding='utf-8') as f:
-            articles_data = json.load(f)
-            generated_articles = []
+        generated_articles = []
+        
+        for article in article_store.list_articles(limit=50):  # 最新50件
+            # 表示用にフォーマット
+            created_at = datetime.fromisoformat(article['created_at'])
+            status_map = {
+                '下書き': 'secondary',
+                '公開済み': 'success',
+                'エラー': 'danger'
+            }
             
-            for article in articles_data.get('articles', [])[:50]:  # 最新50件
-                # 表示用にフォーマット
-                created_at = datetime.fromisoformat(article['created_at'])
-                status_map = {
-                    '下書き': 'secondary',
-                    '公開済み': 'success',
-                    'エラー': 'danger'
-                }
-                
-                generated_articles.append({
-                    'id': article['id'],
-                    'created_at': created_at.strftime('%Y/%m/%d %H:%M'),
-                    'site_name': article.get('site_name', 'Unknown'),
-                    'title': article.get('title', 'Untitled'),
-                    'status': article.get('status', '下書き'),
-                    'status_class': status_map.get(article.get('status', '下書き'), 'secondary'),
-                    'content': article.get('content', ''),
-                    'tags': article.get('tags', [])
-                })
+            generated_articles.append({
+                'id': article['id'],
+                'created_at': created_at.strftime('%Y/%m/%d %H:%M'),
+                'site_name': article.get('site_name', 'Unknown'),
+                'title': article.get('title', 'Untitled'),
+                'status': article.get('status', '下書き'),
+                'status_class': status_map.get(article.get('status', '下書き'), 'secondary'),
+                'content': article.get('content', ''),
+                'tags': article.get('tags', [])
+            })
     except:
         generated_articles = []
     
@@ -850,51 +923,29 @@ def settings():
 @app.route('/reports')
 def reports():
     """レポート画面"""
-    # 実際のデータを集計
-    try:
-        with open('data/generated_articles.json', 'r', encoding='utf-8') as f:
-            articles_data = json.load(f)
-            articles = articles_data.get('articles', [])
-    except:
-        articles = []
+    # 集計テーブルから統計データを取得
+    totals = article_store.get_rollup_totals()
+    status_totals = article_store.get_status_totals()
     
-    # 統計データを集計
-    total_articles = len(articles)
-    published_articles = len([a for a in articles if a.get('status') == '公開済み'])
-    draft_articles = len([a for a in articles if a.get('status') == '下書き'])
+    total_articles = totals['generated']
+    published_articles = totals['published']
+    draft_articles = status_totals.get('下書き', 0)
     success_rate = (published_articles / total_articles * 100) if total_articles > 0 else 0
     
     # 平均文字数
-    total_chars = sum(len(a.get('content', '')) for a in articles)
-    avg_chars = total_chars // total_articles if total_articles > 0 else 0
+    avg_chars = totals['content_chars'] // total_articles if total_articles > 0 else 0
     
     # 月別集計（直近1年）
-    monthly_data = {}
-    one_year_ago = datetime.now() - timedelta(days=365)
-    
-    for article in articles:
-        created_date = datetime.fromisoformat(article.get('created_at', ''))
-        # 1年以内の記事のみ集計
-        if created_date >= one_year_ago:
-            month_key = created_date.strftime('%Y/%m')
-            if month_key not in monthly_data:
-                monthly_data[month_key] = 0
-            monthly_data[month_key] += 1
+    one_year_ago = (datetime.now() - timedelta(days=365)).date()
+    monthly_data = article_store.get_monthly_counts(one_year_ago.isoformat())
     
     # サイト別集計
-    site_data = {}
-    for article in articles:
-        site_name = article.get('site_name', 'Unknown')
-        if site_name not in site_data:
-            site_data[site_name] = 0
-        site_data[site_name] += 1
+    site_data = article_store.get_site_counts()
     
     # 時間帯別集計
     hourly_data = [0] * 6  # 0-4, 4-8, 8-12, 12-16, 16-20, 20-24
-    for article in articles:
-        created_date = datetime.fromisoformat(article.get('created_at', ''))
-        hour = created_date.hour
-        hourly_data[hour // 4] += 1
+    for hour, count in enumerate(article_store.get_hourly_counts()):
+        hourly_data[hour // 4] += count
     
     # API使用量（推定）
     api_tokens = total_articles * 3000  # 1記事あたり約3000トークン
@@ -1213,14 +1264,11 @@ def get_automation_status():
                 stats = json.load(f)
         
         # 今日の記事数を計算
-        today_count = 0
-        if os.path.exists('data/generated_articles.json'):
-            with open('data/generated_articles.json', 'r') as f:
-                articles = json.load(f).get('articles', [])
-            
-            today = datetime.now().date()
-            today_count = sum(1 for a in articles 
-                            if datetime.fromisoformat(a.get('created_at', '')).date() == today)
+        today = datetime.now().date()
+        today_count = article_store.get_rollup_totals(
+            day_from=today.isoformat(),
+            day_to=(today + timedelta(days=1)).isoformat()
+        )['generated']
         
         # 設定から最大記事数を取得
         max_articles = 10
@@ -1315,6 +1363,19 @@ def get_dashboard_performance():
         return jsonify({'success': False, 'error': str(e)}), 500
 
 
+@app.route('/api/rate-limits', methods=['GET'])
+def get_rate_limit_metrics():
+    """プロバイダー・WordPressホストごとのレート制限状況を取得（自動運用デーモンと共有）"""
+    try:
+        return jsonify({
+            'success': True,
+            'data': get_rate_limiter().get_metrics()
+        })
+    except Exception as e:
+        logger.error(f'レート制限状況取得エラー: {str(e)}')
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
 # import os
 
 # @app.route('/api/automation/start', methods=['POST'])
@@ -1562,6 +1623,14 @@ def get_image_generation_statistics():
                     count = sum(1 for s in prefs['selections'] if s['service'] == service)
                     stats['service_usage'][service] = round((count / total) * 100, 1)
         
+        # 画像キャッシュのヒット・ミス
+        from services.image_cache import get_image_cache
+        stats['cache'] = get_image_cache().get_cache_stats()
+        
+        # サービスごとの所要時間（p50・p95）と失敗率
+        from services.image_generation import ServiceLatencyTracker
+        stats['service_latency'] = ServiceLatencyTracker().summary()
+        
         return jsonify({'success': True, **stats})
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
@@ -1570,12 +1639,9 @@ def get_image_generation_statistics():
 def get_article(article_id):
     """記事詳細を取得"""
     try:
-        with open('data/generated_articles.json', 'r', encoding='utf-8') as f:
-            articles_data = json.load(f)
-            
-        for article in articles_data.get('articles', []):
-            if article['id'] == article_id:
-                return jsonify(article)
+        article = article_store.get_article(article_id)
+        if article:
+            return jsonify(article)
         
         return jsonify({'error': '記事が見つかりません'}), 404
     except:
@@ -1583,13 +1649,32 @@ def get_article(article_id):
 
 @app.route('/api/articles', methods=['GET'])
 def get_all_articles():
-    """全記事を取得"""
+    """
+    記事一覧を取得（カーソル方式のページング）
+    
+    本文などの大きなフィールドは fields= で指定した場合のみ返す
+    """
     try:
-        with open('data/generated_articles.json', 'r', encoding='utf-8') as f:
-            articles_data = json.load(f)
-        return jsonify(articles_data.get('articles', []))
-    except:
-        return jsonify([]), 200
+        articles, next_cursor = get_article_page(default_limit=20)
+        
+        # 総件数（ステータス指定がなければ集計テーブルから取得）
+        site_id = request.args.get('site_id') or None
+        status = request.args.get('status') or None
+        if status:
+            total = article_store.count_articles(site_id=site_id, status=status)
+        else:
+            total = article_store.get_rollup_totals(site_id=site_id)['generated']
+        
+        return jsonify({
+            'articles': articles,
+            'next_cursor': next_cursor,
+            'total': total
+        })
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"記事一覧取得エラー: {str(e)}")
+        return jsonify({'articles': [], 'next_cursor': None, 'total': 0}), 200
 
 @app.route('/api/wordpress/test-connection', methods=['GET'])
 def test_wordpress_connection():
@@ -1722,6 +1807,7 @@ def reset_system():
         import shutil
         
         # 1. 記事データを初期化
+        article_store.clear()
         with open('data/generated_articles.json', 'w', encoding='utf-8') as f:
             json.dump({'articles': []}, f, ensure_ascii=False, indent=2)
         
@@ -1782,7 +1868,8 @@ def reset_system():
                     'auto_selection_rules': {
                         'use_gemini_first': True,
                         'fallback_to_gpt': True,
-                        'fallback_to_unsplash': True
+                        'fallback_to_unsplash': True,
+                        'fallback_to_unsplash_when_pinned': False
                     },
                     'gemini_image': {
                         'enabled': True,
@@ -1818,7 +1905,8 @@ def reset_system():
                     f.write('')  # 空ファイルにする
         
         # 10. 生成された画像を削除
-        image_dirs = ['static/generated_images/gpt', 'static/generated_images/gemini']
+        image_dirs = ['static/generated_images/gpt', 'static/generated_images/gemini',
+                      'static/generated_images/variants']
         for image_dir in image_dirs:
             if os.path.exists(image_dir):
                 for file in os.listdir(image_dir):
@@ -1839,8 +1927,4 @@ def reset_system():
         return jsonify({'success': False, 'error': str(e)}), 500
 
 if __name__ == '__main__':
-    # 開発サーバーのタイムアウトを延長
-    import werkzeug.serving
-    werkzeug.serving.WSGIRequestHandler.timeout = 300  # 5分
-    
     app.run(debug=False, host='0.0.0.0', port=5000, threaded=True)
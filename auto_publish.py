@@ -4,13 +4,13 @@
 生成された下書き記事を自動的にWordPressに投稿
 """
 import logging
-import json
 import sys
 from modules.site_manager import SiteManager
 from modules.wordpress_publisher import WordPressPublisher
 from modules.category_selector import CategorySelector
 from modules.unsplash_fetcher import UnsplashFetcher
 from modules.auto_publisher import AutoPublisher
+from modules.article_store import ArticleStore
 
 # ロギング設定
 logging.basicConfig(
@@ -104,20 +104,16 @@ def main():
 def show_pending_articles():
     """下書き記事の一覧を表示"""
     try:
-        with open('data/generated_articles.json', 'r', encoding='utf-8') as f:
-            articles_data = json.load(f)
-        
         pending_count = 0
         print("\n下書き記事一覧:")
         print("-" * 80)
         
-        for article in articles_data.get('articles', []):
-            if article.get('status') == '下書き':
-                pending_count += 1
-                print(f"- {article.get('title', 'Untitled')}")
-                print(f"  サイト: {article.get('site_name', 'Unknown')}")
-                print(f"  作成日: {article.get('created_at', 'Unknown')}")
-                print()
+        for article in ArticleStore().list_articles(status='下書き'):
+            pending_count += 1
+            print(f"- {article.get('title', 'Untitled')}")
+            print(f"  サイト: {article.get('site_name', 'Unknown')}")
+            print(f"  作成日: {article.get('created_at', 'Unknown')}")
+            print()
         
         print(f"合計: {pending_count}件の下書き記事")
         return pending_count > 0
@@ -13,6 +13,7 @@ from modules.unsplash_fetcher import UnsplashFetcher
 from modules.autonomous_publisher import AutonomousPublisher
 from modules.article_generator_gpt import ArticleGeneratorGPT
 from modules.content_strategist_gpt import ContentStrategistGPT
+from modules.article_store import ArticleStore
 import openai
 
 # ロギング設定
@@ -234,17 +235,9 @@ def main():
                     'strategy': params['suggestion']
                 }
                 
-                # ファイルに保存
-                try:
-                    with open('data/generated_articles.json', 'r', encoding='utf-8') as f:
-                        data = json.load(f)
-                except:
-                    data = {'articles': []}
-                
-                data['articles'].insert(0, article)
-                
-                with open('data/generated_articles.json', 'w', encoding='utf-8') as f:
-                    json.dump(data, f, ensure_ascii=False, indent=2)
+                # 記事ストアに保存
+                article_store = ArticleStore()
+                article_store.add_article(article)
                 
                 # 自動投稿
                 if params['auto_publish'] and site.wordpress_username and site.wordpress_app_password:
@@ -270,13 +263,7 @@ def main():
                         article['published_at'] = datetime.now().isoformat()
                         
                         # 更新を保存
-                        for i, a in enumerate(data['articles']):
-                            if a['id'] == article['id']:
-                                data['articles'][i] = article
-                                break
-                        
-                        with open('data/generated_articles.json', 'w', encoding='utf-8') as f:
-                            json.dump(data, f, ensure_ascii=False, indent=2)
+                        article_store.update_article(article)
                     else:
                         print(f"❌ 投稿失敗: {result.get('error', 'Unknown')}")
                 
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Markdown → HTML 変換のベンチマーク
+旧来の置換ベースの変換と MarkdownRenderer（キャッシュなし・キャッシュあり）を比較する
+
+    python benchmark_markdown.py --chars 10000 --articles 20 --repeat 5
+"""
+import os
+import re
+import sys
+import time
+import random
+import argparse
+import statistics
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from modules.markdown_renderer import MarkdownRenderer
+
+
+def legacy_markdown_to_html(markdown_text: str) -> str:
+    """以前の WordPressPublisher._markdown_to_html（比較用）"""
+    html = markdown_text
+
+    # 見出しを変換
+    html = html.replace('### ', '<h3>')
+    html = html.replace('## ', '<h2>')
+    html = html.replace('# ', '<h1>')
+
+    # 改行を追加
+    lines = html.split('\n')
+    for i, line in enumerate(lines):
+        if line.startswith('<h'):
+            lines[i] = line + '</h' + line[2] + '>'
+        elif line.strip():
+            lines[i] = f'<p>{line}</p>'
+
+    # リンクを変換
+    html = '\n'.join(lines)
+    html = re.sub(r'\[([^\]]+)\]\(([^\)]+)\)', r'<a href="\2">\1</a>', html)
+
+    # 太字を変換
+    html = re.sub(r'\*\*([^\*]+)\*\*', r'<strong>\1</strong>', html)
+
+    return html
+
+
+SENTENCES = [
+    "ブログ運営では**継続的な更新**が検索順位に大きく影響します。",
+    "詳しくは[公式ガイド](https://example.com/guide)を参照してください。",
+    "初心者の方でも`設定画面`から簡単に変更できます。",
+    "ここで紹介する方法は*すぐに*試せるものばかりです。",
+    "実際に使ってみると、作業時間が半分ほどになりました。",
+    "注意点として、バックアップは必ず事前に取っておきましょう。",
+]
+
+
+def build_article(chars: int, rng: random.Random) -> str:
+    """生成記事に近い構成（見出し・段落・リスト・表）のMarkdownを作る"""
+    blocks = []
+    section = 0
+    while sum(len(b) for b in blocks) < chars:
+        section += 1
+        blocks.append(f"## ポイント{section}: 押さえておきたいこと")
+        blocks.append(''.join(rng.choice(SENTENCES) for _ in range(4)))
+        blocks.append(f"### 具体的な手順{section}")
+        blocks.append('\n'.join(f"- 手順{k}: {rng.choice(SENTENCES)}" for k in range(1, 5)))
+        blocks.append(''.join(rng.choice(SENTENCES) for _ in range(3)))
+        if section % 3 == 0:
+            blocks.append("| 項目 | 内容 | 評価 |\n|---|---|---|\n"
+                          + '\n'.join(f"| 項目{k} | {rng.choice(SENTENCES)} | ★{k} |" for k in range(1, 4)))
+    return '\n\n'.join(blocks)[:chars]
+
+
+def measure(func, articles, repeat: int) -> list:
+    """記事1件あたりの変換時間（ミリ秒）のリスト"""
+    timings = []
+    for _ in range(repeat):
+        for article in articles:
+            start = time.perf_counter()
+            func(article)
+            timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def main():
+    """メイン処理"""
+    parser = argparse.ArgumentParser(description='Markdown変換のベンチマーク')
+    parser.add_argument('--chars', type=int, default=10000, help='1記事の文字数')
+    parser.add_argument('--articles', type=int, default=20, help='記事数')
+    parser.add_argument('--repeat', type=int, default=5, help='繰り返し回数')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    articles = [build_article(args.chars, rng) for _ in range(args.articles)]
+
+    uncached = MarkdownRenderer(cache_size=0)
+    cached = MarkdownRenderer(cache_size=args.articles)
+
+    print(f"Markdown変換ベンチマーク: {args.chars}文字 × {args.articles}記事 × {args.repeat}回")
+    print("-" * 60)
+    print(f"{'方式':<20}{'平均(ms)':>10}{'p50':>10}{'p95':>10}")
+    for name, func in (('legacy', legacy_markdown_to_html),
+                       ('renderer', uncached.render),
+                       ('renderer+cache', cached.render)):
+        values = sorted(measure(func, articles, args.repeat))
+        p95 = values[min(len(values) - 1, int(len(values) * 0.95))]
+        print(f"{name:<20}{statistics.mean(values):>10.3f}{statistics.median(values):>10.3f}{p95:>10.3f}")
+
+    stats = cached.get_stats()
+    print(f"\nキャッシュ: ヒット {stats['hits']} / ミス {stats['misses']}")
+
+
+if __name__ == "__main__":
+    main()
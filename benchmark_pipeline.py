@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""
+記事生成パイプラインのベンチマーク
+生成 → 画像 → 投稿 の各段階の所要時間を計測する
+
+外部APIへの通信はトランスポート層で差し替える:
+    python benchmark_pipeline.py --mode synthetic --count 5 --latency 0.2
+    python benchmark_pipeline.py --mode record --cassette-dir data/cassettes/bench
+    python benchmark_pipeline.py --mode replay --cassette-dir data/cassettes/bench --latency 0.5
+"""
+import os
+import sys
+import time
+import argparse
+import statistics
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from modules import transport
+
+SYNTHETIC_SITE_URL = "https://wordpress.synthetic.invalid"
+
+
+def build_site_info(args):
+    """ベンチマーク用のサイト情報"""
+    if args.site_id:
+        from modules.site_manager import SiteManager
+        site = SiteManager().get_site_by_id(args.site_id)
+        if not site:
+            raise SystemExit(f"サイトが見つかりません: {args.site_id}")
+        return site.to_dict(), (site.url, site.wordpress_username, site.wordpress_app_password)
+
+    site_info = {
+        'site_id': 'benchmark',
+        'name': 'ベンチマークブログ',
+        'genre': 'テクノロジー',
+        'genre_details': 'AIと自動化',
+        'target_audience': '初心者',
+        'site_purpose': 'ベンチマーク',
+        'ai_model': args.model
+    }
+    return site_info, (SYNTHETIC_SITE_URL, 'benchmark', 'benchmark')
+
+
+def build_generator(args):
+    """記事生成器を初期化（合成・再生モードではダミーのAPIキーを使用）"""
+    api_key = 'benchmark' if args.mode in ('synthetic', 'replay') else None
+    if args.model == 'venice':
+        from modules.venice_generator import VeniceArticleGenerator
+        return VeniceArticleGenerator(api_key=api_key)
+    from modules.generator import ArticleGenerator
+    return ArticleGenerator(api_key=api_key)
+
+
+def build_image_client(args):
+    """画像生成クライアントを初期化"""
+    from services.image_generation import GeminiImageAPI, GPTImageAPI
+    if args.image_service == 'none':
+        return None
+    api_key = 'benchmark' if args.mode in ('synthetic', 'replay') else None
+    if not api_key:
+        from services.image_generation import get_image_manager
+        manager = get_image_manager()
+        client = manager.gemini_client if args.image_service == 'gemini_image' else manager.gpt_client
+        if not client:
+            raise SystemExit(f"{args.image_service} のAPIキーが設定されていません")
+        return client
+    return GeminiImageAPI(api_key) if args.image_service == 'gemini_image' else GPTImageAPI(api_key)
+
+
+def run_once(index, args, generator, image_client, site_info, wp_credentials):
+    """1記事分のパイプラインを実行して段階ごとの所要時間を返す"""
+    from modules.wordpress_publisher import WordPressPublisher
+    timings = {}
+
+    start = time.perf_counter()
+    first_title_at = []
+    article = generator.generate_article(
+        site_info=site_info,
+        keywords=[f'ベンチマーク{index}', '自動化'],
+        length=args.length,
+        tone='friendly',
+        stream=args.stream,
+        on_field=lambda tag, value: first_title_at.append(time.perf_counter()) if tag == 'title' else None
+    )
+    timings['generate'] = time.perf_counter() - start
+    if first_title_at:
+        timings['title_ready'] = first_title_at[0] - start
+
+    image_path = None
+    if image_client:
+        start = time.perf_counter()
+        image_path = image_client.generate(f"{article['title']}, photorealistic")
+        timings['image'] = time.perf_counter() - start
+
+    if not args.no_publish:
+        start = time.perf_counter()
+        publisher = WordPressPublisher.for_site(*wp_credentials)
+        if publisher.ensure_connection():
+            publisher.get_categories()
+            media_id = publisher.upload_media_from_file(image_path, article['title']) if image_path else None
+            publisher.publish_post(
+                title=article['title'],
+                content=article['content'],
+                excerpt=article.get('excerpt', ''),
+                tags=article.get('tags', [])[:3],
+                featured_media_id=media_id,
+                status='draft'
+            )
+        timings['publish'] = time.perf_counter() - start
+
+    timings['total'] = sum(v for k, v in timings.items() if k != 'title_ready')
+    return timings
+
+
+def summarize(results):
+    """段階ごとの統計を表示"""
+    print("\n段階別の所要時間（秒）")
+    print("-" * 60)
+    print(f"{'段階':<12}{'平均':>10}{'p50':>10}{'p95':>10}{'最大':>10}")
+    for stage in ('generate', 'title_ready', 'image', 'publish', 'total'):
+        values = sorted(r[stage] for r in results if stage in r)
+        if not values:
+            continue
+        p95 = values[min(len(values) - 1, int(len(values) * 0.95))]
+        print(f"{stage:<12}{statistics.mean(values):>10.3f}{statistics.median(values):>10.3f}"
+              f"{p95:>10.3f}{values[-1]:>10.3f}")
+
+
+def main():
+    """メイン処理"""
+    parser = argparse.ArgumentParser(description='記事生成パイプラインのベンチマーク')
+    parser.add_argument('--mode', choices=transport.MODES, default='synthetic')
+    parser.add_argument('--cassette-dir', default='data/cassettes/benchmark')
+    parser.add_argument('--latency', type=float, default=0.0, help='疑似レイテンシ（秒）')
+    parser.add_argument('--jitter', type=float, default=0.0, help='疑似レイテンシのばらつき（秒）')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--count', type=int, default=3, help='生成する記事数')
+    parser.add_argument('--length', type=int, default=3000, help='目標文字数')
+    parser.add_argument('--model', choices=['openai', 'venice'], default='openai')
+    parser.add_argument('--image-service', choices=['gemini_image', 'gpt_image', 'none'], default='gemini_image')
+    parser.add_argument('--site-id', help='実サイトで計測する場合のサイトID（record/liveのみ）')
+    parser.add_argument('--no-stream', dest='stream', action='store_false', help='ストリーミングを使わない')
+    parser.add_argument('--no-publish', action='store_true', help='WordPress投稿を省略')
+    args = parser.parse_args()
+
+    if args.mode != 'live':
+        transport.install(args.mode, cassette_dir=args.cassette_dir, latency=args.latency,
+                          jitter=args.jitter, seed=args.seed)
+
+    print("記事生成パイプライン ベンチマーク")
+    print("-" * 60)
+    print(f"モード: {args.mode} / 記事数: {args.count} / 文字数: {args.length} / "
+          f"モデル: {args.model} / 画像: {args.image_service}")
+
+    site_info, wp_credentials = build_site_info(args)
+    generator = build_generator(args)
+    image_client = build_image_client(args)
+
+    results = []
+    wall_start = time.perf_counter()
+    for i in range(args.count):
+        try:
+            timings = run_once(i, args, generator, image_client, site_info, wp_credentials)
+            results.append(timings)
+            print(f"[{i + 1}/{args.count}] total {timings['total']:.3f}s")
+        except Exception as e:
+            print(f"[{i + 1}/{args.count}] ❌ エラー: {str(e)}")
+    wall_time = time.perf_counter() - wall_start
+
+    if results:
+        summarize(results)
+    print(f"\n経過時間: {wall_time:.3f}秒 / 成功: {len(results)}/{args.count}")
+
+
+if __name__ == "__main__":
+    main()
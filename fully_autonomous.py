@@ -6,7 +6,6 @@
 import json
 import logging
 import time
-import schedule
 import os
 from datetime import datetime, timedelta
 from modules.site_manager import SiteManager
@@ -16,6 +15,12 @@ from modules.category_selector import CategorySelector
 from modules.unsplash_fetcher import UnsplashFetcher
 from modules.content_strategist import ContentStrategist
 from modules.autonomous_publisher import AutonomousPublisher
+from modules.article_store import ArticleStore
+from modules.transport import install_from_env as install_transport_from_env, get_httpx_client
+from modules.site_scheduler import SiteScheduler
+from modules.publish_planner import PublishPlanner, ReadyBuffer
+from modules.publish_outbox import PublishOutbox
+from services.image_pipeline import get_image_pipeline
 import anthropic
 import threading
 
@@ -35,15 +40,26 @@ class FullyAutonomousSystem:
     """完全自動運営システム"""
     
     def __init__(self):
+        # PAE_TRANSPORT=record/replay/synthetic で外部API通信を記録・再生・合成に切り替え
+        install_transport_from_env()
+        
         # 設定読み込み
         self.load_config()
+        self._stats_lock = threading.Lock()
         
         # マネージャー初期化
         self.site_manager = SiteManager()
+        self.article_store = ArticleStore()
+        self.publish_outbox = PublishOutbox(self.article_store)
         self.generator = ArticleGenerator()
         self.category_selector = CategorySelector()
         self.unsplash_fetcher = UnsplashFetcher()
         
+        # 投稿スロット計画と公開待ちバッファ
+        self.planner = PublishPlanner(self.config)
+        self.ready_buffer = ReadyBuffer(self.article_store)
+        self._next_slots = {}  # site_id → 次に投稿するスロット時刻
+        
         # Claude API初期化
         self.init_claude()
         
@@ -97,15 +113,20 @@ class FullyAutonomousSystem:
             if not claude_api_key:
                 raise Exception("Claude APIキーが設定されていません")
                 
-            self.claude_client = anthropic.Anthropic(api_key=claude_api_key)
-            self.content_strategist = ContentStrategist(self.claude_client)
+            # トランスポート層が有効な場合はClaude APIもそれを経由させる
+            self.claude_client = anthropic.Anthropic(api_key=claude_api_key, http_client=get_httpx_client())
+            self.content_strategist = ContentStrategist(
+                self.claude_client,
+                article_store=self.article_store,
+                model=api_keys.get('claude', {}).get('model')
+            )
             
         except Exception as e:
             logger.error(f"Claude API初期化エラー: {str(e)}")
             raise
     
     def run_cycle_for_site(self, site):
-        """1サイトの自動サイクルを実行"""
+        """1サイトの自動サイクルを実行（生成して即時投稿）"""
         logger.info(f"🤖 自動サイクル開始: {site.name}")
         
         try:
@@ -120,6 +141,42 @@ class FullyAutonomousSystem:
                 logger.info(f"本日の上限到達: {today_count}/{max_articles}")
                 return
             
+            article = self.generate_for_site(site)
+            if not article:
+                return
+            
+            # 4. 自動投稿
+            if self.config['global']['auto_publish'] and not self.config['global']['require_approval']:
+                if site.wordpress_username and site.wordpress_app_password:
+                    time.sleep(5)  # 少し待機
+                    
+                    result = self.publish_article(article, site)
+                    if result['success']:
+                        self.increment_stat('total_published')
+                        logger.info(f"自動投稿成功: {result['url']}")
+                    else:
+                        logger.error(f"投稿失敗: {result.get('error')}")
+            
+            # 統計更新
+            self.save_stats(update_last_run=True)
+            
+        except Exception as e:
+            logger.error(f"サイクルエラー: {str(e)}")
+            self.increment_stat('errors')
+    
+    def generate_for_site(self, site, ready=False):
+        """
+        テーマ決定から記事生成・保存までを実行
+        
+        Args:
+            site: サイト
+            ready: Trueの場合は公開待ちバッファに入れ、アイキャッチ画像も先に用意する
+            
+        Returns:
+            保存した記事（失敗時はNone）
+        """
+        image_prefetch = None
+        try:
             # 1. 過去記事分析
             past_analysis = self.content_strategist.analyze_published_articles(site.site_id)
             logger.info(f"過去記事分析完了: {past_analysis['total_articles']}件")
@@ -128,12 +185,12 @@ class FullyAutonomousSystem:
             wordpress_analysis = None
             if site.wordpress_username and site.wordpress_app_password:
                 try:
-                    publisher = WordPressPublisher(
+                    publisher = WordPressPublisher.for_site(
                         site.url,
                         site.wordpress_username,
                         site.wordpress_app_password
                     )
-                    if publisher.test_connection():
+                    if publisher.ensure_connection():
                         wordpress_analysis = self.content_strategist.analyze_wordpress_content(publisher)
                 except:
                     pass
@@ -147,13 +204,22 @@ class FullyAutonomousSystem:
             
             if not suggestions:
                 logger.error("テーマ生成失敗")
-                self.stats['errors'] += 1
+                self.increment_stat('errors')
                 return
             
             # 自動選択ロジック
             selected_topic = self.auto_select_topic(suggestions, past_analysis)
             logger.info(f"選択テーマ: {selected_topic['title']}")
             
+            # 投稿する記事はテーマ決定の時点でアイキャッチ画像の生成を始め、本文生成と並行させる
+            if site.image_service in ['auto', 'gemini_image', 'gpt_image'] and (ready or self.can_auto_publish(site)):
+                from services.image_generation import FeaturedImagePrefetch, discard_site_image
+                image_prefetch = FeaturedImagePrefetch(
+                    lambda title, keywords: self.generate_featured_image({'title': title, 'tags': keywords}, site),
+                    discard=discard_site_image
+                )
+                image_prefetch.start(selected_topic['title'], selected_topic.get('keywords', []))
+            
             # 3. 記事生成
             site_info = site.to_dict()
             site_info['strategic_intent'] = selected_topic.get('reason', '')
@@ -168,11 +234,13 @@ class FullyAutonomousSystem:
             
             if not article:
                 logger.error("記事生成失敗")
-                self.stats['errors'] += 1
+                self.increment_stat('errors')
+                if image_prefetch:
+                    image_prefetch.cancel()
                 return
             
             # メタデータ追加
-            article['id'] = f"auto_{datetime.now().strftime('%Y%m%d%H%M%S')}"
+            article['id'] = f"auto_{datetime.now().strftime('%Y%m%d%H%M%S')}_{site.site_id}"
             article['site_id'] = site.site_id
             article['site_name'] = site.name
             article['status'] = '下書き'
@@ -181,33 +249,32 @@ class FullyAutonomousSystem:
                 **article.get('metadata', {}),
                 'fully_autonomous': True,
                 'strategy': selected_topic,
-                'cycle_number': self.stats['total_generated'] + 1
+                'cycle_number': self.get_stat('total_generated') + 1
             }
             
+            # 並行して生成したアイキャッチ画像（公開待ち記事はスロット時刻に送信するだけになる）
+            if image_prefetch:
+                image_path = image_prefetch.result(article['title'], article['tags'])
+                if image_path:
+                    article['metadata']['featured_image_path'] = image_path
+            
             # 記事保存
-            self.save_article(article)
-            self.stats['total_generated'] += 1
+            if ready:
+                self.ready_buffer.add(article)
+                self.update_automation_stats('generated')
+            else:
+                self.save_article(article)
+            self.increment_stat('total_generated')
             logger.info(f"記事生成完了: {article['title']}")
-            
-            # 4. 自動投稿
-            if self.config['global']['auto_publish'] and not self.config['global']['require_approval']:
-                if site.wordpress_username and site.wordpress_app_password:
-                    time.sleep(5)  # 少し待機
-                    
-                    result = self.publish_article(article, site)
-                    if result['success']:
-                        self.stats['total_published'] += 1
-                        logger.info(f"自動投稿成功: {result['url']}")
-                    else:
-                        logger.error(f"投稿失敗: {result.get('error')}")
-            
-            # 統計更新
-            self.stats['last_run'] = datetime.now().isoformat()
-            self.save_stats()
+            return article
             
         except Exception as e:
-            logger.error(f"サイクルエラー: {str(e)}")
-            self.stats['errors'] += 1
+            logger.error(f"記事生成エラー: {str(e)}")
+            self.increment_stat('errors')
+            # テーマ決定時に始めたアイキャッチ画像の生成は不要になる
+            if image_prefetch:
+                image_prefetch.cancel()
+            return None
     
     def auto_select_topic(self, suggestions, past_analysis):
         """AIの提案から自動で最適なものを選択"""
@@ -245,16 +312,26 @@ class FullyAutonomousSystem:
         
         return len(intersection) / len(union)
     
+    def generate_featured_image(self, article, site):
+        """
+        サイト設定に従ってアイキャッチ画像を生成
+        
+        Returns:
+            生成した画像のパス（生成しない・失敗時はNone）
+        """
+        from services.image_generation import generate_site_image
+        return generate_site_image(site, article['title'], article['tags'])
+    
     def publish_article(self, article, site):
         """記事を投稿"""
         try:
-            publisher = WordPressPublisher(
+            publisher = WordPressPublisher.for_site(
                 site.url,
                 site.wordpress_username,
                 site.wordpress_app_password
             )
             
-            if not publisher.test_connection():
+            if not publisher.ensure_connection():
                 return {'success': False, 'error': 'WordPress接続失敗'}
             
             # カテゴリ選択
@@ -271,90 +348,52 @@ class FullyAutonomousSystem:
                 if selected_category_id:
                     category_ids.append(selected_category_id)
             
-            # アイキャッチ画像
-            featured_media_id = None
-            
-            # サイト設定に基づいて画像処理を決定
-            logger.info(f"画像サービス設定: {site.image_service}")
-            if site.image_service != 'none':
-                # 新しい画像生成システムを使用
-                if site.image_service in ['auto', 'gemini_image', 'gpt_image']:
-                    try:
-                        logger.info("画像生成システムを初期化中...")
-                        from services.image_generation import ImageGenerationManager
-                        image_manager = ImageGenerationManager()
-                        
-                        # サイト設定に基づいてプロンプトを調整
-                        if image_manager.config.get('image_generation', {}).get('enabled', False):
-                            logger.info("画像生成が有効です")
-                            # ユーザー選択サービスまたは自動選択
-                            user_preference = None if site.image_service == 'auto' else site.image_service
-                            logger.info(f"画像生成サービス: {user_preference or 'auto'}")
-                            
-                            # プロンプト生成時にサイト設定を反映
-                            image_manager.prompt_generator.default_style = site.image_style
-                            image_manager.prompt_generator.quality = site.image_quality
-                            image_manager.prompt_generator.additional_instructions = site.image_instructions
-                            image_manager.prompt_generator.tone = site.image_tone
-                            image_manager.prompt_generator.avoid_terms = site.image_avoid_terms.split(',')
-                            
-                            image_path = image_manager.generate_article_image(
-                                article_title=article['title'],
+            # アイキャッチ画像（アウトボックスが画像アップロード前の段階の場合のみ実行）
+            def upload_featured_media():
+                featured_media_id = None
+                
+                # サイト設定に基づいて画像処理を決定
+                logger.info(f"画像サービス設定: {site.image_service}")
+                if site.image_service != 'none':
+                    # 新しい画像生成システムを使用（公開待ち記事は生成済みの画像を使う）
+                    if site.image_service in ['auto', 'gemini_image', 'gpt_image']:
+                        image_path = article.get('metadata', {}).get('featured_image_path')
+                        if not (image_path and os.path.exists(image_path)):
+                            image_path = self.generate_featured_image(article, site)
+                        if image_path:
+                            # 生成された画像を最適化したバリエーションでアップロード
+                            featured_media_id = publisher.upload_media_from_file(
+                                file_path=get_image_pipeline().prepare_upload(image_path),
+                                alt_text=article['title']
+                            )
+                            logger.info(f"生成画像をアップロード: {image_path}, ID: {featured_media_id}")
+                    
+                    # Unsplashを使用
+                    if site.image_service == 'unsplash' or (not featured_media_id and site.image_service != 'none'):
+                        if self.unsplash_fetcher.is_configured():
+                            photo = self.unsplash_fetcher.get_photo_for_article(
+                                title=article['title'],
                                 keywords=article['tags'],
-                                genre=site.genre,
-                                user_preference=user_preference
+                                content=article['content'][:500]
                             )
-                            
-                            if image_path and os.path.exists(image_path):
-                                logger.info(f"画像生成成功: {image_path}")
-                                # 生成された画像をアップロード
-                                featured_media_id = publisher.upload_media_from_file(
-                                    file_path=image_path,
-                                    alt_text=article['title']
+                            if photo:
+                                featured_media_id = publisher.upload_media(
+                                    image_url=photo['url'],
+                                    alt_text=photo.get('alt_description', article['title'])
                                 )
-                                logger.info(f"生成画像をアップロード: {image_path}, ID: {featured_media_id}")
-                            else:
-                                logger.warning("画像生成に失敗しました")
-                        else:
-                            logger.warning("画像生成が無効になっています")
-                    except Exception as e:
-                        logger.error(f"画像生成エラー: {str(e)}")
-                        import traceback
-                        logger.error(traceback.format_exc())
-                
-                # Unsplashを使用
-                if site.image_service == 'unsplash' or (not featured_media_id and site.image_service != 'none'):
-                    if self.unsplash_fetcher.is_configured():
-                        photo = self.unsplash_fetcher.get_photo_for_article(
-                            title=article['title'],
-                            keywords=article['tags'],
-                            content=article['content'][:500]
-                        )
-                        if photo:
-                            featured_media_id = publisher.upload_media(
-                                image_url=photo['url'],
-                                alt_text=photo.get('alt_description', article['title'])
-                            )
+                return featured_media_id
             
-            # 投稿
-            result = publisher.publish_post(
-                title=article['title'],
-                content=article['content'],
-                excerpt=article.get('excerpt', ''),
+            # 投稿（前回の試行で投稿済みなら再投稿しない）
+            result = self.publish_outbox.publish(
+                publisher,
+                article,
+                upload_media=upload_featured_media,
                 categories=category_ids,
-                tags=article['tags'],
-                featured_media_id=featured_media_id,
                 status='publish'
             )
             
             if result:
-                # ステータス更新
-                article['status'] = '公開済み'
-                article['wordpress_url'] = result['link']
-                article['wordpress_id'] = result['id']
-                article['published_at'] = datetime.now().isoformat()
-                self.update_article(article)
-                
+                # 記事のステータスはアウトボックスが更新済み
                 # 統計情報を更新
                 self.update_automation_stats('published')
                 
@@ -363,46 +402,32 @@ class FullyAutonomousSystem:
                     'url': result['link'],
                     'wordpress_id': result['id']
                 }
+            
+            return {'success': False, 'error': '投稿失敗'}
                 
         except Exception as e:
             logger.error(f"投稿エラー: {str(e)}")
             # エラー統計を更新
             self.update_automation_stats('error')
             
-        return {'success': False, 'error': str(e)}
+            return {'success': False, 'error': str(e)}
     
     def get_today_article_count(self, site_id):
         """今日の記事数を取得"""
         try:
-            with open('data/generated_articles.json', 'r', encoding='utf-8') as f:
-                data = json.load(f)
-            
             today = datetime.now().date()
-            count = 0
-            
-            for article in data.get('articles', []):
-                if article.get('site_id') == site_id:
-                    created_date = datetime.fromisoformat(article['created_at']).date()
-                    if created_date == today:
-                        count += 1
-            
-            return count
-            
-        except:
+            return self.article_store.get_rollup_totals(
+                day_from=today.isoformat(),
+                day_to=(today + timedelta(days=1)).isoformat(),
+                site_id=site_id
+            )['generated']
+        except Exception as e:
+            logger.error(f"記事数取得エラー: {str(e)}")
             return 0
     
     def save_article(self, article):
         """記事を保存"""
-        try:
-            with open('data/generated_articles.json', 'r', encoding='utf-8') as f:
-                data = json.load(f)
-        except:
-            data = {'articles': []}
-        
-        data['articles'].insert(0, article)
-        
-        with open('data/generated_articles.json', 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+        self.article_store.add_article(article)
         
         # 統計情報を更新
         self.update_automation_stats('generated')
@@ -410,21 +435,17 @@ class FullyAutonomousSystem:
     def update_article(self, article):
         """記事を更新"""
         try:
-            with open('data/generated_articles.json', 'r', encoding='utf-8') as f:
-                data = json.load(f)
-            
-            for i, a in enumerate(data['articles']):
-                if a['id'] == article['id']:
-                    data['articles'][i] = article
-                    break
-            
-            with open('data/generated_articles.json', 'w', encoding='utf-8') as f:
-                json.dump(data, f, ensure_ascii=False, indent=2)
-        except:
-            pass
+            self.article_store.update_article(article)
+        except Exception as e:
+            logger.error(f"記事更新エラー: {str(e)}")
     
     def update_automation_stats(self, stat_type):
         """自動化統計を更新"""
+        # 複数サイトのサイクルが並行して実行されるため、ファイル更新は排他制御する
+        with self._stats_lock:
+            self._update_automation_stats(stat_type)
+    
+    def _update_automation_stats(self, stat_type):
         try:
             # 既存の統計を読み込み
             try:
@@ -455,28 +476,132 @@ class FullyAutonomousSystem:
         except Exception as e:
             logger.error(f"統計更新エラー: {str(e)}")
     
-    def save_stats(self):
-        """統計を保存"""
-        with open('data/automation_stats.json', 'w', encoding='utf-8') as f:
-            json.dump(self.stats, f, ensure_ascii=False, indent=2)
+    def increment_stat(self, name):
+        """メモリ上の統計を加算（複数サイトのサイクルが並行して更新するため排他制御する）"""
+        with self._stats_lock:
+            self.stats[name] += 1
+    
+    def get_stat(self, name):
+        """メモリ上の統計を取得"""
+        with self._stats_lock:
+            return self.stats[name]
+    
+    def save_stats(self, update_last_run=False):
+        """統計を保存（update_last_run がTrueなら最終実行時刻も更新する）"""
+        with self._stats_lock:
+            if update_last_run:
+                self.stats['last_run'] = datetime.now().isoformat()
+            with open('data/automation_stats.json', 'w', encoding='utf-8') as f:
+                json.dump(self.stats, f, ensure_ascii=False, indent=2)
+    
+    def get_enabled_site_ids(self):
+        """自動化が有効なサイトIDの一覧"""
+        # サイトの追加・削除を反映するため毎回読み直す
+        self.site_manager = SiteManager()
+        return [
+            site.site_id for site in self.site_manager.get_all_sites()
+            if self.config['sites'].get(site.site_id, {}).get('enabled', True)
+        ]
+    
+    def get_site_interval(self, site_id):
+        """サイトごとの実行間隔"""
+        site_config = self.config['sites'].get(site_id, {})
+        minutes = site_config.get('min_interval_minutes', self.config['global']['min_interval_minutes'])
+        return timedelta(minutes=minutes)
     
     def run_all_sites(self):
-        """全サイトの自動実行"""
+        """全サイトを1サイクルずつ実行（手動実行用、サイト間で待機しない）"""
         if not self.is_operation_hours():
             logger.info("営業時間外です")
             return
         
-        sites = self.site_manager.get_all_sites()
-        
-        for site in sites:
-            # サイトごとの自動化設定確認
-            site_config = self.config['sites'].get(site.site_id, {})
-            if site_config.get('enabled', True):
+        for site_id in self.get_enabled_site_ids():
+            site = self.site_manager.get_site_by_id(site_id)
+            if site:
                 self.run_cycle_for_site(site)
-                
-                # インターバル
-                interval = self.config['global']['min_interval_minutes']
-                time.sleep(interval * 60)
+    
+    def run_scheduled_site(self, site_id):
+        """
+        スケジューラーから呼ばれる1サイトのサイクル
+        
+        Returns:
+            次回実行時刻（Noneの場合は通常の間隔で再実行）
+        """
+        site = self.site_manager.get_site_by_id(site_id)
+        if site and self.planner.is_enabled(site_id) and self.can_auto_publish(site):
+            return self.run_slot_cycle(site)
+        
+        if not self.is_operation_hours():
+            next_open = self.next_operation_start()
+            logger.info(f"営業時間外のため {next_open.strftime('%m/%d %H:%M')} まで待機: {site_id}")
+            return next_open
+        
+        if site:
+            self.run_cycle_for_site(site)
+        return None
+    
+    def can_auto_publish(self, site):
+        """承認なしで自動投稿できるサイトか"""
+        return (self.config['global']['auto_publish']
+                and not self.config['global']['require_approval']
+                and site.wordpress_username and site.wordpress_app_password)
+    
+    def run_slot_cycle(self, site):
+        """
+        スマートスケジューリングのサイクル
+        
+        スロット時刻になっていれば公開待ちバッファから投稿し、
+        ピーク帯でなければバッファが埋まるまで記事を先に生成しておく
+        
+        Returns:
+            次回実行時刻
+        """
+        site_id = site.site_id
+        now = datetime.now()
+        
+        due_slot = self._next_slots.get(site_id)
+        if due_slot and due_slot <= now:
+            self.publish_from_buffer(site)
+            now = datetime.now()
+        
+        next_slot = self.planner.next_slot(site_id, now)
+        self._next_slots[site_id] = next_slot
+        
+        target = self.planner.buffer_size(site_id)
+        if (self.ready_buffer.size(site_id) < target and self.is_operation_hours()
+                and self.planner.can_generate(site_id, now, next_slot)):
+            logger.info(f"公開待ちバッファを補充: {site.name} ({self.ready_buffer.size(site_id)}/{target})")
+            self.generate_for_site(site, ready=True)
+            self.save_stats()
+            now = datetime.now()
+            # まだ足りなければ間隔を空けて再度補充（スロット時刻は優先）
+            if self.ready_buffer.size(site_id) < target:
+                retry_at = now + self.get_site_interval(site_id)
+                if next_slot is None or retry_at < next_slot:
+                    return retry_at
+        
+        if next_slot is None:
+            return now + timedelta(days=1)
+        logger.info(f"次の投稿スロット ({site.name}): {next_slot.strftime('%m/%d %H:%M')}")
+        return next_slot
+    
+    def publish_from_buffer(self, site):
+        """公開待ち記事を1件投稿（バッファが空の場合はその場で生成して投稿）"""
+        article = self.ready_buffer.peek(site.site_id)
+        if not article:
+            logger.warning(f"公開待ち記事がないため生成して投稿します: {site.name}")
+            self.run_cycle_for_site(site)
+            return
+        
+        result = self.publish_article(article, site)
+        if result['success']:
+            self.increment_stat('total_published')
+            logger.info(f"スロット投稿成功: {result['url']}")
+        else:
+            # 同じ記事で投稿失敗を繰り返さないようバッファから外す
+            logger.error(f"スロット投稿失敗: {result.get('error')}")
+            self.ready_buffer.release(article)
+        self.save_stats(update_last_run=True)
     
     def is_operation_hours(self):
         """営業時間内かチェック"""
@@ -486,21 +611,39 @@ class FullyAutonomousSystem:
         
         return start_hour <= now.hour < end_hour
     
+    def next_operation_start(self):
+        """次の営業開始時刻"""
+        now = datetime.now()
+        start_hour = self.config['global']['operation_hours']['start']
+        next_open = now.replace(hour=start_hour, minute=0, second=0, microsecond=0)
+        if next_open <= now:
+            next_open += timedelta(days=1)
+        return next_open
+    
     def start_scheduler(self):
         """スケジューラーを開始"""
-        # 定期実行設定
-        schedule.every(self.config['global']['min_interval_minutes']).minutes.do(self.run_all_sites)
+        # サイトごとに次回実行時刻を持ち、期限の来たサイトを最大K件まで並行実行する
+        max_concurrent = self.config['global'].get('concurrency', {}).get('max_concurrent_sites', 2)
+        self.scheduler = SiteScheduler(
+            run_job=self.run_scheduled_site,
+            interval_for=self.get_site_interval,
+            max_concurrent=max_concurrent,
+            list_site_ids=self.get_enabled_site_ids
+        )
         
         logger.info("🤖 完全自動運営システム起動")
         logger.info(f"設定: {self.config['global']}")
         
-        # 初回実行
-        self.run_all_sites()
+        if not self.config['enabled']:
+            logger.info("自動化が無効になっています")
+            return
         
-        # スケジューラー実行
-        while self.config['enabled']:
-            schedule.run_pending()
-            time.sleep(60)  # 1分ごとにチェック
+        # スケジューラー実行（次の予定時刻まで待機し、初回は全サイトを即時実行）
+        try:
+            self.scheduler.run_forever()
+        except KeyboardInterrupt:
+            self.scheduler.stop()
+            raise
 
 
 def main():
@@ -0,0 +1,26 @@
+#!/usr/bin/env python3
+"""
+記事データ移行スクリプト
+data/generated_articles.json の記事を記事ストア（SQLite）に取り込む
+"""
+import sys
+from modules.article_store import ArticleStore
+
+
+def main():
+    """メイン処理"""
+    json_path = sys.argv[1] if len(sys.argv) > 1 else 'data/generated_articles.json'
+
+    print("記事データ移行")
+    print("-" * 50)
+
+    store = ArticleStore()
+    imported = store.import_from_json(json_path)
+
+    print(f"移行元: {json_path}")
+    print(f"取り込んだ記事数: {imported}件（既存IDはスキップ）")
+    print(f"ストア内の総記事数: {store.count_articles()}件")
+
+
+if __name__ == "__main__":
+    main()
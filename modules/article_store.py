@@ -0,0 +1,557 @@
+"""
+記事ストアモジュール
+生成記事をSQLite（WALモード）で管理し、JSONファイル全体の読み書きを置き換える
+サイト別・日別・時間別の集計（ロールアップ）も保存時に差分更新する
+"""
+import json
+import os
+import sqlite3
+import threading
+import logging
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class ArticleStore:
+    """生成記事の保存・検索を管理するクラス"""
+
+    # 検索・集計に使う列（本文を含む記事全体はdata列にJSONで保存）
+    INDEXED_FIELDS = ('site_id', 'site_name', 'title', 'status',
+                      'created_at', 'published_at', 'wordpress_url')
+
+    def __init__(self, db_path: str = "data/articles.db",
+                 legacy_json_path: str = "data/generated_articles.json"):
+        """
+        初期化
+
+        Args:
+            db_path: SQLiteデータベースのパス
+            legacy_json_path: 移行元の記事JSONファイルのパス
+        """
+        self.db_path = db_path
+        self.legacy_json_path = legacy_json_path
+        self._local = threading.local()
+
+        os.makedirs(os.path.dirname(self.db_path) or '.', exist_ok=True)
+        self._init_db()
+
+        # 初回のみ既存のJSONファイルを取り込む
+        if not self._get_meta('legacy_imported'):
+            self.import_from_json(self.legacy_json_path)
+
+        # 集計テーブル導入前のデータベースは集計を作り直す
+        if not self._get_meta('rollups_built'):
+            self.rebuild_rollups()
+
+    def _get_connection(self) -> sqlite3.Connection:
+        """スレッドごとの接続を取得"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def _write_transaction(self):
+        """
+        書き込みロックを取得したトランザクション
+
+        旧データの読み取りから集計の更新・保存までを、他のスレッド・プロセスの書き込みと排他にする
+        """
+        conn = self._get_connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield conn
+        except Exception:
+            conn.rollback()
+            raise
+        conn.commit()
+
+    def _init_db(self):
+        """テーブルとインデックスを作成"""
+        conn = self._get_connection()
+        with conn:
+            conn.executescript('''
+                CREATE TABLE IF NOT EXISTS articles (
+                    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                    id TEXT NOT NULL UNIQUE,
+                    site_id TEXT,
+                    site_name TEXT,
+                    title TEXT,
+                    status TEXT,
+                    created_at TEXT,
+                    published_at TEXT,
+                    wordpress_url TEXT,
+                    content_length INTEGER DEFAULT 0,
+                    data TEXT NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS idx_articles_site_created
+                    ON articles(site_id, created_at);
+                CREATE INDEX IF NOT EXISTS idx_articles_status_created
+                    ON articles(status, created_at);
+                CREATE INDEX IF NOT EXISTS idx_articles_created
+                    ON articles(created_at);
+                CREATE TABLE IF NOT EXISTS store_meta (
+                    key TEXT PRIMARY KEY,
+                    value TEXT
+                );
+                CREATE TABLE IF NOT EXISTS article_rollups (
+                    site_id TEXT NOT NULL,
+                    day TEXT NOT NULL,
+                    hour INTEGER NOT NULL,
+                    site_name TEXT,
+                    generated INTEGER NOT NULL DEFAULT 0,
+                    published INTEGER NOT NULL DEFAULT 0,
+                    content_chars INTEGER NOT NULL DEFAULT 0,
+                    PRIMARY KEY (site_id, day, hour)
+                );
+                CREATE INDEX IF NOT EXISTS idx_rollups_day
+                    ON article_rollups(day);
+                CREATE TABLE IF NOT EXISTS article_status_totals (
+                    status TEXT PRIMARY KEY,
+                    count INTEGER NOT NULL DEFAULT 0
+                );
+            ''')
+
+    def _get_meta(self, key: str) -> Optional[str]:
+        row = self._get_connection().execute(
+            'SELECT value FROM store_meta WHERE key = ?', (key,)
+        ).fetchone()
+        return row['value'] if row else None
+
+    def _set_meta(self, conn: sqlite3.Connection, key: str, value: str):
+        conn.execute(
+            'INSERT INTO store_meta (key, value) VALUES (?, ?) '
+            'ON CONFLICT(key) DO UPDATE SET value = excluded.value',
+            (key, value)
+        )
+
+    def _to_row(self, article: Dict) -> tuple:
+        """記事データをINSERT用のタプルに変換"""
+        return (
+            article['id'],
+            *(article.get(field) for field in self.INDEXED_FIELDS),
+            len(article.get('content', '') or ''),
+            json.dumps(article, ensure_ascii=False)
+        )
+
+    def _split_created_at(self, created_at: Optional[str]) -> tuple:
+        """作成日時を集計キー（日付, 時）に分解"""
+        try:
+            created = datetime.fromisoformat(created_at)
+            return created.date().isoformat(), created.hour
+        except (TypeError, ValueError):
+            return '', 0
+
+    def _apply_rollup(self, conn: sqlite3.Connection, site_id: Optional[str],
+                      site_name: Optional[str], status: Optional[str],
+                      created_at: Optional[str], content_length: int, sign: int):
+        """1記事分の寄与を集計テーブルに加算（sign=-1で減算）"""
+        day, hour = self._split_created_at(created_at)
+        published = 1 if status == '公開済み' else 0
+        conn.execute(
+            '''
+            INSERT INTO article_rollups (site_id, day, hour, site_name, generated, published, content_chars)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(site_id, day, hour) DO UPDATE SET
+                site_name = COALESCE(excluded.site_name, site_name),
+                generated = generated + excluded.generated,
+                published = published + excluded.published,
+                content_chars = content_chars + excluded.content_chars
+            ''',
+            (site_id or '', day, hour, site_name, sign, sign * published, sign * (content_length or 0))
+        )
+        conn.execute(
+            '''
+            INSERT INTO article_status_totals (status, count) VALUES (?, ?)
+            ON CONFLICT(status) DO UPDATE SET count = count + excluded.count
+            ''',
+            (status or '', sign)
+        )
+
+    def _upsert(self, conn: sqlite3.Connection, article: Dict):
+        old = conn.execute(
+            'SELECT site_id, site_name, status, created_at, content_length FROM articles WHERE id = ?',
+            (article['id'],)
+        ).fetchone()
+        if old:
+            self._apply_rollup(conn, old['site_id'], old['site_name'], old['status'],
+                               old['created_at'], old['content_length'], -1)
+        self._apply_rollup(conn, article.get('site_id'), article.get('site_name'),
+                           article.get('status'), article.get('created_at'),
+                           len(article.get('content', '') or ''), 1)
+        conn.execute(
+            '''
+            INSERT INTO articles (id, site_id, site_name, title, status, created_at,
+                                  published_at, wordpress_url, content_length, data)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(id) DO UPDATE SET
+                site_id = excluded.site_id,
+                site_name = excluded.site_name,
+                title = excluded.title,
+                status = excluded.status,
+                created_at = excluded.created_at,
+                published_at = excluded.published_at,
+                wordpress_url = excluded.wordpress_url,
+                content_length = excluded.content_length,
+                data = excluded.data
+            ''',
+            self._to_row(article)
+        )
+
+    def add_article(self, article: Dict):
+        """
+        記事を保存（同じIDの記事があれば上書き）
+
+        Args:
+            article: 記事データ（idは必須）
+        """
+        with self._write_transaction() as conn:
+            self._upsert(conn, article)
+
+    def update_article(self, article: Dict) -> bool:
+        """
+        既存の記事を更新
+
+        Args:
+            article: 記事データ
+
+        Returns:
+            更新した場合True
+        """
+        with self._write_transaction() as conn:
+            exists = conn.execute(
+                'SELECT 1 FROM articles WHERE id = ?', (article['id'],)
+            ).fetchone()
+            if not exists:
+                return False
+            self._upsert(conn, article)
+        return True
+
+    def update_fields(self, article_id: str, **fields) -> Optional[Dict]:
+        """
+        記事の一部のフィールドを更新
+
+        Args:
+            article_id: 記事ID
+            **fields: 更新するフィールド
+
+        Returns:
+            更新後の記事データ、記事がなければNone
+        """
+        with self._write_transaction() as conn:
+            row = conn.execute(
+                'SELECT data FROM articles WHERE id = ?', (article_id,)
+            ).fetchone()
+            if not row:
+                return None
+            article = json.loads(row['data'])
+            article.update(fields)
+            self._upsert(conn, article)
+        return article
+
+    def get_article(self, article_id: str) -> Optional[Dict]:
+        """IDで記事を取得"""
+        row = self._get_connection().execute(
+            'SELECT data FROM articles WHERE id = ?', (article_id,)
+        ).fetchone()
+        return json.loads(row['data']) if row else None
+
+    def _build_where(self, site_id: Optional[str] = None,
+                     status: Optional[str] = None,
+                     created_from: Optional[str] = None,
+                     created_to: Optional[str] = None) -> tuple:
+        """検索条件のWHERE句を組み立てる"""
+        clauses = []
+        params = []
+        if site_id:
+            clauses.append('site_id = ?')
+            params.append(site_id)
+        if status:
+            clauses.append('status = ?')
+            params.append(status)
+        if created_from:
+            clauses.append('created_at >= ?')
+            params.append(created_from)
+        if created_to:
+            clauses.append('created_at < ?')
+            params.append(created_to)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+        return where, params
+
+    def list_articles(self,
+                      site_id: Optional[str] = None,
+                      status: Optional[str] = None,
+                      limit: Optional[int] = None,
+                      offset: int = 0,
+                      created_from: Optional[str] = None,
+                      created_to: Optional[str] = None,
+                      oldest_first: bool = False) -> List[Dict]:
+        """
+        記事を新しい順に取得
+
+        Args:
+            site_id: サイトIDで絞り込み
+            status: ステータスで絞り込み
+            limit: 最大件数（Noneで全件）
+            offset: 読み飛ばす件数
+            created_from: この日時以降に作成された記事（ISO形式）
+            created_to: この日時より前に作成された記事（ISO形式）
+            oldest_first: Trueの場合は古い順
+
+        Returns:
+            記事データのリスト
+        """
+        where, params = self._build_where(site_id, status, created_from, created_to)
+        order = 'ASC' if oldest_first else 'DESC'
+        sql = f'SELECT data FROM articles {where} ORDER BY created_at {order}, seq {order}'
+        if limit is not None:
+            sql += ' LIMIT ? OFFSET ?'
+            params.extend([int(limit), int(offset)])
+        rows = self._get_connection().execute(sql, params).fetchall()
+        return [json.loads(row['data']) for row in rows]
+
+    def list_articles_page(self,
+                           site_id: Optional[str] = None,
+                           status: Optional[str] = None,
+                           limit: int = 20,
+                           after: Optional[Tuple[str, str]] = None,
+                           fields: Optional[Sequence[str]] = None) -> Tuple[List[Dict], Optional[Tuple[str, str]]]:
+        """
+        記事を新しい順にページ単位で取得（created_at + id のカーソル方式）
+
+        Args:
+            site_id: サイトIDで絞り込み
+            status: ステータスで絞り込み
+            limit: 1ページの件数
+            after: 前ページ最後の記事の (created_at, id)
+            fields: 返すフィールド（Noneの場合は本文を除く一覧用フィールド）
+
+        Returns:
+            (記事データのリスト, 次ページのカーソル。最終ページならNone)
+        """
+        fields = list(fields) if fields else ['id', *self.INDEXED_FIELDS]
+        column_fields = ['id', *self.INDEXED_FIELDS]
+        # 一覧用の列だけで足りる場合は記事全体のJSONを読み込まない
+        needs_data = any(field not in column_fields for field in fields)
+
+        where, params = self._build_where(site_id, status)
+        if after:
+            cursor_clause = '(created_at < ? OR (created_at = ? AND id < ?))'
+            where = f"{where} AND {cursor_clause}" if where else f"WHERE {cursor_clause}"
+            params.extend([after[0], after[0], after[1]])
+
+        columns = ', '.join(column_fields + (['data'] if needs_data else []))
+        rows = self._get_connection().execute(
+            f'SELECT {columns} FROM articles {where} ORDER BY created_at DESC, id DESC LIMIT ?',
+            params + [int(limit) + 1]
+        ).fetchall()
+
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+
+        articles = []
+        for row in rows:
+            source = json.loads(row['data']) if needs_data else dict(row)
+            articles.append({field: source.get(field) for field in fields})
+
+        next_cursor = (rows[-1]['created_at'], rows[-1]['id']) if has_more and rows else None
+        return articles, next_cursor
+
+    def count_articles(self,
+                       site_id: Optional[str] = None,
+                       status: Optional[str] = None,
+                       created_from: Optional[str] = None,
+                       created_to: Optional[str] = None) -> int:
+        """条件に一致する記事数を取得"""
+        where, params = self._build_where(site_id, status, created_from, created_to)
+        row = self._get_connection().execute(
+            f'SELECT COUNT(*) AS cnt FROM articles {where}', params
+        ).fetchone()
+        return row['cnt']
+
+    def count_by_site(self) -> Dict[str, Dict[str, int]]:
+        """サイト名ごとの総数・公開済み数を取得"""
+        rows = self._get_connection().execute(
+            '''
+            SELECT COALESCE(site_name, '不明') AS site_name,
+                   COUNT(*) AS total,
+                   SUM(CASE WHEN status = '公開済み' THEN 1 ELSE 0 END) AS published
+            FROM articles GROUP BY COALESCE(site_name, '不明')
+            '''
+        ).fetchall()
+        return {row['site_name']: {'total': row['total'], 'published': row['published'] or 0}
+                for row in rows}
+
+    def total_content_length(self) -> int:
+        """全記事の本文文字数の合計を取得"""
+        row = self._get_connection().execute(
+            'SELECT COALESCE(SUM(content_length), 0) AS total FROM articles'
+        ).fetchone()
+        return row['total']
+
+    def rebuild_rollups(self):
+        """記事テーブルから集計テーブルを作り直す"""
+        with self._write_transaction() as conn:
+            conn.execute('DELETE FROM article_rollups')
+            conn.execute('DELETE FROM article_status_totals')
+            rows = conn.execute(
+                'SELECT site_id, site_name, status, created_at, content_length FROM articles ORDER BY seq'
+            )
+            for row in rows.fetchall():
+                self._apply_rollup(conn, row['site_id'], row['site_name'], row['status'],
+                                   row['created_at'], row['content_length'], 1)
+            self._set_meta(conn, 'rollups_built', datetime.now().isoformat())
+
+    def get_daily_counts(self, day_from: str, day_to: str,
+                         site_id: Optional[str] = None) -> Dict[str, Dict[str, int]]:
+        """
+        日別の生成数・公開数を取得
+
+        Args:
+            day_from: 開始日（YYYY-MM-DD、この日を含む）
+            day_to: 終了日（YYYY-MM-DD、この日を含まない）
+            site_id: サイトIDで絞り込み
+
+        Returns:
+            {日付: {'generated': 件数, 'published': 件数}}
+        """
+        sql = '''
+            SELECT day, SUM(generated) AS generated, SUM(published) AS published
+            FROM article_rollups WHERE day >= ? AND day < ?
+        '''
+        params = [day_from, day_to]
+        if site_id:
+            sql += ' AND site_id = ?'
+            params.append(site_id)
+        sql += ' GROUP BY day'
+        rows = self._get_connection().execute(sql, params).fetchall()
+        return {row['day']: {'generated': row['generated'], 'published': row['published']}
+                for row in rows}
+
+    def get_rollup_totals(self, day_from: Optional[str] = None,
+                          day_to: Optional[str] = None,
+                          site_id: Optional[str] = None) -> Dict[str, int]:
+        """期間内の生成数・公開数・本文文字数の合計を取得"""
+        clauses = []
+        params = []
+        if day_from:
+            clauses.append('day >= ?')
+            params.append(day_from)
+        if day_to:
+            clauses.append('day < ?')
+            params.append(day_to)
+        if site_id:
+            clauses.append('site_id = ?')
+            params.append(site_id)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+        row = self._get_connection().execute(
+            f'''
+            SELECT COALESCE(SUM(generated), 0) AS generated,
+                   COALESCE(SUM(published), 0) AS published,
+                   COALESCE(SUM(content_chars), 0) AS content_chars
+            FROM article_rollups {where}
+            ''',
+            params
+        ).fetchone()
+        return dict(row)
+
+    def get_status_totals(self) -> Dict[str, int]:
+        """ステータス別の記事数を取得"""
+        rows = self._get_connection().execute(
+            'SELECT status, count FROM article_status_totals WHERE count > 0'
+        ).fetchall()
+        return {row['status']: row['count'] for row in rows}
+
+    def get_monthly_counts(self, day_from: str) -> Dict[str, int]:
+        """月別（YYYY/MM）の生成数を取得"""
+        rows = self._get_connection().execute(
+            '''
+            SELECT substr(day, 1, 7) AS month, SUM(generated) AS generated
+            FROM article_rollups WHERE day >= ?
+            GROUP BY month ORDER BY month
+            ''',
+            (day_from,)
+        ).fetchall()
+        return {row['month'].replace('-', '/'): row['generated']
+                for row in rows if row['generated']}
+
+    def get_site_counts(self) -> Dict[str, int]:
+        """サイト名ごとの生成数を取得"""
+        rows = self._get_connection().execute(
+            '''
+            SELECT site_id, MAX(site_name) AS site_name, SUM(generated) AS generated
+            FROM article_rollups GROUP BY site_id
+            '''
+        ).fetchall()
+        result = {}
+        for row in rows:
+            if row['generated']:
+                name = row['site_name'] or 'Unknown'
+                result[name] = result.get(name, 0) + row['generated']
+        return result
+
+    def get_hourly_counts(self) -> List[int]:
+        """時間帯（0〜23時）ごとの生成数を取得"""
+        counts = [0] * 24
+        rows = self._get_connection().execute(
+            'SELECT hour, SUM(generated) AS generated FROM article_rollups GROUP BY hour'
+        ).fetchall()
+        for row in rows:
+            counts[row['hour']] = row['generated']
+        return counts
+
+    def clear(self):
+        """すべての記事を削除"""
+        conn = self._get_connection()
+        with conn:
+            conn.execute('DELETE FROM articles')
+            conn.execute('DELETE FROM article_rollups')
+            conn.execute('DELETE FROM article_status_totals')
+            self._set_meta(conn, 'legacy_imported', datetime.now().isoformat())
+
+    def import_from_json(self, json_path: str) -> int:
+        """
+        旧形式の記事JSONファイルを取り込む（既存IDはスキップ）
+
+        Args:
+            json_path: 記事JSONファイルのパス
+
+        Returns:
+            取り込んだ記事数
+        """
+        articles = []
+        if os.path.exists(json_path):
+            try:
+                with open(json_path, 'r', encoding='utf-8') as f:
+                    articles = json.load(f).get('articles', [])
+            except Exception as e:
+                logger.error(f"記事JSONの読み込みエラー: {str(e)}")
+                return 0
+
+        # JSONは新しい順に並んでいるため、古い順に挿入して並び順を保つ
+        rows = [self._to_row(a) for a in reversed(articles) if a.get('id')]
+        conn = self._get_connection()
+        with conn:
+            before = conn.total_changes
+            conn.executemany(
+                '''
+                INSERT OR IGNORE INTO articles (id, site_id, site_name, title, status, created_at,
+                                                published_at, wordpress_url, content_length, data)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ''',
+                rows
+            )
+            imported = conn.total_changes - before
+            self._set_meta(conn, 'legacy_imported', datetime.now().isoformat())
+
+        if imported:
+            self.rebuild_rollups()
+            logger.info(f"記事JSONから{imported}件を取り込みました: {json_path}")
+        return imported
@@ -79,12 +79,13 @@ class ArticleVariationGenerator:
             バリエーションプロンプト
         """
         # ランダムに要素を選択（ただし、indexをシードとして使用して一貫性を保つ）
-        random.seed(index)
+        # 並列生成時に他スレッドと乱数状態を共有しないよう、個別の乱数生成器を使う
+        rng = random.Random(index)
         
-        perspective = random.choice(self.perspectives)
-        structure = random.choice(self.structures)
-        focus = random.choice(self.focus_points)
-        target = random.choice(self.target_segments)
+        perspective = rng.choice(self.perspectives)
+        structure = rng.choice(self.structures)
+        focus = rng.choice(self.focus_points)
+        target = rng.choice(self.target_segments)
         
         # 記事番号に応じて異なる角度を設定
         if total_count > 1:
@@ -146,8 +147,8 @@ class ArticleVariationGenerator:
         extra_keywords = additional_keywords.get(index % 5, [])
         
         # ランダムに2つ追加
-        random.seed(index)
-        selected_extras = random.sample(extra_keywords, min(2, len(extra_keywords)))
+        rng = random.Random(index)
+        selected_extras = rng.sample(extra_keywords, min(2, len(extra_keywords)))
         unique_keywords.extend(selected_extras)
         
         return unique_keywords
@@ -8,6 +8,10 @@ from datetime import datetime, timedelta
 from typing import List, Dict, Optional
 import schedule
 import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from .article_store import ArticleStore
+from .publish_outbox import PublishOutbox
 
 logger = logging.getLogger(__name__)
 
@@ -15,13 +19,33 @@ logger = logging.getLogger(__name__)
 class AutoPublisher:
     """記事の自動投稿を管理"""
     
-    def __init__(self, site_manager, wordpress_publisher, category_selector, unsplash_fetcher):
+    def __init__(self, site_manager, wordpress_publisher, category_selector, unsplash_fetcher,
+                 article_store: Optional[ArticleStore] = None,
+                 min_spacing_seconds: float = 60,
+                 max_parallel_sites: int = 4,
+                 site_spacing_seconds: Optional[Dict[str, float]] = None):
+        """
+        初期化
+        
+        Args:
+            min_spacing_seconds: 同じサイトへの投稿間隔（スパム防止）
+            max_parallel_sites: 並行して投稿するサイト数の上限
+            site_spacing_seconds: サイトIDごとの投稿間隔（未指定のサイトは min_spacing_seconds）
+        """
         self.site_manager = site_manager
+        self.article_store = article_store or ArticleStore()
+        self.publish_outbox = PublishOutbox(self.article_store)
         self.wordpress_publisher = wordpress_publisher
         self.category_selector = category_selector
         self.unsplash_fetcher = unsplash_fetcher
+        self.min_spacing_seconds = min_spacing_seconds
+        self.max_parallel_sites = max(1, max_parallel_sites)
+        self.site_spacing_seconds = site_spacing_seconds or {}
         self.is_running = False
         self.thread = None
+        # サイトごとの最終投稿時刻（time.monotonic）。実行をまたいで投稿間隔を守る
+        self._last_published: Dict[str, float] = {}
+        self._stop_event = threading.Event()
         
     def publish_article(self, article: Dict, site) -> bool:
         """
@@ -35,15 +59,15 @@ class AutoPublisher:
             成功時True
         """
         try:
-            # WordPressPublisherを初期化
-            publisher = self.wordpress_publisher(
+            # サイト共有のWordPressPublisherを取得
+            publisher = self.wordpress_publisher.for_site(
                 site.url,
                 site.wordpress_username,
                 site.wordpress_app_password
             )
             
-            # 接続テスト
-            if not publisher.test_connection():
+            # 接続確認（直近の確認結果があれば再利用）
+            if not publisher.ensure_connection():
                 logger.error(f"WordPress接続失敗: {site.name}")
                 return False
             
@@ -66,30 +90,30 @@ class AutoPublisher:
                             logger.info(f"カテゴリ選択: {cat['name']}")
                             break
             
-            # アイキャッチ画像を取得
-            featured_media_id = None
-            if self.unsplash_fetcher.is_configured():
-                photo = self.unsplash_fetcher.get_photo_for_article(
-                    title=article.get('title', ''),
-                    keywords=article.get('tags', []),
-                    content=article.get('content', '')[:500]
-                )
-                
-                if photo:
-                    featured_media_id = publisher.upload_media(
-                        image_url=photo['url'],
-                        alt_text=photo.get('alt_description', article.get('title', ''))
+            # アイキャッチ画像を取得（アウトボックスが画像アップロード前の段階の場合のみ実行）
+            def upload_featured_media():
+                featured_media_id = None
+                if self.unsplash_fetcher.is_configured():
+                    photo = self.unsplash_fetcher.get_photo_for_article(
+                        title=article.get('title', ''),
+                        keywords=article.get('tags', []),
+                        content=article.get('content', '')[:500]
                     )
-                    self.unsplash_fetcher.download_photo(photo['id'])
+                    
+                    if photo:
+                        featured_media_id = publisher.upload_media(
+                            image_url=photo['url'],
+                            alt_text=photo.get('alt_description', article.get('title', ''))
+                        )
+                        self.unsplash_fetcher.download_photo(photo['id'])
+                return featured_media_id
             
-            # 記事を投稿
-            result = publisher.publish_post(
-                title=article.get('title', 'Untitled'),
-                content=article.get('content', ''),
-                excerpt=article.get('excerpt', ''),
+            # 記事を投稿（前回の試行で投稿済みなら再投稿しない）
+            result = self.publish_outbox.publish(
+                publisher,
+                article,
+                upload_media=upload_featured_media,
                 categories=category_ids,
-                tags=article.get('tags', []),
-                featured_media_id=featured_media_id,
                 status='publish'
             )
             
@@ -104,43 +128,83 @@ class AutoPublisher:
             logger.error(f"自動投稿エラー: {str(e)}")
             return False
     
-    def publish_pending_articles(self):
+    def publish_pending_articles(self) -> Dict[str, int]:
         """
         下書き状態の記事を自動投稿
+        
+        サイトごとのキューに分け、サイト間は並行して投稿する。
+        同じサイトへの投稿だけ間隔を空け、ステータスは1記事ごとに更新する
+        
+        Returns:
+            投稿結果の件数（published, failed）
         """
+        counts = {'published': 0, 'failed': 0}
         try:
-            import json
-            
-            # 記事データを読み込む
-            with open('data/generated_articles.json', 'r', encoding='utf-8') as f:
-                articles_data = json.load(f)
+            # 下書き状態の記事のみ、古い順にサイトごとのキューへ振り分け
+            queues: Dict[str, List[Dict]] = OrderedDict()
+            for article in self.article_store.list_articles(status='下書き', oldest_first=True):
+                queues.setdefault(article.get('site_id'), []).append(article)
             
-            updated = False
+            sites = []
+            for site_id, articles in queues.items():
+                site = self.site_manager.get_site_by_id(site_id)
+                if site and site.wordpress_username and site.wordpress_app_password:
+                    sites.append((site, articles))
+            if not sites:
+                return counts
             
-            for i, article in enumerate(articles_data.get('articles', [])):
-                # 下書き状態の記事のみ処理
-                if article.get('status') == '下書き':
-                    site = self.site_manager.get_site_by_id(article.get('site_id'))
-                    
-                    if site and site.wordpress_username and site.wordpress_app_password:
-                        logger.info(f"自動投稿開始: {article.get('title', 'Untitled')}")
-                        
-                        if self.publish_article(article, site):
-                            # ステータスを更新
-                            articles_data['articles'][i]['status'] = '公開済み'
-                            articles_data['articles'][i]['published_at'] = datetime.now().isoformat()
-                            updated = True
-                            
-                            # 投稿間隔を空ける（スパム防止）
-                            time.sleep(60)  # 1分待機
+            logger.info(f"自動投稿開始: {sum(len(a) for _, a in sites)}件 / {len(sites)}サイト")
+            self._stop_event.clear()
+            with ThreadPoolExecutor(max_workers=min(self.max_parallel_sites, len(sites)),
+                                    thread_name_prefix='auto-publish') as executor:
+                futures = [executor.submit(self._drain_site_queue, site, articles)
+                           for site, articles in sites]
+                for future in futures:
+                    result = future.result()
+                    counts['published'] += result['published']
+                    counts['failed'] += result['failed']
             
-            # 更新があれば保存
-            if updated:
-                with open('data/generated_articles.json', 'w', encoding='utf-8') as f:
-                    json.dump(articles_data, f, ensure_ascii=False, indent=2)
+            logger.info(f"自動投稿完了: 成功 {counts['published']}件, 失敗 {counts['failed']}件")
                     
         except Exception as e:
             logger.error(f"自動投稿処理エラー: {str(e)}")
+        return counts
+    
+    def _drain_site_queue(self, site, articles: List[Dict]) -> Dict[str, int]:
+        """1サイト分の下書きを投稿間隔を守って順に投稿"""
+        counts = {'published': 0, 'failed': 0}
+        spacing = self.site_spacing_seconds.get(site.site_id, self.min_spacing_seconds)
+        
+        for article in articles:
+            # 投稿間隔を空ける（スパム防止、停止要求があれば中断）
+            last = self._last_published.get(site.site_id)
+            if last is not None:
+                remaining = spacing - (time.monotonic() - last)
+                if remaining > 0 and self._stop_event.wait(remaining):
+                    break
+            if self._stop_event.is_set():
+                break
+            
+            logger.info(f"自動投稿開始: {article.get('title', 'Untitled')} ({site.name})")
+            try:
+                published = self.publish_article(article, site)
+            except Exception as e:
+                logger.error(f"自動投稿エラー: {str(e)}")
+                published = False
+            
+            if published:
+                # ステータスを更新
+                self.article_store.update_fields(
+                    article['id'],
+                    status='公開済み',
+                    published_at=datetime.now().isoformat()
+                )
+                self._last_published[site.site_id] = time.monotonic()
+                counts['published'] += 1
+            else:
+                counts['failed'] += 1
+        
+        return counts
     
     def schedule_publishing(self, interval_hours: int = 6):
         """
@@ -165,6 +229,7 @@ class AutoPublisher:
     def stop_scheduling(self):
         """スケジュールを停止"""
         self.is_running = False
+        self._stop_event.set()
         if self.thread:
             self.thread.join()
         logger.info("自動投稿スケジュール停止")
\ No newline at end of file
@@ -3,10 +3,11 @@
 AIが自分で判断して記事を生成・投稿
 """
 import logging
-import json
 import time
 from datetime import datetime
 from typing import Dict, Optional
+from .article_store import ArticleStore
+from .publish_outbox import PublishOutbox
 
 logger = logging.getLogger(__name__)
 
@@ -15,8 +16,11 @@ class AutonomousPublisher:
     """完全自律的に記事を生成・投稿するAIシステム"""
     
     def __init__(self, site_manager, generator, publisher_class, 
-                 category_selector, unsplash_fetcher, content_strategist):
+                 category_selector, unsplash_fetcher, content_strategist,
+                 article_store: Optional[ArticleStore] = None):
         self.site_manager = site_manager
+        self.article_store = article_store or ArticleStore()
+        self.publish_outbox = PublishOutbox(self.article_store)
         self.generator = generator
         self.publisher_class = publisher_class
         self.category_selector = category_selector
@@ -49,12 +53,12 @@ class AutonomousPublisher:
             # WordPress分析（オプション）
             wordpress_analysis = None
             if site.wordpress_username and site.wordpress_app_password:
-                publisher = self.publisher_class(
+                publisher = self.publisher_class.for_site(
                     site.url,
                     site.wordpress_username,
                     site.wordpress_app_password
                 )
-                if publisher.test_connection():
+                if publisher.ensure_connection():
                     wordpress_analysis = self.content_strategist.analyze_wordpress_content(publisher)
             
             # 2. 次のテーマを決定
@@ -141,13 +145,13 @@ class AutonomousPublisher:
     def _publish_article(self, article: Dict, site) -> Dict:
         """記事をWordPressに投稿"""
         try:
-            publisher = self.publisher_class(
+            publisher = self.publisher_class.for_site(
                 site.url,
                 site.wordpress_username,
                 site.wordpress_app_password
             )
             
-            if not publisher.test_connection():
+            if not publisher.ensure_connection():
                 return {'success': False, 'error': 'WordPress接続失敗'}
             
             # カテゴリ選択
@@ -165,30 +169,30 @@ class AutonomousPublisher:
                 if selected_category_id:
                     category_ids.append(selected_category_id)
             
-            # アイキャッチ画像
-            featured_media_id = None
-            if self.unsplash_fetcher.is_configured():
-                photo = self.unsplash_fetcher.get_photo_for_article(
-                    title=article['title'],
-                    keywords=article['tags'],
-                    content=article['content'][:500]
-                )
-                
-                if photo:
-                    featured_media_id = publisher.upload_media(
-                        image_url=photo['url'],
-                        alt_text=photo.get('alt_description', article['title'])
+            # アイキャッチ画像（アウトボックスが画像アップロード前の段階の場合のみ実行）
+            def upload_featured_media():
+                featured_media_id = None
+                if self.unsplash_fetcher.is_configured():
+                    photo = self.unsplash_fetcher.get_photo_for_article(
+                        title=article['title'],
+                        keywords=article['tags'],
+                        content=article['content'][:500]
                     )
-                    self.unsplash_fetcher.download_photo(photo['id'])
-            
-            # 投稿
-            result = publisher.publish_post(
-                title=article['title'],
-                content=article['content'],
-                excerpt=article.get('excerpt', ''),
+                    
+                    if photo:
+                        featured_media_id = publisher.upload_media(
+                            image_url=photo['url'],
+                            alt_text=photo.get('alt_description', article['title'])
+                        )
+                        self.unsplash_fetcher.download_photo(photo['id'])
+                return featured_media_id
+            
+            # 投稿（前回の試行で投稿済みなら再投稿しない）
+            result = self.publish_outbox.publish(
+                publisher,
+                article,
+                upload_media=upload_featured_media,
                 categories=category_ids,
-                tags=article['tags'],
-                featured_media_id=featured_media_id,
                 status='publish'
             )
             
@@ -207,30 +211,12 @@ class AutonomousPublisher:
     
     def _save_article(self, article: Dict):
         """記事を保存"""
-        try:
-            with open('data/generated_articles.json', 'r', encoding='utf-8') as f:
-                data = json.load(f)
-        except:
-            data = {'articles': []}
-        
-        data['articles'].insert(0, article)
-        
-        with open('data/generated_articles.json', 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+        self.article_store.add_article(article)
     
     def _update_article(self, article: Dict):
         """記事を更新"""
         try:
-            with open('data/generated_articles.json', 'r', encoding='utf-8') as f:
-                data = json.load(f)
-            
-            for i, a in enumerate(data['articles']):
-                if a['id'] == article['id']:
-                    data['articles'][i] = article
-                    break
-            
-            with open('data/generated_articles.json', 'w', encoding='utf-8') as f:
-                json.dump(data, f, ensure_ascii=False, indent=2)
+            self.article_store.update_article(article)
         except Exception as e:
             logger.error(f"記事更新エラー: {str(e)}")
     
@@ -2,13 +2,15 @@
 AIコンテンツストラテジスト（GPT版）
 過去記事を分析して次の記事テーマを自動決定
 """
-import json
 import logging
 from typing import List, Dict, Optional, Tuple
 from datetime import datetime, timedelta
 import re
 from collections import Counter
 import openai
+from .prompt_cache import get_prompt_cache_stats
+from .article_store import ArticleStore
+from .rate_limiter import get_rate_limiter
 
 logger = logging.getLogger(__name__)
 
@@ -16,8 +18,9 @@ logger = logging.getLogger(__name__)
 class ContentStrategistGPT:
     """AIが過去記事を分析して戦略的に次の記事を決定（GPT版）"""
     
-    def __init__(self):
+    def __init__(self, article_store: Optional[ArticleStore] = None):
         self.model = "gpt-4-1106-preview"
+        self.article_store = article_store or ArticleStore()
         
     def analyze_published_articles(self, site_id: str) -> Dict:
         """
@@ -27,21 +30,16 @@ class ContentStrategistGPT:
             分析結果の辞書
         """
         try:
-            with open('data/generated_articles.json', 'r', encoding='utf-8') as f:
-                articles_data = json.load(f)
-        except:
+            # サイトの公開済み記事を取得
+            site_articles = self.article_store.list_articles(site_id=site_id, status='公開済み')
+        except Exception as e:
+            logger.error(f"記事データ取得エラー: {str(e)}")
             return {
                 'total_articles': 0,
                 'topics_covered': [],
                 'keyword_frequency': {}
             }
         
-        # サイトの記事をフィルタリング
-        site_articles = [
-            a for a in articles_data.get('articles', [])
-            if a.get('site_id') == site_id and a.get('status') == '公開済み'
-        ]
-        
         # トピック分析
         topics = []
         all_keywords = []
@@ -83,9 +81,8 @@ class ContentStrategistGPT:
             分析結果
         """
         try:
-            # WordPress APIで記事一覧を取得
-            import requests
-            response = requests.get(
+            # WordPress APIで記事一覧を取得（パブリッシャーのセッションを使い回す）
+            response = publisher.session.get(
                 f"{publisher.api_base}/posts",
                 headers=publisher.headers,
                 params={'per_page': limit, 'status': 'publish'}
@@ -140,8 +137,32 @@ class ContentStrategistGPT:
         Returns:
             提案される記事テーマのリスト
         """
-        # プロンプトを構築
-        prompt = f"""
+        # プロンプトを固定部分（キャッシュ対象）と可変部分に分けて構築
+        static_prompt, variable_prompt = self._build_strategy_prompt(
+            site_info, past_analysis, wordpress_analysis
+        )
+        
+        try:
+            content = self._request_strategy(static_prompt, variable_prompt)
+            
+            # 提案を解析
+            suggestions = self._parse_suggestions(content)
+            
+            return suggestions
+            
+        except Exception as e:
+            logger.error(f"コンテンツ戦略生成エラー: {str(e)}")
+            return []
+    
+    def _build_strategy_prompt(self, site_info: Dict, past_analysis: Dict,
+                               wordpress_analysis: Optional[Dict] = None) -> Tuple[str, str]:
+        """
+        戦略立案プロンプトを構築
+        
+        Returns:
+            (サイト情報・分析観点・出力形式の固定部分, 過去記事分析の可変部分)
+        """
+        static_prompt = f"""
 あなたは{site_info.get('name')}のSEOコンテンツストラテジストです。
 過去の記事を分析し、次に書くべき記事テーマを戦略的に提案してください。
 
@@ -151,20 +172,6 @@ class ContentStrategistGPT:
 - ターゲット: {site_info.get('target_details', site_info.get('target_audience'))}
 - キーワード: {site_info.get('keywords_focus')}
 
-【過去記事分析】
-- 総記事数: {past_analysis.get('total_articles', 0)}
-- 最近の記事タイトル:
-{chr(10).join(['  - ' + t for t in past_analysis.get('titles', [])[:10]])}
-
-- よく使われるキーワード:
-{chr(10).join([f'  - {k}: {v}回' for k, v in sorted(past_analysis.get('keyword_frequency', {}).items(), key=lambda x: x[1], reverse=True)[:10]])}
-
-{f'''【WordPress既存記事】
-- 既存記事数: {wordpress_analysis.get('total_posts', 0)}
-- 既存記事タイトル（一部）:
-{chr(10).join(['  - ' + t for t in wordpress_analysis.get('titles', [])[:5]])}
-''' if wordpress_analysis and not wordpress_analysis.get('error') else ''}
-
 【分析してほしいこと】
 1. カバーされていないトピック（ギャップ分析）
 2. 読者が次に知りたいであろう内容
@@ -192,30 +199,45 @@ class ContentStrategistGPT:
 - 読者に価値を提供できる内容
 """
         
-        try:
-            # Claude APIで分析
-            response = openai.ChatCompletion.create(
-                model=self.model,
-                max_tokens=4000,
-                temperature=0.7,
-                messages=[
-                    {
-                        "role": "user",
-                        "content": prompt
-                    }
-                ]
-            )
-            
-            content = response.choices[0].message["content"]
-            
-            # 提案を解析
-            suggestions = self._parse_suggestions(content)
-            
-            return suggestions
-            
-        except Exception as e:
-            logger.error(f"コンテンツ戦略生成エラー: {str(e)}")
-            return []
+        variable_prompt = f"""
+【過去記事分析】
+- 総記事数: {past_analysis.get('total_articles', 0)}
+- 最近の記事タイトル:
+{chr(10).join(['  - ' + t for t in past_analysis.get('titles', [])[:10]])}
+
+- よく使われるキーワード:
+{chr(10).join([f'  - {k}: {v}回' for k, v in sorted(past_analysis.get('keyword_frequency', {}).items(), key=lambda x: x[1], reverse=True)[:10]])}
+
+{f'''【WordPress既存記事】
+- 既存記事数: {wordpress_analysis.get('total_posts', 0)}
+- 既存記事タイトル（一部）:
+{chr(10).join(['  - ' + t for t in wordpress_analysis.get('titles', [])[:5]])}
+''' if wordpress_analysis and not wordpress_analysis.get('error') else ''}
+上記の分析を踏まえて、次に書くべき記事テーマを提案してください。
+"""
+        return static_prompt, variable_prompt
+    
+    def _request_strategy(self, static_prompt: str, variable_prompt: str) -> str:
+        """GPTで戦略を生成（固定部分を先頭に置きプレフィックスキャッシュを効かせる）"""
+        response = get_rate_limiter().call('openai', lambda: openai.ChatCompletion.create(
+            model=self.model,
+            max_tokens=4000,
+            temperature=0.7,
+            messages=[
+                {
+                    "role": "system",
+                    "content": static_prompt
+                },
+                {
+                    "role": "user",
+                    "content": variable_prompt
+                }
+            ]
+        ))
+        get_prompt_cache_stats().record_openai_usage('openai', response.get("usage"))
+        
+        content = response.choices[0].message["content"]
+        return content
     
     def _parse_suggestions(self, content: str) -> List[Dict]:
         """提案されたコンテンツを解析"""
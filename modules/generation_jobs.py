@@ -0,0 +1,162 @@
+"""
+記事生成ジョブキュー
+記事生成をバックグラウンドのワーカースレッドで実行し、記事ごとの進捗を保持する
+"""
+import threading
+import uuid
+import logging
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class GenerationJob:
+    """記事生成ジョブの状態"""
+
+    def __init__(self, job_id: str, site_id: str, count: int, params: Optional[Dict] = None):
+        self.job_id = job_id
+        self.site_id = site_id
+        self.count = count
+        self.params = params or {}
+        self.status = 'queued'  # queued, running, completed, failed
+        self.error = None
+        self.created_at = datetime.now().isoformat()
+        self.started_at = None
+        self.finished_at = None
+        self.articles = [
+            {
+                'index': i,
+                'status': 'pending',  # pending, generating, generated, publishing, published, failed
+                'article_id': None,
+                'title': None,
+                'wordpress_url': None,
+                'received_chars': 0,  # ストリーミング受信中の本文文字数
+                'error': None
+            }
+            for i in range(count)
+        ]
+        self._lock = threading.Lock()
+
+    def update_article(self, index: int, **fields):
+        """
+        記事ごとの進捗を更新
+
+        Args:
+            index: バッチ内の記事番号
+            **fields: 更新するフィールド（status, article_id, title など）
+        """
+        with self._lock:
+            self.articles[index].update(fields)
+
+    def _set_status(self, status: str, error: Optional[str] = None):
+        with self._lock:
+            self.status = status
+            if status == 'running':
+                self.started_at = datetime.now().isoformat()
+            elif status in ('completed', 'failed'):
+                self.finished_at = datetime.now().isoformat()
+            if error:
+                self.error = error
+
+    @property
+    def is_finished(self) -> bool:
+        return self.status in ('completed', 'failed')
+
+    @property
+    def article_ids(self) -> List[str]:
+        with self._lock:
+            return [a['article_id'] for a in self.articles if a['article_id']]
+
+    def to_dict(self) -> Dict:
+        """API応答用の辞書に変換"""
+        with self._lock:
+            articles = [dict(a) for a in self.articles]
+            finished = sum(1 for a in articles if a['status'] in ('generated', 'published', 'failed'))
+            return {
+                'job_id': self.job_id,
+                'site_id': self.site_id,
+                'count': self.count,
+                'status': self.status,
+                'error': self.error,
+                'created_at': self.created_at,
+                'started_at': self.started_at,
+                'finished_at': self.finished_at,
+                'progress': round(finished / self.count * 100) if self.count else 100,
+                'generated_count': sum(1 for a in articles if a['article_id']),
+                'article_ids': [a['article_id'] for a in articles if a['article_id']],
+                'articles': articles
+            }
+
+
+class GenerationJobQueue:
+    """記事生成ジョブを上限付きのワーカープールで実行するキュー"""
+
+    def __init__(self, max_workers: int = 2, max_finished_jobs: int = 100):
+        """
+        初期化
+
+        Args:
+            max_workers: 同時に実行するジョブ数の上限
+            max_finished_jobs: 保持する完了済みジョブ数の上限
+        """
+        self.max_workers = max_workers
+        self.max_finished_jobs = max_finished_jobs
+        self._executor = ThreadPoolExecutor(max_workers=max_workers,
+                                            thread_name_prefix='generation-job')
+        self._jobs: 'OrderedDict[str, GenerationJob]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(self, site_id: str, count: int, runner: Callable[[GenerationJob], None],
+               params: Optional[Dict] = None) -> GenerationJob:
+        """
+        ジョブを登録してすぐに返す
+
+        Args:
+            site_id: 対象サイトID
+            count: 生成する記事数
+            runner: ジョブ本体（例外を送出するとジョブは失敗扱い）
+            params: リクエストパラメータ（表示用）
+
+        Returns:
+            登録したジョブ
+        """
+        job = GenerationJob(uuid.uuid4().hex[:12], site_id, count, params)
+        with self._lock:
+            self._jobs[job.job_id] = job
+            self._prune_finished()
+        self._executor.submit(self._run, job, runner)
+        logger.info(f"記事生成ジョブ登録: {job.job_id} ({count}件)")
+        return job
+
+    def _run(self, job: GenerationJob, runner: Callable[[GenerationJob], None]):
+        job._set_status('running')
+        try:
+            runner(job)
+            job._set_status('completed')
+            logger.info(f"記事生成ジョブ完了: {job.job_id} - 生成数: {len(job.article_ids)}")
+        except Exception as e:
+            logger.error(f"記事生成ジョブ失敗: {job.job_id} - {str(e)}")
+            job._set_status('failed', str(e))
+
+    def _prune_finished(self):
+        """古い完了済みジョブを削除"""
+        finished = [job_id for job_id, job in self._jobs.items() if job.is_finished]
+        for job_id in finished[:max(0, len(finished) - self.max_finished_jobs)]:
+            del self._jobs[job_id]
+
+    def get_job(self, job_id: str) -> Optional[GenerationJob]:
+        """IDでジョブを取得"""
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def list_jobs(self, limit: int = 20) -> List[GenerationJob]:
+        """新しい順にジョブを取得"""
+        with self._lock:
+            return list(reversed(self._jobs.values()))[:limit]
+
+    def shutdown(self, wait: bool = True):
+        """ワーカープールを停止"""
+        self._executor.shutdown(wait=wait)
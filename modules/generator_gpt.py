@@ -6,9 +6,12 @@ import os
 import json
 import re
 from datetime import datetime
-from typing import Dict, List, Optional
+from typing import Any, Callable, Dict, List, Optional, Tuple
 import openai
 import logging
+from modules.stream_parser import StreamingTagParser
+from modules.prompt_cache import get_prompt_cache_stats
+from modules.rate_limiter import get_rate_limiter
 
 # ロギング設定
 logging.basicConfig(level=logging.INFO)
@@ -18,12 +21,13 @@ logger = logging.getLogger(__name__)
 class ArticleGeneratorGPT:
     """記事生成クラス（GPT版）"""
     
-    def __init__(self, api_key: Optional[str] = None):
+    def __init__(self, api_key: Optional[str] = None, max_tokens: int = 16000):
         """
         初期化
         
         Args:
             api_key: OpenAI  APIキー
+            max_tokens: 記事生成の最大出力トークン数
         """
         # APIキーの取得優先順位: 引数 > 環境変数 > config/api_keys.json
         self.api_key = api_key or os.getenv('OPENAI_API_KEY')
@@ -43,6 +47,7 @@ class ArticleGeneratorGPT:
         
         # API設定から現在のモデルを読み込む
         self.model = "gpt-4-1106-preview"
+        self.max_tokens = max_tokens
 
         self.templates = {
             'howto': self._get_howto_template(),
@@ -57,7 +62,10 @@ class ArticleGeneratorGPT:
                         keywords: Optional[List[str]] = None,
                         length: int = 7000,
                         tone: str = 'professional',
-                        affiliate_products: Optional[List[Dict]] = None) -> Dict:
+                        affiliate_products: Optional[List[Dict]] = None,
+                        stream: bool = False,
+                        on_field: Optional[Callable[[str, Any], None]] = None,
+                        on_progress: Optional[Callable[[int], None]] = None) -> Dict:
         """
         記事を生成
         
@@ -67,6 +75,9 @@ class ArticleGeneratorGPT:
             keywords: キーワードリスト
             length: 目標文字数
             tone: 文体（professional, casual, friendly）
+            stream: ストリーミングで受信し、</content>受信時点で打ち切る
+            on_field: ストリーミング時、タグ受信ごとに呼ばれる (タグ名, 値)
+            on_progress: ストリーミング時、本文の受信文字数を通知
         
         Returns:
             生成された記事情報
@@ -76,50 +87,41 @@ class ArticleGeneratorGPT:
             if article_type == 'auto':
                 article_type = self._select_article_type(site_info)
             
-            # プロンプトを構築
-            prompt = self._build_prompt(site_info, article_type, keywords, length, tone, affiliate_products)
+            # プロンプトを固定部分（プロバイダー側でキャッシュされる）と可変部分に分けて構築
+            static_prompt, variable_prompt = self._build_prompt(
+                site_info, article_type, keywords, length, tone, affiliate_products
+            )
             logger.info(f"記事生成開始: {site_info.get('name', 'Unknown')} - モデル: {self.model}")            
 
-            # GPT向けにenhanced_promptを組み立てる
-            enhanced_prompt = f"""
-あなたはこのサイトの専門ライターかつコンテンツストラテジストです。
-記事の目的と読者を深く理解し、SEOや最新のトレンド、過去の記事との重複回避も考慮しながら、
-読者が実際に行動しやすいよう具体例・データ・洞察を含む、高品質で詳細な記事を執筆してください。
-
-記事の長さはおおむね{length}文字を目安にします。
-各セクションは十分な情報量があり、専門的でありながら読みやすい日本語で書いてください。
-
-以下が執筆条件です：
-{prompt}
-
-{site_info.get('variation_prompt', '')}
-
-【重要な指示】
-1. 必ず{length}文字程度の充実した内容にしてください
-2. 各セクションを詳細に展開し、具体例や実践的なアドバイスを含めてください
-3. 読者が実際に行動できる具体的な情報を提供してください
-4. 専門的な内容も分かりやすく解説してください
-5. 可能なら最新のトレンドや統計データに触れてください
-"""
+            # 固定部分を先頭のsystemメッセージに置き、OpenAIのプレフィックスキャッシュを効かせる
+            messages = [
+                {
+                "role": "system",
+                "content": static_prompt
+                },
+                {
+                "role": "user",
+                "content": variable_prompt
+                }
+            ]
 
-        # OpenAI GPTで生成
-            response = openai.ChatCompletion.create(
-                model=self.model,
-                temperature=0.7,
-                max_tokens=16000,
-                messages=[
-                    {
-                    "role": "user",
-                    "content": enhanced_prompt
-                    }
-                ]
-            )
-            
-            # レスポンスを解析
-            choices = response.get("choices")
-            if not choices or not choices[0].get("message", {}).get("content"):
-                raise ValueError("APIレスポンスが不正です")
-            content = choices[0]["message"]["content"]
+            # OpenAI GPTで生成
+            if stream:
+                content = self._stream_completion(messages, on_field, on_progress)
+            else:
+                response = get_rate_limiter().call('openai', lambda: openai.ChatCompletion.create(
+                    model=self.model,
+                    temperature=0.7,
+                    max_tokens=self.max_tokens,
+                    messages=messages
+                ))
+                get_prompt_cache_stats().record_openai_usage('openai', response.get("usage"))
+                
+                # レスポンスを解析
+                choices = response.get("choices")
+                if not choices or not choices[0].get("message", {}).get("content"):
+                    raise ValueError("APIレスポンスが不正です")
+                content = choices[0]["message"]["content"]
             article = self._parse_response(content)
             
             # メタデータを追加
@@ -139,8 +141,57 @@ class ArticleGeneratorGPT:
             logger.error(f"記事生成エラー: {str(e)}")
             raise
     
-    def _build_prompt(self, site_info, article_type, keywords, length, tone, affiliate_products):
-        """プロンプトを構築"""
+    def _stream_completion(self, messages: List[Dict],
+                           on_field: Optional[Callable[[str, Any], None]] = None,
+                           on_progress: Optional[Callable[[int], None]] = None) -> str:
+        """
+        ストリーミングで生成し、受信しながらタグを解析する
+        
+        </content> を受信した時点でストリームを打ち切る
+        
+        Returns:
+            受信したテキスト全体
+        """
+        parser = StreamingTagParser(on_field=on_field, on_progress=on_progress)
+        response = get_rate_limiter().call('openai', lambda: openai.ChatCompletion.create(
+            model=self.model,
+            temperature=0.7,
+            max_tokens=self.max_tokens,
+            messages=messages,
+            stream=True,
+            stream_options={"include_usage": True}
+        ))
+        
+        try:
+            for chunk in response:
+                # usageは最終チャンクにのみ含まれる
+                if chunk.get("usage"):
+                    get_prompt_cache_stats().record_openai_usage('openai', chunk.get("usage"))
+                choices = chunk.get("choices")
+                if not choices:
+                    continue
+                delta = choices[0].get("delta", {}).get("content")
+                if delta and parser.feed(delta):
+                    logger.info("</content>を受信したためストリームを終了します")
+                    break
+        finally:
+            if hasattr(response, 'close'):
+                response.close()
+        
+        if not parser.text:
+            raise ValueError("APIレスポンスが不正です")
+        return parser.text
+    
+    def _build_prompt(self, site_info, article_type, keywords, length, tone, affiliate_products) -> Tuple[str, str]:
+        """
+        プロンプトを構築
+        
+        サイトごとに変わらない部分（サイト情報・記事構成・執筆ルール・出力形式）を固定部分、
+        記事ごとに変わる部分（文字数・キーワード・商品・バリエーション）を可変部分として返す
+        
+        Returns:
+            (固定部分, 可変部分)
+        """
         
         # 基本情報
         site_name = site_info.get('name', 'ブログ')
@@ -205,11 +256,31 @@ class ArticleGeneratorGPT:
 - 説明: {cta_description}
 - 記事内で自然にCTAへ誘導してください
 - CTAリンクは記事の中盤と終盤に配置
+"""
+        
+        # ライターとしての共通指示（全記事で共通）
+        writer_intro = """
+あなたはこのサイトの専門ライターかつコンテンツストラテジストです。
+記事の目的と読者を深く理解し、SEOや最新のトレンド、過去の記事との重複回避も考慮しながら、
+読者が実際に行動しやすいよう具体例・データ・洞察を含む、高品質で詳細な記事を執筆してください。
+各セクションは十分な情報量があり、専門的でありながら読みやすい日本語で書いてください。
+"""
+        
+        # 記事ごとの指示（可変部分の末尾）
+        variation_section = f"""
+{site_info.get('variation_prompt', '')}
+
+【重要な指示】
+1. 必ず{length}文字程度の充実した内容にしてください
+2. 各セクションを詳細に展開し、具体例や実践的なアドバイスを含めてください
+3. 読者が実際に行動できる具体的な情報を提供してください
+4. 専門的な内容も分かりやすく解説してください
+5. 可能なら最新のトレンドや統計データに触れてください
 """
         
         # カスタムプロンプトが設定されている場合
         if custom_prompt:
-            # 変数を置換
+            # 変数を置換（記事ごとの値を含むため全体を可変部分とする）
             prompt = custom_prompt
             prompt = prompt.replace('{site_name}', site_name)
             prompt = prompt.replace('{genre}', genre)
@@ -231,11 +302,19 @@ class ArticleGeneratorGPT:
             # 文字数指定を強調
             prompt += f"\n\n【重要】必ず{length}文字程度の記事を作成してください。"
             
-        else:
-            # デフォルトプロンプト
-            prompt = f"""
+            return writer_intro, f"""
+記事の長さはおおむね{length}文字を目安にします。
+
+以下が執筆条件です：
+{prompt}
+{variation_section}"""
+        
+        # デフォルトプロンプト
+        static_prompt = writer_intro + f"""
+以下が執筆条件です：
+
 あなたは{site_name}の専門ライターです。
-以下の条件で{genre}に関する記事を作成してください。
+{genre}に関する記事を作成してください。
 
 【サイト情報】
 - サイト名: {site_name}
@@ -246,14 +325,11 @@ class ArticleGeneratorGPT:
 - サイトの目的: {site_purpose}
 - コンテンツガイドライン: {content_guidelines}
 - 文体: {self._get_tone_description(tone)}
-
-【記事要件】
-- 記事タイプ: {template['name']}
-- 目標文字数: {length}文字程度（必須）
-- キーワード: {keyword_str}
-{affiliate_section}
 {cta_section}
 
+【記事タイプ】
+{template['name']}
+
 【記事構成】
 {template['structure']}
 
@@ -285,7 +361,17 @@ class ArticleGeneratorGPT:
 見出しは##、###を使用してマークダウン形式で
 </content>
 """
-        return prompt
+        
+        variable_prompt = f"""
+この記事の執筆条件です。
+
+【記事要件】
+- 目標文字数: {length}文字程度（必須）
+- キーワード: {keyword_str}
+{affiliate_section}
+{variation_section}"""
+        
+        return static_prompt, variable_prompt
     
     def _parse_response(self, content: str) -> Dict:
         """レスポンスを解析して記事データを抽出"""
@@ -436,12 +522,12 @@ SEOを意識し、クリックされやすいタイトルにしてください
 """
         
         try:
-            response = openai.ChatCompletion.create(
+            response = get_rate_limiter().call('openai', lambda: openai.ChatCompletion.create(
                 model=self.model,
                 max_tokens=500,
                 temperature=0.8,
                 messages=[{"role": "user", "content": prompt}]
-            )
+            ))
             
             # タイトルを抽出
             choices = response.get("choices")
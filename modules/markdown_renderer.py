@@ -0,0 +1,413 @@
+"""
+Markdown → HTML 変換
+記事生成で出力されるMarkdown（見出し・段落・リスト・表・コードブロック・引用・強調・リンク）を
+1回の走査でHTMLに変換する。同じ本文の再変換を避けるため結果をキャッシュする
+"""
+import re
+import html
+import hashlib
+import threading
+import logging
+from collections import OrderedDict
+from itertools import chain
+from typing import List, Optional
+
+logger = logging.getLogger(__name__)
+
+HEADING_RE = re.compile(r'^(#{1,6})[ \t]+(.*?)[ \t]*#*[ \t]*$')
+FENCE_RE = re.compile(r'^[ \t]*(```|~~~)[ \t]*([\w+-]*)')
+HR_RE = re.compile(r'^[ \t]*([-*_])([ \t]*\1){2,}[ \t]*$')
+LIST_RE = re.compile(r'^([ \t]*)([-*+]|\d{1,9}[.)])[ \t]+(.*)$')
+QUOTE_RE = re.compile(r'^[ \t]*>[ \t]?(.*)$')
+TABLE_SEP_RE = re.compile(r'^[ \t]*\|?[ \t]*:?-+:?[ \t]*(\|[ \t]*:?-+:?[ \t]*)*\|?[ \t]*$')
+HTML_BLOCK_RE = re.compile(r'^[ \t]*</?[a-zA-Z!][^>]*>')
+# 見出しレベルごとの開始・終了タグ
+HEADING_TAGS = [(f'<h{level}>', f'</h{level}>') for level in range(7)]
+# 行頭がこれらの文字の場合のみブロック要素の判定を行う
+BLOCK_MARKERS = frozenset('#`~-*_+>0123456789<')
+LIST_MARKERS = frozenset('-*+0123456789')
+# 変換結果のうちコードブロック・HTMLを埋め込む位置（入力からは取り除く。検索の速い制御文字を使う）
+SEGMENT = '\x1a'
+
+# インライン要素。太字斜体 → 太字 → 斜体の順に置換して入れ子を解決する
+CODE_RE = re.compile(r'`(`*)(.+?)`\1')
+IMAGE_RE = re.compile(r'!\[([^\]\n]*)\]\(([^)\s]+)(?:[ \t]+"([^"\n]*)")?\)')
+LINK_RE = re.compile(r'\[([^\]\n]+)\]\(([^)\s]+)(?:[ \t]+"([^"\n]*)")?\)')
+STRONG_EM_RE = re.compile(r'\*\*\*([^*\s](?:.*?[^*\s])?)\*\*\*')
+STRONG_RE = re.compile(r'\*\*(?!\*)(.+?)\*\*')
+EM_RE = re.compile(r'\*(?<![\w*]\*)([^*\s](?:[^*\n]*[^*\s])?)\*(?!\*)')
+
+# HTMLの特殊文字に加え、変換済みの部分が後の置換で再び解釈されないよう記号も文字参照にする
+_ESCAPES = str.maketrans({
+    '&': '&amp;', '<': '&lt;', '>': '&gt;', '"': '&quot;', "'": '&#x27;',
+    '*': '&#42;', '[': '&#91;', '`': '&#96;'
+})
+_ESCAPE_RE = re.compile(r'[&<>"\'*\[`]')
+
+
+def _escape(value: str) -> str:
+    """コード・属性値のエスケープ"""
+    return value.translate(_ESCAPES) if _ESCAPE_RE.search(value) else value
+
+
+def _replace_code(match: re.Match) -> str:
+    return '<code>' + _escape(match.group(2).strip()) + '</code>'
+
+
+def _replace_image(match: re.Match) -> str:
+    alt, src, title = match.groups()
+    title_attr = ' title="' + _escape(title) + '"' if title else ''
+    return '<img src="' + _escape(src) + '" alt="' + _escape(alt) + '"' + title_attr + ' />'
+
+
+def _replace_link(match: re.Match) -> str:
+    text, href, title = match.groups()
+    title_attr = ' title="' + _escape(title) + '"' if title else ''
+    return '<a href="' + _escape(href) + '"' + title_attr + '>' + text + '</a>'
+
+
+def _replace_strong_em(match: re.Match) -> str:
+    return '<strong><em>' + match.group(1) + '</em></strong>'
+
+
+def _replace_strong(match: re.Match) -> str:
+    return '<strong>' + match.group(1) + '</strong>'
+
+
+def _replace_em(match: re.Match) -> str:
+    return '<em>' + match.group(1) + '</em>'
+
+
+def render_inline(text: str) -> str:
+    """インライン要素を変換（Markdown以外の文字列・HTMLはそのまま残す）"""
+    if '`' in text:
+        text = CODE_RE.sub(_replace_code, text)
+    if '[' in text:
+        if '!' in text:
+            text = IMAGE_RE.sub(_replace_image, text)
+        text = LINK_RE.sub(_replace_link, text)
+    if '*' in text:
+        # 日本語のテキストでは '***' のような部分文字列の検索が遅いため、有無は正規表現の走査で調べる
+        if '**' in text:
+            text = STRONG_EM_RE.sub(_replace_strong_em, text)
+            text = STRONG_RE.sub(_replace_strong, text)
+        text = EM_RE.sub(_replace_em, text)
+    return text
+
+
+def _split_row(line: str) -> List[str]:
+    """表の1行をセルに分割"""
+    line = line.strip()
+    if line.startswith('|'):
+        line = line[1:]
+    if line.endswith('|'):
+        line = line[:-1]
+    return [cell.strip() for cell in line.split('|')]
+
+
+class MarkdownRenderer:
+    """行単位の1回走査でMarkdownをHTMLに変換するクラス（変換結果はハッシュでキャッシュ）"""
+
+    def __init__(self, cache_size: int = 256):
+        """
+        初期化
+
+        Args:
+            cache_size: キャッシュする変換結果の件数（0でキャッシュしない）
+        """
+        self.cache_size = cache_size
+        self._cache: 'OrderedDict[str, str]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def render(self, markdown_text: str) -> str:
+        """
+        MarkdownをHTMLに変換（同じ本文はキャッシュから返す）
+
+        Args:
+            markdown_text: マークダウンテキスト
+
+        Returns:
+            HTML
+        """
+        if not markdown_text:
+            return ''
+        if not self.cache_size:
+            return self._render(markdown_text)
+
+        key = hashlib.sha256(markdown_text.encode('utf-8')).hexdigest()
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached is not None:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return cached
+            self.misses += 1
+
+        result = self._render(markdown_text)
+        with self._lock:
+            self._cache[key] = result
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return result
+
+    def _render(self, text: str) -> str:
+        """
+        キャッシュを使わずに変換
+
+        ブロック要素の走査ではインライン要素のテキストをそのまま出力の行に置き、最後に出力全体の
+        インライン要素を1回で変換する（コードブロックとHTMLは SEGMENT の位置に後から埋め込む）
+        """
+        if '\r' in text:
+            text = text.replace('\r\n', '\n').replace('\r', '\n')
+        if SEGMENT in text:
+            text = text.replace(SEGMENT, '')
+        out: List[str] = []
+        # インライン要素を変換しない部分（out 内の SEGMENT と同じ順）
+        verbatim: List[str] = []
+        paragraph: List[str] = []
+        quote: List[str] = []
+        # 開いているリスト（インデント幅, タグ）のスタック
+        lists: List[tuple] = []
+        fence: Optional[str] = None
+        fence_open = ''
+        code: List[str] = []
+
+        # インライン要素は改行をまたがないため、同じブロック内の行・セルの区切りにも改行を入れる
+        def close_paragraph():
+            out.append('<p>' + '<br />\n'.join(paragraph) + '</p>')
+            paragraph.clear()
+
+        def close_quote():
+            out.append('<blockquote><p>' + '<br />\n'.join(quote) + '</p></blockquote>')
+            quote.clear()
+
+        def close_lists(indent: int = -1):
+            while lists and lists[-1][0] > indent:
+                out[-1] += f'</li></{lists.pop()[1]}>'
+
+        def close_code():
+            out.append(fence_open + SEGMENT + '</code></pre>')
+            verbatim.append(html.escape('\n'.join(code)))
+            code.clear()
+
+        def add_table(header_line: str, rows: List[str]):
+            header = _split_row(header_line)
+            columns = len(header)
+            out.append('<table><thead><tr><th>' + '</th>\n<th>'.join(header) + '</th></tr></thead><tbody>')
+            for row in rows:
+                cells = _split_row(row)
+                if len(cells) != columns:
+                    cells = (cells + [''] * columns)[:columns]
+                out.append('<tr><td>' + '</td>\n<td>'.join(cells) + '</td></tr>')
+            out.append('</tbody></table>')
+
+        def close_all():
+            if paragraph:
+                close_paragraph()
+            if quote:
+                close_quote()
+            if lists:
+                close_lists()
+
+        # 空行で区切ったまとまりごとに処理し、1行の段落・見出しと単純な箇条書き・表は
+        # 行単位の判定を省略する（区切りの位置には空行が1行あったものとして扱う）
+        for chunk in text.split('\n\n'):
+            if fence is not None:
+                code.append('')
+            elif paragraph or quote or lists:
+                if paragraph:
+                    close_paragraph()
+                if quote:
+                    close_quote()
+                # 空行を挟んだ続きの項目は同じリストとして扱う
+                if lists and not LIST_RE.match(chunk.partition('\n')[0]):
+                    close_lists()
+
+            if fence is None and chunk:
+                first = chunk[0]
+                if '\n' not in chunk:
+                    # 直前の区切りで段落・引用・（続きでない）リストは閉じている
+                    if first not in BLOCK_MARKERS and first not in ' \t' and '|' not in chunk:
+                        out.append(f'<p>{chunk.strip()}</p>')
+                        continue
+                    # 末尾に空白・# がなければ HEADING_RE と同じく残り全体が見出し
+                    if first == '#' and not lists and chunk[-1] not in '# \t':
+                        heading = chunk.lstrip('#')
+                        level = len(chunk) - len(heading)
+                        if level <= 6 and heading[0] in ' \t':
+                            open_tag, close_tag = HEADING_TAGS[level]
+                            out.append(open_tag + heading.lstrip(' \t') + close_tag)
+                            continue
+                elif (first == '-' and chunk[1:2] == ' ' and not lists and '|' not in chunk
+                        and chunk.count('\n- ') == chunk.count('\n')):
+                    # 字下げのない「- 」だけの箇条書き
+                    items = chunk[2:].split('\n- ')
+                    if chunk[2:3] in (' ', '\t') or '\n- \t' in chunk or '\n-  ' in chunk:
+                        items = [item.lstrip(' \t') for item in items]
+                    out.append('<ul>\n<li>' + '</li>\n<li>'.join(items))
+                    lists.append((0, 'ul'))
+                    continue
+                elif first == '|':
+                    # 全体が1つの表のまとまり
+                    lines = chunk.split('\n')
+                    if (TABLE_SEP_RE.match(lines[1]) and '-' in lines[1]
+                            and all('|' in row for row in lines[2:])):
+                        add_table(lines[0], lines[2:])
+                        continue
+
+            lines = chunk.split('\n')
+            i = 0
+            n = len(lines)
+            while i < n:
+                line = lines[i]
+                i += 1
+
+                # コードブロック内
+                if fence is not None:
+                    if line.strip().startswith(fence):
+                        close_code()
+                        fence = None
+                    else:
+                        code.append(line)
+                    continue
+
+                stripped = line.strip()
+                if not stripped:
+                    if paragraph:
+                        close_paragraph()
+                    if quote:
+                        close_quote()
+                    # 空行を挟んだ続きの項目は同じリストとして扱う
+                    if lists and not (i < n and LIST_RE.match(lines[i])):
+                        close_lists()
+                    continue
+
+                first = stripped[0]
+                if first not in BLOCK_MARKERS and '|' not in line:
+                    # 段落の行（ブロック要素の判定を省略）
+                    if lists and line[0] in ' \t':
+                        # リスト項目の継続行
+                        out[-1] += '<br />\n' + stripped
+                        continue
+                    if quote:
+                        close_quote()
+                    if lists:
+                        close_lists()
+                    paragraph.append(stripped)
+                    continue
+
+                # 行頭の文字で判定するブロック要素を絞り込む
+                if first in '`~':
+                    match = FENCE_RE.match(line)
+                    if match:
+                        close_all()
+                        fence = match.group(1)
+                        lang = match.group(2)
+                        fence_open = f'<pre><code class="language-{_escape(lang)}">' if lang else '<pre><code>'
+                        continue
+
+                if first == '#':
+                    match = HEADING_RE.match(line)
+                    if match:
+                        close_all()
+                        open_tag, close_tag = HEADING_TAGS[len(match.group(1))]
+                        out.append(open_tag + match.group(2) + close_tag)
+                        continue
+
+                if first in '-*_' and HR_RE.match(line) and not LIST_RE.match(line):
+                    close_all()
+                    out.append('<hr />')
+                    continue
+
+                # 表（ヘッダー行の次が区切り行）
+                if '|' in line and i < n and TABLE_SEP_RE.match(lines[i]) and '-' in lines[i]:
+                    close_all()
+                    start = i + 1
+                    i = start
+                    while i < n and '|' in lines[i] and lines[i].strip():
+                        i += 1
+                    add_table(line, lines[start:i])
+                    continue
+
+                match = LIST_RE.match(line) if first in LIST_MARKERS else None
+                if match:
+                    if paragraph:
+                        close_paragraph()
+                    if quote:
+                        close_quote()
+                    indent = len(match.group(1).expandtabs(4))
+                    tag = 'ul' if match.group(2) in ('-', '*', '+') else 'ol'
+                    close_lists(indent)
+                    if lists and lists[-1][0] == indent:
+                        if lists[-1][1] == tag:
+                            out[-1] += '</li>'
+                        else:
+                            out[-1] += f'</li></{lists.pop()[1]}>'
+                    if not lists or lists[-1][0] < indent:
+                        start = ''
+                        if tag == 'ol':
+                            number = int(match.group(2)[:-1])
+                            start = f' start="{number}"' if number != 1 else ''
+                        out.append(f'<{tag}{start}>')
+                        lists.append((indent, tag))
+                    out.append('<li>' + match.group(3))
+                    continue
+
+                match = QUOTE_RE.match(line) if first == '>' else None
+                if match:
+                    if paragraph:
+                        close_paragraph()
+                    if lists:
+                        close_lists()
+                    quote.append(match.group(1))
+                    continue
+
+                if first == '<' and not paragraph and HTML_BLOCK_RE.match(line):
+                    # HTMLはそのまま出力（アフィリエイトタグなど）
+                    close_all()
+                    out.append(SEGMENT)
+                    verbatim.append(line)
+                    continue
+
+                if lists and line[0] in ' \t':
+                    # リスト項目の継続行
+                    out[-1] += '<br />\n' + stripped
+                    continue
+
+                if quote:
+                    close_quote()
+                if lists:
+                    close_lists()
+                paragraph.append(stripped)
+
+        if fence is not None:
+            close_code()
+        close_all()
+
+        # 生成したタグには * [ ` ! を含めないため、インライン要素の変換はテキストの部分だけに効く
+        result = render_inline('\n'.join(out))
+        if not verbatim:
+            return result
+        verbatim.append('')
+        return ''.join(chain.from_iterable(zip(result.split(SEGMENT), verbatim)))
+
+    def get_stats(self) -> dict:
+        """キャッシュの利用状況"""
+        with self._lock:
+            return {'entries': len(self._cache), 'hits': self.hits, 'misses': self.misses}
+
+
+_shared_renderer = MarkdownRenderer()
+
+
+def render_markdown(markdown_text: str) -> str:
+    """プロセス内で共有するレンダラーでMarkdownをHTMLに変換"""
+    return _shared_renderer.render(markdown_text)
+
+
+def get_markdown_renderer() -> MarkdownRenderer:
+    """プロセス内で共有するMarkdownRendererを取得"""
+    return _shared_renderer
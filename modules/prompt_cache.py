@@ -0,0 +1,94 @@
+"""
+プロンプトキャッシュの利用状況集計
+プロバイダーが返すusageからキャッシュ済み入力トークンを集計し、ヒット率をログに出す
+"""
+import threading
+import logging
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+def _get(obj: Any, key: str, default=None):
+    """dict・SDKオブジェクトのどちらからでも値を取得"""
+    if obj is None:
+        return default
+    if isinstance(obj, dict):
+        return obj.get(key, default)
+    return getattr(obj, key, default)
+
+
+class PromptCacheStats:
+    """プロバイダー別のプロンプトキャッシュ利用状況"""
+
+    def __init__(self):
+        self._stats: Dict[str, Dict[str, int]] = {}
+        self._lock = threading.Lock()
+
+    def record(self, provider: str, input_tokens: int, cached_tokens: int,
+               cache_write_tokens: int = 0):
+        """
+        1リクエスト分の入力トークン数を記録
+
+        Args:
+            provider: プロバイダー名
+            input_tokens: 入力トークン総数（キャッシュ分を含む）
+            cached_tokens: キャッシュから読み込まれた入力トークン数
+            cache_write_tokens: 新たにキャッシュへ書き込まれたトークン数
+        """
+        with self._lock:
+            stats = self._stats.setdefault(provider, {
+                'requests': 0,
+                'input_tokens': 0,
+                'cached_tokens': 0,
+                'cache_write_tokens': 0
+            })
+            stats['requests'] += 1
+            stats['input_tokens'] += input_tokens
+            stats['cached_tokens'] += cached_tokens
+            stats['cache_write_tokens'] += cache_write_tokens
+            total_rate = stats['cached_tokens'] / stats['input_tokens'] if stats['input_tokens'] else 0
+
+        logger.info(
+            f"プロンプトキャッシュ [{provider}]: 今回 {cached_tokens}/{input_tokens} トークン"
+            f"（書き込み {cache_write_tokens}）, 累計ヒット率 {total_rate:.1%}"
+        )
+
+    def record_openai_usage(self, provider: str, usage: Any):
+        """OpenAI互換APIのusageを記録（prompt_tokens_details.cached_tokens）"""
+        if not usage:
+            return
+        input_tokens = _get(usage, 'prompt_tokens', 0) or 0
+        details = _get(usage, 'prompt_tokens_details')
+        cached_tokens = _get(details, 'cached_tokens', 0) or 0
+        self.record(provider, input_tokens, cached_tokens)
+
+    def record_anthropic_usage(self, usage: Any):
+        """Anthropic APIのusageを記録（input_tokensはキャッシュ分を含まない）"""
+        if not usage:
+            return
+        cache_read = _get(usage, 'cache_read_input_tokens', 0) or 0
+        cache_write = _get(usage, 'cache_creation_input_tokens', 0) or 0
+        uncached = _get(usage, 'input_tokens', 0) or 0
+        self.record('claude', uncached + cache_read + cache_write, cache_read, cache_write)
+
+    def get_stats(self, provider: Optional[str] = None) -> Dict:
+        """集計結果を取得（hit_rateを含む）"""
+        with self._lock:
+            result = {}
+            for name, stats in self._stats.items():
+                if provider and name != provider:
+                    continue
+                result[name] = {
+                    **stats,
+                    'hit_rate': stats['cached_tokens'] / stats['input_tokens'] if stats['input_tokens'] else 0
+                }
+            return result
+
+
+_shared_stats = PromptCacheStats()
+
+
+def get_prompt_cache_stats() -> PromptCacheStats:
+    """プロセス内で共有するPromptCacheStatsを取得"""
+    return _shared_stats
@@ -0,0 +1,99 @@
+"""
+プロバイダー別の同時実行数制御
+OpenAI・Venice・Gemini・WordPressホストごとに同時リクエスト数の上限を設ける
+"""
+import json
+import threading
+import logging
+from contextlib import contextmanager
+from typing import Dict, Optional
+from urllib.parse import urlparse
+
+logger = logging.getLogger(__name__)
+
+
+class ProviderLimiter:
+    """プロバイダーごとのセマフォで同時実行数を制限するクラス"""
+
+    # config/automation_settings.json の global.concurrency で上書き可能
+    DEFAULT_LIMITS = {
+        'openai': 3,
+        'claude': 2,
+        'venice': 2,
+        'gemini': 2,
+        'gpt_image': 2,
+        'unsplash': 2,
+        'wordpress': 2  # ホストごとの上限
+    }
+
+    def __init__(self, limits: Optional[Dict[str, int]] = None):
+        """
+        初期化
+
+        Args:
+            limits: プロバイダー名 → 同時実行数上限
+        """
+        self.limits = dict(self.DEFAULT_LIMITS)
+        if limits:
+            self.limits.update({k: max(1, int(v)) for k, v in limits.items()})
+        self._semaphores: Dict[str, threading.BoundedSemaphore] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config_path: str = 'config/automation_settings.json') -> 'ProviderLimiter':
+        """自動化設定ファイルから上限を読み込んで生成"""
+        limits = {}
+        try:
+            with open(config_path, 'r', encoding='utf-8') as f:
+                settings = json.load(f)
+            limits = settings.get('global', {}).get('concurrency', {}).get('providers', {})
+        except Exception as e:
+            logger.warning(f"同時実行数設定の読み込みエラー（デフォルト値を使用）: {str(e)}")
+        return cls(limits)
+
+    def get_limit(self, provider: str) -> int:
+        """プロバイダーの同時実行数上限を取得（未定義のプロバイダーは1）"""
+        return self.limits.get(provider, 1)
+
+    def _get_semaphore(self, provider: str, key: Optional[str] = None) -> threading.BoundedSemaphore:
+        name = f"{provider}:{key}" if key else provider
+        with self._lock:
+            if name not in self._semaphores:
+                self._semaphores[name] = threading.BoundedSemaphore(self.get_limit(provider))
+            return self._semaphores[name]
+
+    @contextmanager
+    def slot(self, provider: str, key: Optional[str] = None):
+        """
+        同時実行枠を確保するコンテキストマネージャー
+
+        Args:
+            provider: プロバイダー名（openai, venice, gemini, wordpress など）
+            key: 同じプロバイダー内で枠を分けるキー（WordPressのホスト名など）
+        """
+        semaphore = self._get_semaphore(provider, key)
+        semaphore.acquire()
+        try:
+            yield
+        finally:
+            semaphore.release()
+
+    @contextmanager
+    def wordpress_slot(self, site_url: str):
+        """WordPressホストごとの同時実行枠を確保"""
+        host = urlparse(site_url).netloc or site_url
+        with self.slot('wordpress', host):
+            yield
+
+
+_shared_limiter: Optional[ProviderLimiter] = None
+_shared_lock = threading.Lock()
+
+
+def get_provider_limiter() -> ProviderLimiter:
+    """プロセス内で共有するProviderLimiterを取得"""
+    global _shared_limiter
+    with _shared_lock:
+        if _shared_limiter is None:
+            _shared_limiter = ProviderLimiter.from_config()
+        return _shared_limiter
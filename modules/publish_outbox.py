@@ -0,0 +1,255 @@
+"""
+投稿アウトボックス
+WordPressへの投稿を pending → media_uploaded → posted → confirmed の段階で永続化し、
+タイムアウト後の再試行で同じ記事が二重に投稿されないようにする
+"""
+import time
+import sqlite3
+import hashlib
+import threading
+import logging
+from contextlib import nullcontext
+from datetime import datetime
+from typing import Callable, ContextManager, Dict, List, Optional
+from .article_store import ArticleStore
+
+logger = logging.getLogger(__name__)
+
+STATES = ('pending', 'media_uploaded', 'posted', 'confirmed')
+
+
+def idempotency_key_for(article: Dict) -> str:
+    """記事ごとの冪等キー（サイトIDと記事IDから決まるため、アウトボックスが失われても同じ値になる）"""
+    source = f"{article.get('site_id', '')}:{article['id']}"
+    return hashlib.sha256(source.encode('utf-8')).hexdigest()[:24]
+
+
+class PublishOutbox:
+    """記事投稿の進行状況を記事ストアと同じデータベースに保存するクラス"""
+
+    # 投稿処理の占有期限（秒）。期限切れの占有は異常終了とみなして再開できる
+    CLAIM_SECONDS = 600
+
+    def __init__(self, article_store: Optional[ArticleStore] = None):
+        """
+        初期化
+
+        Args:
+            article_store: 記事ストア（投稿完了時のステータス更新とデータベースの場所に使用）
+        """
+        self.article_store = article_store or ArticleStore()
+        self.db_path = self.article_store.db_path
+        self._local = threading.local()
+        self._init_db()
+
+    def _get_connection(self) -> sqlite3.Connection:
+        """スレッドごとの接続を取得"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def _init_db(self):
+        """テーブルを作成"""
+        conn = self._get_connection()
+        with conn:
+            conn.executescript('''
+                CREATE TABLE IF NOT EXISTS publish_outbox (
+                    article_id TEXT PRIMARY KEY,
+                    site_id TEXT,
+                    state TEXT NOT NULL,
+                    idempotency_key TEXT NOT NULL,
+                    media_id INTEGER,
+                    wordpress_id INTEGER,
+                    wordpress_url TEXT,
+                    post_status TEXT,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    last_error TEXT,
+                    claimed_until REAL,
+                    created_at TEXT,
+                    updated_at TEXT
+                );
+                CREATE INDEX IF NOT EXISTS idx_outbox_state
+                    ON publish_outbox(state, updated_at);
+            ''')
+            # post_status 列がない以前のデータベースに追加
+            columns = {row['name'] for row in conn.execute('PRAGMA table_info(publish_outbox)')}
+            if 'post_status' not in columns:
+                conn.execute('ALTER TABLE publish_outbox ADD COLUMN post_status TEXT')
+
+    def get_entry(self, article_id: str) -> Optional[Dict]:
+        """記事IDでエントリを取得"""
+        row = self._get_connection().execute(
+            'SELECT * FROM publish_outbox WHERE article_id = ?', (article_id,)
+        ).fetchone()
+        return dict(row) if row else None
+
+    def list_entries(self, state: Optional[str] = None, site_id: Optional[str] = None,
+                     limit: int = 100) -> List[Dict]:
+        """エントリを更新日時の新しい順に取得"""
+        clauses, params = [], []
+        if state:
+            clauses.append('state = ?')
+            params.append(state)
+        if site_id:
+            clauses.append('site_id = ?')
+            params.append(site_id)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+        rows = self._get_connection().execute(
+            f'SELECT * FROM publish_outbox {where} ORDER BY updated_at DESC LIMIT ?',
+            params + [int(limit)]
+        ).fetchall()
+        return [dict(row) for row in rows]
+
+    def _ensure_entry(self, article: Dict) -> Dict:
+        """記事のエントリを取得（なければ pending で作成）"""
+        now = datetime.now().isoformat()
+        conn = self._get_connection()
+        with conn:
+            conn.execute(
+                '''
+                INSERT OR IGNORE INTO publish_outbox
+                    (article_id, site_id, state, idempotency_key, created_at, updated_at)
+                VALUES (?, ?, 'pending', ?, ?, ?)
+                ''',
+                (article['id'], article.get('site_id'), idempotency_key_for(article), now, now)
+            )
+        return self.get_entry(article['id'])
+
+    def _update(self, article_id: str, **fields) -> Dict:
+        """エントリを更新して更新後の内容を返す"""
+        fields['updated_at'] = datetime.now().isoformat()
+        assignments = ', '.join(f'{key} = ?' for key in fields)
+        conn = self._get_connection()
+        with conn:
+            conn.execute(
+                f'UPDATE publish_outbox SET {assignments} WHERE article_id = ?',
+                list(fields.values()) + [article_id]
+            )
+        return self.get_entry(article_id)
+
+    def _claim(self, article_id: str) -> bool:
+        """投稿処理を占有（別のワーカー・プロセスが処理中ならFalse）"""
+        now = time.time()
+        conn = self._get_connection()
+        with conn:
+            cursor = conn.execute(
+                '''
+                UPDATE publish_outbox SET claimed_until = ?
+                WHERE article_id = ? AND (claimed_until IS NULL OR claimed_until < ?)
+                ''',
+                (now + self.CLAIM_SECONDS, article_id, now)
+            )
+        return cursor.rowcount == 1
+
+    def _release(self, article_id: str):
+        """占有を解除"""
+        conn = self._get_connection()
+        with conn:
+            conn.execute('UPDATE publish_outbox SET claimed_until = NULL WHERE article_id = ?', (article_id,))
+
+    @staticmethod
+    def _result(entry: Dict, title: str = '', status: str = 'publish') -> Dict:
+        """publish_post と同じ形式の結果（投稿のステータスが未記録なら指定したステータス）"""
+        return {
+            'id': entry['wordpress_id'],
+            'link': entry['wordpress_url'],
+            'title': title,
+            'status': entry.get('post_status') or status
+        }
+
+    def publish(self,
+                publisher,
+                article: Dict,
+                upload_media: Optional[Callable[[], Optional[int]]] = None,
+                categories: Optional[List[int]] = None,
+                status: str = 'publish',
+                request_slot: Optional[Callable[[], ContextManager]] = None) -> Optional[Dict]:
+        """
+        記事を投稿（前回の続きの段階から再開し、投稿済みなら再投稿しない）
+
+        投稿を確認した時点で記事ストアのステータス・URL・公開日時も更新するため、
+        呼び出し元で記事を更新する必要はない
+
+        Args:
+            publisher: WordPressPublisher
+            article: 記事データ（id・site_id 必須）
+            upload_media: アイキャッチ画像を用意してメディアIDを返す関数（pending の場合のみ呼ばれる）
+            categories: カテゴリIDのリスト
+            status: 投稿ステータス
+            request_slot: 投稿・確認リクエストを囲むコンテキストを返す関数（同時実行数の制御用）
+
+        Returns:
+            投稿結果（id, link, title, status）、失敗時や他のワーカーが処理中の場合はNone
+        """
+        article_id = article['id']
+        entry = self._ensure_entry(article)
+        if entry['state'] == 'confirmed':
+            logger.info(f"投稿済みのためスキップ: {article_id} → {entry['wordpress_url']}")
+            return self._result(entry, article.get('title', ''), status)
+
+        if not self._claim(article_id):
+            logger.warning(f"別の処理が投稿中です: {article_id}")
+            return None
+
+        request_slot = request_slot or nullcontext
+        try:
+            key = entry['idempotency_key']
+
+            # 前回の投稿がタイムアウト等で結果不明の場合は、WordPress側に投稿があるか確認
+            if entry['state'] in ('pending', 'media_uploaded') and entry['attempts'] > 0:
+                with request_slot():
+                    existing = publisher.find_post_by_idempotency_key(key)
+                if existing:
+                    logger.info(f"前回の試行で投稿済みでした: {existing['link']}")
+                    entry = self._update(article_id, state='posted', wordpress_id=existing['id'],
+                                         wordpress_url=existing['link'], post_status=existing.get('status'))
+
+            if entry['state'] == 'pending':
+                media_id = upload_media() if upload_media else None
+                entry = self._update(article_id, state='media_uploaded', media_id=media_id)
+
+            if entry['state'] == 'media_uploaded':
+                entry = self._update(article_id, attempts=entry['attempts'] + 1)
+                with request_slot():
+                    result = publisher.publish_post(
+                        title=article.get('title', 'Untitled'),
+                        content=article.get('content', ''),
+                        excerpt=article.get('excerpt', ''),
+                        categories=categories,
+                        tags=article.get('tags', []),
+                        featured_media_id=entry['media_id'],
+                        status=status,
+                        idempotency_key=key
+                    )
+                    if not result:
+                        # レスポンスを受け取れなかっただけで投稿されている場合がある
+                        result = publisher.find_post_by_idempotency_key(key)
+                if not result:
+                    self._update(article_id, last_error='投稿失敗')
+                    return None
+                entry = self._update(article_id, state='posted', wordpress_id=result['id'],
+                                     wordpress_url=result['link'], post_status=result.get('status'))
+
+            if entry['state'] == 'posted':
+                self.article_store.update_fields(
+                    article_id,
+                    status='公開済み',
+                    wordpress_url=entry['wordpress_url'],
+                    wordpress_id=entry['wordpress_id'],
+                    published_at=datetime.now().isoformat()
+                )
+                entry = self._update(article_id, state='confirmed', last_error=None)
+
+            return self._result(entry, article.get('title', ''), status)
+
+        except Exception as e:
+            logger.error(f"アウトボックス投稿エラー ({article_id}): {str(e)}")
+            self._update(article_id, last_error=str(e))
+            return None
+        finally:
+            self._release(article_id)
@@ -0,0 +1,132 @@
+"""
+投稿スロット計画
+smart_scheduling の設定からサイトごとの1日の投稿時刻を算出し、
+ピーク前に生成しておいた記事（公開待ちバッファ）をスロット時刻に投稿する
+"""
+import logging
+from datetime import datetime, date, time as dtime, timedelta
+from typing import Dict, List, Optional
+from .article_store import ArticleStore
+
+logger = logging.getLogger(__name__)
+
+# 生成済みでスロット投稿を待っている記事のステータス
+READY_STATUS = '公開待ち'
+
+
+class PublishPlanner:
+    """サイトごとの投稿スロットを算出するクラス"""
+
+    def __init__(self, config: Dict):
+        """
+        初期化
+
+        Args:
+            config: automation_settings.json の内容（global と sites を参照）
+        """
+        self.config = config
+
+    def _setting(self, site_id: str, key: str, default=None):
+        """サイト設定 → global.smart_scheduling → global の順で設定値を取得"""
+        site_config = self.config.get('sites', {}).get(site_id, {})
+        for source in (site_config.get('smart_scheduling', {}), site_config):
+            if key in source:
+                return source[key]
+        smart = self.config.get('global', {}).get('smart_scheduling', {})
+        if key in smart:
+            return smart[key]
+        return self.config.get('global', {}).get(key, default)
+
+    def is_enabled(self, site_id: str) -> bool:
+        """スマートスケジューリングが有効か"""
+        site_smart = self.config.get('sites', {}).get(site_id, {}).get('smart_scheduling', {})
+        global_smart = self.config.get('global', {}).get('smart_scheduling', {})
+        return bool(site_smart.get('enabled', global_smart.get('enabled', False)))
+
+    def buffer_size(self, site_id: str) -> int:
+        """公開待ちバッファに確保しておく記事数"""
+        return max(1, int(self._setting(site_id, 'ready_buffer_size', 2)))
+
+    def generation_lead(self, site_id: str) -> timedelta:
+        """スロット直前の生成を避ける時間（この時間内はピーク帯として扱う）"""
+        return timedelta(minutes=int(self._setting(site_id, 'generation_lead_minutes', 20)))
+
+    def slots_for_day(self, site_id: str, day: date) -> List[datetime]:
+        """
+        指定日の投稿スロットを算出
+
+        ピーク時間を優先し、1日の上限に満たない分は営業時間内に均等に配置する
+
+        Returns:
+            投稿時刻のリスト（昇順）
+        """
+        if self._setting(site_id, 'avoid_weekends', False) and day.weekday() >= 5:
+            return []
+
+        hours = self._setting(site_id, 'operation_hours', {'start': 0, 'end': 24})
+        start_hour, end_hour = hours.get('start', 0), hours.get('end', 24)
+        max_per_day = int(self._setting(site_id, 'max_articles_per_day', 1))
+        day_start = datetime.combine(day, dtime())
+
+        slot_minutes = []
+        for hour in sorted(self._setting(site_id, 'peak_hours', []) or []):
+            if start_hour <= hour < end_hour and len(slot_minutes) < max_per_day:
+                slot_minutes.append(hour * 60)
+
+        # 残りは営業時間を等分した区間の中央に配置
+        extra = max_per_day - len(slot_minutes)
+        span = (end_hour - start_hour) * 60
+        for k in range(extra):
+            minute = start_hour * 60 + int((k + 0.5) * span / extra)
+            while minute in slot_minutes:
+                minute += 1
+            slot_minutes.append(minute)
+
+        return sorted(day_start + timedelta(minutes=m) for m in slot_minutes)
+
+    def next_slot(self, site_id: str, after: Optional[datetime] = None) -> Optional[datetime]:
+        """after より後の最初の投稿スロット（1週間先まで探索）"""
+        after = after or datetime.now()
+        for offset in range(8):
+            for slot in self.slots_for_day(site_id, after.date() + timedelta(days=offset)):
+                if slot > after:
+                    return slot
+        return None
+
+    def can_generate(self, site_id: str, now: datetime, next_slot: Optional[datetime]) -> bool:
+        """ピーク帯（次のスロット直前）でなければ生成してよい"""
+        if next_slot is None:
+            return True
+        return next_slot - now > self.generation_lead(site_id)
+
+
+class ReadyBuffer:
+    """
+    サイトごとの公開待ち記事バッファ
+
+    記事ストアに READY_STATUS で保存するため、再起動後もバッファは維持される
+    """
+
+    def __init__(self, article_store: ArticleStore):
+        self.article_store = article_store
+
+    def size(self, site_id: str) -> int:
+        """公開待ち記事数"""
+        return self.article_store.count_articles(site_id=site_id, status=READY_STATUS)
+
+    def add(self, article: Dict):
+        """記事を公開待ちとして保存"""
+        article['status'] = READY_STATUS
+        self.article_store.add_article(article)
+
+    def peek(self, site_id: str) -> Optional[Dict]:
+        """最も古い公開待ち記事"""
+        articles = self.article_store.list_articles(
+            site_id=site_id, status=READY_STATUS, limit=1, oldest_first=True
+        )
+        return articles[0] if articles else None
+
+    def release(self, article: Dict):
+        """投稿に失敗した記事を下書きに戻してバッファから外す"""
+        article['status'] = '下書き'
+        self.article_store.update_article(article)
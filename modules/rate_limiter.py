@@ -0,0 +1,414 @@
+"""
+プロバイダー別のレート制限
+OpenAI・Claude・Venice・Gemini・Unsplash・WordPressホストごとのトークンバケットを
+SQLiteファイルに保存し、Flaskアプリと自動運用デーモンの間で共有する。
+429 や Retry-After を受け取った場合はバケットの補充速度を下げて待機し、成功が続けば元に戻す
+"""
+import os
+import json
+import time
+import random
+import sqlite3
+import threading
+import logging
+from datetime import datetime
+from email.utils import parsedate_to_datetime
+from typing import Any, Callable, Dict, List, Optional
+from urllib.parse import urlparse
+
+logger = logging.getLogger(__name__)
+
+# レート制限を示すHTTPステータス
+THROTTLE_STATUSES = (429, 503)
+
+
+def _retry_after_from(headers) -> Optional[float]:
+    """Retry-After ヘッダー（秒数またはHTTP日付）を秒数に変換"""
+    if not headers:
+        return None
+    try:
+        value = headers.get('Retry-After') or headers.get('retry-after')
+    except Exception:
+        return None
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except Exception:
+        return None
+
+
+class RateLimiter:
+    """プロセス間で共有するトークンバケットで送信レートを制御するクラス"""
+
+    # 1秒あたりの補充数（rate）とバケット容量（burst）。
+    # config/automation_settings.json の global.rate_limits で上書き可能
+    DEFAULT_RATES = {
+        'openai': {'rate': 1.0, 'burst': 5},
+        'claude': {'rate': 0.5, 'burst': 3},
+        'venice': {'rate': 0.5, 'burst': 3},
+        'gemini': {'rate': 0.5, 'burst': 3},
+        'gpt_image': {'rate': 0.2, 'burst': 2},
+        'unsplash': {'rate': 50 / 3600, 'burst': 5},
+        'wordpress': {'rate': 2.0, 'burst': 5}  # ホストごと
+    }
+
+    # 制限を受けたときの補充速度の倍率と、成功1回ごとに戻す量（基準速度に対する割合）
+    BACKOFF_FACTOR = 0.5
+    RECOVERY_STEP = 0.1
+    # 補充速度の下限（基準速度に対する割合）
+    MIN_RATE_RATIO = 0.05
+    # Retry-After がない場合の待機時間（秒）の初期値と上限
+    BASE_BACKOFF = 2.0
+    MAX_BACKOFF = 120.0
+    # 1回の待機の上限（他プロセスの更新を反映するため短く区切る）
+    MAX_SLEEP = 5.0
+
+    def __init__(self, db_path: str = 'data/rate_limits.db',
+                 rates: Optional[Dict[str, Dict]] = None):
+        """
+        初期化
+
+        Args:
+            db_path: 状態を共有するSQLiteデータベースのパス
+            rates: プロバイダー名 → {'rate': 1秒あたりの回数, 'burst': 連続送信できる回数}
+        """
+        self.db_path = db_path
+        self.rates = {name: dict(value) for name, value in self.DEFAULT_RATES.items()}
+        for name, value in (rates or {}).items():
+            self.rates.setdefault(name, {}).update(value)
+        self._local = threading.local()
+        # 補充速度を下げている最中のバケット（成功時の書き込みをこのバケットに限定する）
+        self._degraded: Dict[str, float] = {}
+        self._degraded_lock = threading.Lock()
+        os.makedirs(os.path.dirname(self.db_path) or '.', exist_ok=True)
+        self._init_db()
+
+    @classmethod
+    def from_config(cls, config_path: str = 'config/automation_settings.json') -> 'RateLimiter':
+        """自動化設定ファイルからレートを読み込んで生成"""
+        rates = {}
+        try:
+            with open(config_path, 'r', encoding='utf-8') as f:
+                settings = json.load(f)
+            rates = settings.get('global', {}).get('rate_limits', {})
+        except Exception as e:
+            logger.warning(f"レート制限設定の読み込みエラー（デフォルト値を使用）: {str(e)}")
+        return cls(rates=rates)
+
+    def _get_connection(self) -> sqlite3.Connection:
+        """スレッドごとの接続を取得（トランザクションは明示的に開始する）"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def _init_db(self):
+        """テーブルを作成"""
+        self._get_connection().executescript('''
+            CREATE TABLE IF NOT EXISTS buckets (
+                name TEXT PRIMARY KEY,
+                tokens REAL NOT NULL,
+                rate REAL NOT NULL,
+                updated_at REAL NOT NULL,
+                blocked_until REAL NOT NULL DEFAULT 0,
+                backoff REAL NOT NULL DEFAULT 0
+            );
+            CREATE TABLE IF NOT EXISTS bucket_metrics (
+                name TEXT PRIMARY KEY,
+                requests INTEGER NOT NULL DEFAULT 0,
+                waits INTEGER NOT NULL DEFAULT 0,
+                wait_seconds REAL NOT NULL DEFAULT 0,
+                throttled INTEGER NOT NULL DEFAULT 0,
+                retries INTEGER NOT NULL DEFAULT 0,
+                failures INTEGER NOT NULL DEFAULT 0,
+                last_throttled_at TEXT
+            );
+        ''')
+
+    def _write(self, callback: Callable[[sqlite3.Connection], Any]) -> Any:
+        """書き込みロックを取得したトランザクション内で処理を実行"""
+        conn = self._get_connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            result = callback(conn)
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+        return result
+
+    @staticmethod
+    def bucket_name(provider: str, key: Optional[str] = None) -> str:
+        """バケット名（WordPressはURLからホスト名を取り出す）"""
+        if not key:
+            return provider
+        host = urlparse(key).netloc if '://' in key else key
+        return f"{provider}:{host}"
+
+    def _limits(self, provider: str) -> Dict[str, float]:
+        """プロバイダーの基準レートと容量（未定義のプロバイダーは1回/秒）"""
+        config = self.rates.get(provider, {})
+        return {
+            'rate': max(0.001, float(config.get('rate', 1.0))),
+            'burst': max(1.0, float(config.get('burst', 1)))
+        }
+
+    @staticmethod
+    def _bump_metrics(conn: sqlite3.Connection, name: str, **deltas):
+        """メトリクスを加算"""
+        conn.execute('INSERT OR IGNORE INTO bucket_metrics (name) VALUES (?)', (name,))
+        last_throttled = deltas.pop('last_throttled_at', None)
+        assignments = ', '.join(f'{key} = {key} + ?' for key in deltas)
+        params = list(deltas.values())
+        if last_throttled:
+            assignments += ', last_throttled_at = ?'
+            params.append(last_throttled)
+        conn.execute(f'UPDATE bucket_metrics SET {assignments} WHERE name = ?', params + [name])
+
+    def acquire(self, provider: str, key: Optional[str] = None) -> float:
+        """
+        送信枠（トークン1つ）を取得するまで待機
+
+        Args:
+            provider: プロバイダー名
+            key: 同じプロバイダー内でバケットを分けるキー（WordPressのサイトURLなど）
+
+        Returns:
+            待機した秒数
+        """
+        name = self.bucket_name(provider, key)
+        limits = self._limits(provider)
+        waited = 0.0
+
+        def take(conn: sqlite3.Connection) -> float:
+            now = time.time()
+            row = conn.execute('SELECT * FROM buckets WHERE name = ?', (name,)).fetchone()
+            if row is None:
+                tokens, rate, blocked_until = limits['burst'], limits['rate'], 0.0
+                conn.execute(
+                    'INSERT INTO buckets (name, tokens, rate, updated_at) VALUES (?, ?, ?, ?)',
+                    (name, tokens, rate, now)
+                )
+            else:
+                # 設定で基準レートが下げられた場合に合わせる
+                rate = min(row['rate'], limits['rate'])
+                blocked_until = row['blocked_until']
+                tokens = min(limits['burst'], row['tokens'] + max(0.0, now - row['updated_at']) * rate)
+
+            self._note_rate(name, rate, limits['rate'])
+            if blocked_until > now:
+                wait = blocked_until - now
+            elif tokens >= 1:
+                conn.execute('UPDATE buckets SET tokens = ?, rate = ?, updated_at = ? WHERE name = ?',
+                             (tokens - 1, rate, now, name))
+                self._bump_metrics(conn, name, requests=1, waits=1 if waited else 0, wait_seconds=waited)
+                return 0.0
+            else:
+                wait = (1 - tokens) / rate
+            conn.execute('UPDATE buckets SET tokens = ?, rate = ?, updated_at = ? WHERE name = ?',
+                         (tokens, rate, now, name))
+            return wait
+
+        while True:
+            wait = self._write(take)
+            if wait <= 0:
+                if waited >= 1:
+                    logger.info(f"レート制限で {waited:.1f}秒待機: {name}")
+                return waited
+            sleep = min(wait, self.MAX_SLEEP)
+            time.sleep(sleep)
+            waited += sleep
+
+    def _note_rate(self, name: str, rate: float, base_rate: float):
+        """補充速度を下げている最中のバケットを記録"""
+        with self._degraded_lock:
+            if rate < base_rate:
+                self._degraded[name] = rate
+            else:
+                self._degraded.pop(name, None)
+
+    def record_throttle(self, provider: str, key: Optional[str] = None,
+                        retry_after: Optional[float] = None) -> float:
+        """
+        制限を受けたことを記録し、補充速度を下げて送信を止める
+
+        Args:
+            retry_after: サーバーが指定した待機秒数（なければ指数バックオフ）
+
+        Returns:
+            送信を止める秒数
+        """
+        name = self.bucket_name(provider, key)
+        limits = self._limits(provider)
+
+        def penalize(conn: sqlite3.Connection) -> float:
+            now = time.time()
+            row = conn.execute('SELECT * FROM buckets WHERE name = ?', (name,)).fetchone()
+            rate = row['rate'] if row else limits['rate']
+            backoff = row['backoff'] if row else 0.0
+            backoff = min(self.MAX_BACKOFF, backoff * 2 if backoff else self.BASE_BACKOFF)
+            delay = retry_after if retry_after is not None else backoff * (0.5 + random.random() / 2)
+            new_rate = max(limits['rate'] * self.MIN_RATE_RATIO, rate * self.BACKOFF_FACTOR)
+            conn.execute(
+                '''
+                INSERT INTO buckets (name, tokens, rate, updated_at, blocked_until, backoff)
+                VALUES (?, 0, ?, ?, ?, ?)
+                ON CONFLICT(name) DO UPDATE SET
+                    tokens = 0, rate = excluded.rate, updated_at = excluded.updated_at,
+                    blocked_until = MAX(blocked_until, excluded.blocked_until), backoff = excluded.backoff
+                ''',
+                (name, new_rate, now, now + delay, backoff)
+            )
+            self._bump_metrics(conn, name, throttled=1, last_throttled_at=datetime.now().isoformat())
+            return delay
+
+        delay = self._write(penalize)
+        self._note_rate(name, 0.0, limits['rate'])
+        logger.warning(f"レート制限を検知: {name}（{delay:.1f}秒停止、送信間隔を拡大）")
+        return delay
+
+    def record_success(self, provider: str, key: Optional[str] = None):
+        """成功を記録し、下げていた補充速度を少しずつ戻す"""
+        name = self.bucket_name(provider, key)
+        with self._degraded_lock:
+            if name not in self._degraded:
+                return
+        limits = self._limits(provider)
+
+        def recover(conn: sqlite3.Connection) -> float:
+            row = conn.execute('SELECT rate FROM buckets WHERE name = ?', (name,)).fetchone()
+            if row is None:
+                return limits['rate']
+            rate = min(limits['rate'], row['rate'] + limits['rate'] * self.RECOVERY_STEP)
+            conn.execute('UPDATE buckets SET rate = ?, backoff = 0 WHERE name = ?', (rate, name))
+            return rate
+
+        self._note_rate(name, self._write(recover), limits['rate'])
+
+    @staticmethod
+    def _throttle_signal(result=None, error: Optional[Exception] = None):
+        """
+        レスポンスまたは例外が制限を示しているか判定
+
+        Returns:
+            (制限を示すか, Retry-After秒数)
+        """
+        if error is not None:
+            status = getattr(error, 'status_code', None) or getattr(error, 'http_status', None)
+            response = getattr(error, 'response', None)
+            if status is None and response is not None:
+                status = getattr(response, 'status_code', None)
+            if status == 429 or 'RateLimit' in type(error).__name__:
+                headers = getattr(error, 'headers', None) or getattr(response, 'headers', None)
+                return True, _retry_after_from(headers)
+            return False, None
+
+        status = getattr(result, 'status_code', None)
+        if status in THROTTLE_STATUSES:
+            headers = getattr(result, 'headers', None)
+            retry_after = _retry_after_from(headers)
+            # 503 は Retry-After がある場合のみ制限とみなす
+            if status == 429 or retry_after is not None:
+                return True, retry_after
+        return False, None
+
+    def call(self, provider: str, send: Callable[[], Any], key: Optional[str] = None,
+             max_retries: int = 3) -> Any:
+        """
+        送信枠を確保して send を実行し、制限された場合は待機して再試行
+
+        Args:
+            provider: プロバイダー名
+            send: リクエストを送信する関数（requests.Response や SDK のレスポンスを返す）
+            key: バケットを分けるキー
+            max_retries: 制限時の再試行回数（0で再試行しない）
+
+        Returns:
+            send の戻り値（再試行を使い切った場合は最後のレスポンス）
+        """
+        name = self.bucket_name(provider, key)
+        attempt = 0
+        while True:
+            self.acquire(provider, key)
+            try:
+                result = send()
+            except Exception as e:
+                throttled, retry_after = self._throttle_signal(error=e)
+                if not throttled:
+                    raise
+                self.record_throttle(provider, key, retry_after)
+                if attempt >= max_retries:
+                    self._record_failure(name)
+                    raise
+            else:
+                throttled, retry_after = self._throttle_signal(result=result)
+                if not throttled:
+                    self.record_success(provider, key)
+                    return result
+                self.record_throttle(provider, key, retry_after)
+                if attempt >= max_retries:
+                    self._record_failure(name)
+                    return result
+                close = getattr(result, 'close', None)
+                if close:
+                    close()
+
+            attempt += 1
+            self._write(lambda conn: self._bump_metrics(conn, name, retries=1))
+
+    def _record_failure(self, name: str):
+        """再試行を使い切ったことを記録"""
+        self._write(lambda conn: self._bump_metrics(conn, name, failures=1))
+        logger.error(f"レート制限が解除されず再試行を中止: {name}")
+
+    def get_metrics(self) -> List[Dict]:
+        """バケットごとの現在の状態と制限回数"""
+        now = time.time()
+        rows = self._get_connection().execute('''
+            SELECT b.name, b.tokens, b.rate, b.blocked_until,
+                   m.requests, m.waits, m.wait_seconds, m.throttled, m.retries, m.failures,
+                   m.last_throttled_at
+            FROM buckets b LEFT JOIN bucket_metrics m ON m.name = b.name
+            ORDER BY b.name
+        ''').fetchall()
+        metrics = []
+        for row in rows:
+            provider = row['name'].split(':', 1)[0]
+            requests_count = row['requests'] or 0
+            metrics.append({
+                'name': row['name'],
+                'base_rate': self._limits(provider)['rate'],
+                'current_rate': round(row['rate'], 4),
+                'blocked_seconds': round(max(0.0, row['blocked_until'] - now), 1),
+                'requests': requests_count,
+                'waits': row['waits'] or 0,
+                'wait_seconds': round(row['wait_seconds'] or 0.0, 1),
+                'throttled': row['throttled'] or 0,
+                'throttle_rate': round((row['throttled'] or 0) / requests_count, 4) if requests_count else 0.0,
+                'retries': row['retries'] or 0,
+                'failures': row['failures'] or 0,
+                'last_throttled_at': row['last_throttled_at']
+            })
+        return metrics
+
+
+_shared_rate_limiter: Optional[RateLimiter] = None
+_shared_lock = threading.Lock()
+
+
+def get_rate_limiter() -> RateLimiter:
+    """プロセス内で共有するRateLimiterを取得（状態はプロセス間でも共有される）"""
+    global _shared_rate_limiter
+    with _shared_lock:
+        if _shared_rate_limiter is None:
+            _shared_rate_limiter = RateLimiter.from_config()
+        return _shared_rate_limiter
@@ -0,0 +1,186 @@
+"""
+サイト別スケジューラー
+サイトごとに次回実行時刻を持つ優先度付きキューで自動サイクルを実行する
+"""
+import heapq
+import threading
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class SiteScheduler:
+    """
+    サイトごとの次回実行時刻を管理し、期限が来たサイトを最大K件まで並行実行するスケジューラー
+
+    ループは次の実行予定時刻まで正確に待機する（ポーリングしない）
+    """
+
+    def __init__(self,
+                 run_job: Callable[[str], Optional[datetime]],
+                 interval_for: Callable[[str], timedelta],
+                 max_concurrent: int = 2,
+                 list_site_ids: Optional[Callable[[], List[str]]] = None,
+                 refresh_interval: timedelta = timedelta(minutes=10)):
+        """
+        初期化
+
+        Args:
+            run_job: サイトIDを受け取ってサイクルを実行する関数。
+                     次回実行時刻を返すとその時刻に、Noneなら interval_for の間隔で再実行する
+            interval_for: サイトIDごとの実行間隔を返す関数
+            max_concurrent: 同時に実行するサイト数の上限
+            list_site_ids: 対象サイトIDの一覧を返す関数（サイトの追加・削除を反映）
+            refresh_interval: list_site_ids を呼び直す間隔
+        """
+        self.run_job = run_job
+        self.interval_for = interval_for
+        self.max_concurrent = max(1, max_concurrent)
+        self.list_site_ids = list_site_ids
+        self.refresh_interval = refresh_interval
+
+        self._heap: List[tuple] = []  # (実行予定時刻, 連番, サイトID)
+        self._scheduled: Dict[str, datetime] = {}  # サイトID → 有効な実行予定時刻
+        self._running: Dict[str, datetime] = {}  # 実行中のサイトID → 予定されていた時刻
+        self._removed_while_running = set()  # 実行中に削除されたサイト（完了後に再登録しない）
+        self._seq = 0
+        self._next_refresh = datetime.now()
+        self._stopped = False
+        self._cond = threading.Condition()
+        self._executor = ThreadPoolExecutor(max_workers=self.max_concurrent,
+                                            thread_name_prefix='site-cycle')
+
+    def schedule(self, site_id: str, run_at: Optional[datetime] = None):
+        """
+        サイトの次回実行時刻を設定（既存の予定は置き換え）
+
+        Args:
+            site_id: サイトID
+            run_at: 実行時刻（省略時は即時）
+        """
+        run_at = run_at or datetime.now()
+        with self._cond:
+            self._scheduled[site_id] = run_at
+            self._seq += 1
+            heapq.heappush(self._heap, (run_at, self._seq, site_id))
+            self._cond.notify_all()
+
+    def unschedule(self, site_id: str):
+        """サイトを予定から外す（実行中のサイクルは最後まで実行される）"""
+        with self._cond:
+            self._scheduled.pop(site_id, None)
+            if site_id in self._running:
+                self._removed_while_running.add(site_id)
+            self._cond.notify_all()
+
+    def get_schedule(self) -> Dict[str, Dict]:
+        """サイトごとの次回実行予定と実行状態"""
+        with self._cond:
+            return {
+                site_id: {
+                    'next_run': run_at.isoformat(),
+                    'running': site_id in self._running
+                }
+                for site_id, run_at in self._scheduled.items()
+            }
+
+    def _refresh_sites(self):
+        """対象サイト一覧を反映（新規サイトは即時実行、削除されたサイトは予定から外す）"""
+        if not self.list_site_ids:
+            return
+        try:
+            site_ids = set(self.list_site_ids())
+        except Exception as e:
+            logger.error(f"サイト一覧の取得エラー: {str(e)}")
+            return
+        with self._cond:
+            known = set(self._scheduled) | set(self._running)
+        for site_id in site_ids - known:
+            logger.info(f"スケジュールに追加: {site_id}")
+            self.schedule(site_id)
+        for site_id in known - site_ids:
+            logger.info(f"スケジュールから削除: {site_id}")
+            self.unschedule(site_id)
+
+    def _pop_due(self, now: datetime) -> Optional[tuple]:
+        """期限が来た有効な予定を取り出す（置き換え済み・削除済みの古いエントリは捨てる）"""
+        while self._heap:
+            run_at, _, site_id = self._heap[0]
+            if self._scheduled.get(site_id) != run_at or site_id in self._running:
+                heapq.heappop(self._heap)
+                continue
+            if run_at > now:
+                return None
+            heapq.heappop(self._heap)
+            del self._scheduled[site_id]
+            return run_at, site_id
+        return None
+
+    def _wait_timeout(self, now: datetime) -> Optional[float]:
+        """次の予定（またはサイト一覧の再読み込み）までの秒数"""
+        deadlines = []
+        if self._heap and len(self._running) < self.max_concurrent:
+            deadlines.append(self._heap[0][0])
+        if self.list_site_ids:
+            deadlines.append(self._next_refresh)
+        if not deadlines:
+            return None
+        return max(0.0, (min(deadlines) - now).total_seconds())
+
+    def _execute(self, site_id: str, scheduled_at: datetime):
+        next_run = None
+        try:
+            next_run = self.run_job(site_id)
+        except Exception as e:
+            logger.error(f"サイクル実行エラー ({site_id}): {str(e)}")
+        finally:
+            if next_run is None:
+                # 予定時刻を基準に次回を決めてずれを防ぐ（遅れている場合は今から1間隔後）
+                next_run = scheduled_at + self.interval_for(site_id)
+                if next_run <= datetime.now():
+                    next_run = datetime.now() + self.interval_for(site_id)
+            with self._cond:
+                self._running.pop(site_id, None)
+                removed = site_id in self._removed_while_running
+                self._removed_while_running.discard(site_id)
+                self._cond.notify_all()
+            if not removed and not self._stopped:
+                self.schedule(site_id, next_run)
+                logger.info(f"次回実行予定 ({site_id}): {next_run.strftime('%Y-%m-%d %H:%M:%S')}")
+
+    def run_forever(self):
+        """stop() が呼ばれるまでスケジュールを実行"""
+        logger.info(f"サイト別スケジューラー開始（同時実行数: {self.max_concurrent}）")
+        while True:
+            now = datetime.now()
+            if self.list_site_ids and now >= self._next_refresh:
+                self._refresh_sites()
+                self._next_refresh = now + self.refresh_interval
+
+            with self._cond:
+                if self._stopped:
+                    break
+                due = None
+                if len(self._running) < self.max_concurrent:
+                    due = self._pop_due(datetime.now())
+                if due is None:
+                    # 次の予定時刻まで待機（予定の追加・完了時は notify で起床）
+                    self._cond.wait(timeout=self._wait_timeout(datetime.now()))
+                    continue
+                scheduled_at, site_id = due
+                self._running[site_id] = scheduled_at
+
+            logger.info(f"サイクル開始 ({site_id}): 予定 {scheduled_at.strftime('%H:%M:%S')}")
+            self._executor.submit(self._execute, site_id, scheduled_at)
+
+        self._executor.shutdown(wait=True)
+        logger.info("サイト別スケジューラー停止")
+
+    def stop(self):
+        """スケジューラーを停止（実行中のサイクルの完了を待つ）"""
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
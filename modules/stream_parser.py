@@ -0,0 +1,111 @@
+"""
+ストリーミング応答のタグパーサー
+LLMの出力を受信しながら <title> <description> <tags> <content> を順次取り出す
+"""
+import logging
+from typing import Any, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class StreamingTagParser:
+    """ストリーミングで届くテキストからタグを逐次抽出するクラス"""
+
+    TAGS = ('title', 'description', 'tags', 'content')
+
+    def __init__(self,
+                 on_field: Optional[Callable[[str, Any], None]] = None,
+                 on_progress: Optional[Callable[[int], None]] = None,
+                 progress_interval: int = 500):
+        """
+        初期化
+
+        Args:
+            on_field: タグが閉じた時点で呼ばれるコールバック (タグ名, 値)
+                      tags はリスト、その他は文字列で渡す
+            on_progress: 本文の受信文字数を通知するコールバック
+            progress_interval: 進捗を通知する本文文字数の間隔
+        """
+        self.on_field = on_field
+        self.on_progress = on_progress
+        self.progress_interval = progress_interval
+        self.fields: Dict[str, Any] = {}
+        self._buffer = ''
+        self._scan_from = 0
+        self._content_start = None
+        self._last_progress = 0
+
+    @property
+    def text(self) -> str:
+        """これまでに受信したテキスト全体"""
+        return self._buffer
+
+    @property
+    def is_complete(self) -> bool:
+        """</content> を受信済みか"""
+        return 'content' in self.fields
+
+    def feed(self, chunk: str) -> bool:
+        """
+        受信したテキストを追加
+
+        Args:
+            chunk: ストリームの差分テキスト
+
+        Returns:
+            </content> を受信して以降のストリームが不要になった場合True
+        """
+        if not chunk or self.is_complete:
+            return self.is_complete
+
+        self._buffer += chunk
+
+        for tag in self.TAGS:
+            if tag in self.fields:
+                continue
+            close_tag = f'</{tag}>'
+            # 直前のチャンク境界をまたぐタグも検出できるよう少し戻って探索
+            close_pos = self._buffer.find(close_tag, max(0, self._scan_from - len(close_tag)))
+            if close_pos == -1:
+                continue
+            open_tag = f'<{tag}>'
+            open_pos = self._buffer.rfind(open_tag, 0, close_pos)
+            if open_pos == -1:
+                continue
+            self._set_field(tag, self._buffer[open_pos + len(open_tag):close_pos])
+
+        if self._content_start is None:
+            open_pos = self._buffer.find('<content>', max(0, self._scan_from - len('<content>')))
+            if open_pos != -1:
+                self._content_start = open_pos + len('<content>')
+
+        self._scan_from = len(self._buffer)
+        self._notify_progress()
+        return self.is_complete
+
+    def _set_field(self, tag: str, raw_value: str):
+        value: Any = raw_value.strip()
+        if tag == 'tags':
+            value = [t.strip() for t in value.split(',')]
+        self.fields[tag] = value
+        logger.debug(f"ストリーム受信: <{tag}> 完了")
+        if self.on_field:
+            try:
+                self.on_field(tag, value)
+            except Exception as e:
+                logger.error(f"ストリームコールバックエラー ({tag}): {str(e)}")
+
+    def _notify_progress(self):
+        if not self.on_progress or self._content_start is None:
+            return
+        if self.is_complete:
+            received = self._buffer.find('</content>', self._content_start) - self._content_start
+        else:
+            received = len(self._buffer) - self._content_start
+            if received - self._last_progress < self.progress_interval:
+                return
+        self._last_progress = received
+        try:
+            self.on_progress(received)
+        except Exception as e:
+            logger.error(f"ストリーム進捗コールバックエラー: {str(e)}")
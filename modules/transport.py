@@ -0,0 +1,595 @@
+"""
+HTTPトランスポート層（記録・再生・合成）
+外部API（OpenAI・VeniceAI・Gemini・Claude・Unsplash・WordPress）への通信を差し替え、
+オフラインで再現性のあるベンチマークを実行できるようにする
+
+モード:
+    live      : 通常どおり外部APIに接続
+    record    : 外部APIに接続し、リクエストとレスポンスをディスクに保存
+    replay    : 保存したレスポンスを疑似レイテンシ付きで返す（外部接続なし）
+    synthetic : 記事・画像・WordPressのレスポンスをその場で合成して返す（外部接続なし）
+
+環境変数 PAE_TRANSPORT / PAE_CASSETTE_DIR / PAE_TRANSPORT_LATENCY で有効化できる
+"""
+import os
+import io
+import re
+import json
+import time
+import zlib
+import base64
+import struct
+import random
+import hashlib
+import threading
+import logging
+from typing import Callable, Dict, Optional, Tuple
+from urllib.parse import urlparse, parse_qsl, urlencode
+
+import requests
+from requests.adapters import BaseAdapter, HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+logger = logging.getLogger(__name__)
+
+MODES = ('live', 'record', 'replay', 'synthetic')
+
+# キーの計算と保存時に除外するクエリパラメータ・ヘッダー（APIキーなど）
+SECRET_PARAMS = {'key', 'api_key', 'apikey', 'client_id', 'access_key', 'token'}
+SECRET_HEADERS = {'authorization', 'x-api-key', 'x-goog-api-key', 'cookie'}
+
+# (ステータスコード, レスポンスヘッダー, レスポンスボディ)
+TransportResult = Tuple[int, Dict[str, str], bytes]
+
+
+def _strip_secrets(url: str) -> str:
+    """URLからAPIキーなどのクエリパラメータを除去"""
+    parsed = urlparse(url)
+    query = sorted((k, v) for k, v in parse_qsl(parsed.query, keep_blank_values=True)
+                   if k.lower() not in SECRET_PARAMS)
+    return parsed._replace(query=urlencode(query)).geturl()
+
+
+def _body_bytes(body) -> bytes:
+    if body is None:
+        return b''
+    if isinstance(body, str):
+        return body.encode('utf-8')
+    if isinstance(body, (bytes, bytearray)):
+        return bytes(body)
+    # ファイルオブジェクトなど
+    if hasattr(body, 'read'):
+        data = body.read()
+        return data.encode('utf-8') if isinstance(data, str) else data
+    # チャンクのイテラブル（ストリーミングアップロード）
+    return b''.join(chunk.encode('utf-8') if isinstance(chunk, str) else bytes(chunk) for chunk in body)
+
+
+def _parse_json(body: bytes) -> Optional[Dict]:
+    try:
+        return json.loads(body.decode('utf-8')) if body else None
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+
+class CassetteStore:
+    """記録したリクエスト・レスポンスの保存先（1リクエスト1ファイル）"""
+
+    def __init__(self, cassette_dir: str):
+        self.cassette_dir = cassette_dir
+        self._counters: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        os.makedirs(cassette_dir, exist_ok=True)
+
+    @staticmethod
+    def request_key(method: str, url: str, body: bytes) -> str:
+        """リクエスト内容から保存キーを計算（APIキーは含めない）"""
+        parsed = _parse_json(body)
+        normalized = json.dumps(parsed, sort_keys=True, ensure_ascii=False).encode('utf-8') \
+            if parsed is not None else body
+        digest = hashlib.sha256()
+        digest.update(method.upper().encode('utf-8'))
+        digest.update(_strip_secrets(url).encode('utf-8'))
+        digest.update(normalized)
+        return digest.hexdigest()[:24]
+
+    def _path(self, url: str, key: str, index: int) -> str:
+        host = urlparse(url).netloc.replace(':', '_') or 'local'
+        return os.path.join(self.cassette_dir, host, f"{key}_{index}.json")
+
+    def _next_index(self, key: str) -> int:
+        with self._lock:
+            index = self._counters.get(key, 0)
+            self._counters[key] = index + 1
+            return index
+
+    def save(self, method: str, url: str, body: bytes, result: TransportResult):
+        """レスポンスを保存（同じリクエストが繰り返された場合は連番で保存）"""
+        key = self.request_key(method, url, body)
+        path = self._path(url, key, self._next_index(key))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        status, headers, content = result
+        parsed_request = _parse_json(body)
+        entry = {
+            'request': {
+                'method': method.upper(),
+                'url': _strip_secrets(url),
+                'body': parsed_request if parsed_request is not None else f"<{len(body)} bytes>"
+            },
+            'response': {
+                'status': status,
+                'headers': {k: v for k, v in headers.items() if k.lower() not in SECRET_HEADERS},
+                'body_base64': base64.b64encode(content).decode('ascii')
+            },
+            'recorded_at': time.strftime('%Y-%m-%dT%H:%M:%S')
+        }
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(entry, f, ensure_ascii=False, indent=2)
+
+    def load(self, method: str, url: str, body: bytes) -> Optional[TransportResult]:
+        """保存したレスポンスを順番に返す（記録数を超えた場合は最後のものを返す）"""
+        key = self.request_key(method, url, body)
+        index = self._next_index(key)
+        while index >= 0:
+            path = self._path(url, key, index)
+            if os.path.exists(path):
+                with open(path, 'r', encoding='utf-8') as f:
+                    entry = json.load(f)
+                response = entry['response']
+                return (response['status'], response['headers'],
+                        base64.b64decode(response['body_base64']))
+            index -= 1
+        return None
+
+
+class SyntheticResponder:
+    """外部APIのレスポンスを合成するクラス（ベンチマーク用）"""
+
+    def __init__(self, seed: int = 0, article_length: Optional[int] = None):
+        """
+        初期化
+
+        Args:
+            seed: 乱数シード（同じシードなら同じ結果を返す）
+            article_length: 合成する本文の文字数（未指定時はプロンプトの目標文字数）
+        """
+        self.seed = seed
+        self.article_length = article_length
+        self._ids: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._png = self._build_png(64, 36)
+
+    def _next_id(self, name: str) -> int:
+        with self._lock:
+            self._ids[name] = self._ids.get(name, 100) + 1
+            return self._ids[name]
+
+    @staticmethod
+    def _build_png(width: int, height: int) -> bytes:
+        """単色のPNG画像を生成（PIL不要）"""
+        def chunk(tag: bytes, data: bytes) -> bytes:
+            return struct.pack('>I', len(data)) + tag + data + struct.pack('>I', zlib.crc32(tag + data))
+        raw = b''.join(b'\x00' + bytes((90, 140, 200)) * width for _ in range(height))
+        return (b'\x89PNG\r\n\x1a\n'
+                + chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0))
+                + chunk(b'IDAT', zlib.compress(raw))
+                + chunk(b'IEND', b''))
+
+    @staticmethod
+    def _json(data, status: int = 200) -> TransportResult:
+        return status, {'Content-Type': 'application/json; charset=utf-8'}, \
+            json.dumps(data, ensure_ascii=False).encode('utf-8')
+
+    def respond(self, method: str, url: str, body: bytes) -> TransportResult:
+        """リクエスト先に応じて合成レスポンスを返す"""
+        parsed = urlparse(url)
+        host, path = parsed.netloc, parsed.path
+        payload = _parse_json(body) or {}
+
+        if path.endswith('/chat/completions'):
+            return self._chat_completion(payload)
+        if host == 'api.anthropic.com' and path.endswith('/messages'):
+            return self._anthropic_message(payload)
+        if path.endswith('/images/generations'):
+            return self._image_generation(payload)
+        if host == 'generativelanguage.googleapis.com':
+            return self._gemini(payload)
+        if host == 'api.unsplash.com':
+            return self._unsplash(path)
+        if '/wp-json' in path:
+            return self._wordpress(method, path, dict(parse_qsl(parsed.query)), payload)
+        if re.search(r'\.(png|jpe?g|webp)$', path) or host.startswith('images.'):
+            return 200, {'Content-Type': 'image/png'}, self._png
+        return self._json({})
+
+    # --- テキスト生成 ---
+
+    def _prompt_text(self, payload: Dict) -> str:
+        parts = []
+        system = payload.get('system')
+        if isinstance(system, list):
+            parts.extend(block.get('text', '') for block in system)
+        elif isinstance(system, str):
+            parts.append(system)
+        for message in payload.get('messages', []):
+            content = message.get('content', '')
+            if isinstance(content, list):
+                parts.extend(block.get('text', '') for block in content if isinstance(block, dict))
+            else:
+                parts.append(str(content))
+        return '\n'.join(parts)
+
+    def _completion_text(self, prompt: str) -> str:
+        rng = random.Random(f"{self.seed}:{hashlib.sha256(prompt.encode('utf-8')).hexdigest()}")
+        keyword_match = re.search(r'キーワード: (.+)', prompt)
+        keywords = [k.strip() for k in re.split(r'[、,]', keyword_match.group(1)) if k.strip()] \
+            if keyword_match else []
+        keywords = [k for k in keywords if k != 'なし'] or ['テーマ']
+
+        if '<suggestions>' in prompt:
+            articles = ''.join(
+                f"<article>\n<title>{keywords[0]}の実践ガイド その{i + 1}</title>\n"
+                f"<keywords>{', '.join(keywords[:3])}</keywords>\n"
+                f"<reason>未カバーのトピック{i + 1}</reason>\n<target>初心者</target>\n"
+                f"<expected_impact>検索流入の増加</expected_impact>\n</article>\n"
+                for i in range(5)
+            )
+            return f"<suggestions>\n{articles}</suggestions>"
+
+        length_match = re.search(r'目標文字数: (\d+)', prompt)
+        length = self.article_length or (int(length_match.group(1)) if length_match else 3000)
+        sentences = [
+            f"{keywords[0]}について基本から順に解説します。",
+            "具体的な手順と注意点を押さえておくと失敗を減らせます。",
+            f"{rng.choice(keywords)}を意識すると成果が出やすくなります。",
+            "実際の事例をもとにポイントを整理していきましょう。"
+        ]
+        sections = []
+        total = 0
+        section_no = 1
+        while total < length:
+            paragraph = ''.join(rng.choice(sentences) for _ in range(6))
+            section = f"## {keywords[0]}のポイント{section_no}\n\n{paragraph}\n"
+            sections.append(section)
+            total += len(section)
+            section_no += 1
+        return (f"<title>{keywords[0]}の完全ガイド：{rng.randint(3, 9)}つのポイント</title>\n\n"
+                f"<description>{keywords[0]}の基本と実践のコツをまとめました。</description>\n\n"
+                f"<tags>{', '.join(keywords[:5])}</tags>\n\n"
+                f"<content>\n{''.join(sections)}</content>")
+
+    def _usage(self, prompt: str, text: str) -> Dict:
+        prompt_tokens = max(1, len(prompt) // 2)
+        return {
+            'prompt_tokens': prompt_tokens,
+            'completion_tokens': max(1, len(text) // 2),
+            'total_tokens': prompt_tokens + max(1, len(text) // 2),
+            'prompt_tokens_details': {'cached_tokens': 0}
+        }
+
+    def _chat_completion(self, payload: Dict) -> TransportResult:
+        prompt = self._prompt_text(payload)
+        text = self._completion_text(prompt)
+        usage = self._usage(prompt, text)
+        completion_id = f"chatcmpl-synthetic-{self._next_id('completion')}"
+
+        if not payload.get('stream'):
+            return self._json({
+                'id': completion_id,
+                'object': 'chat.completion',
+                'model': payload.get('model', 'synthetic'),
+                'choices': [{'index': 0, 'finish_reason': 'stop',
+                             'message': {'role': 'assistant', 'content': text}}],
+                'usage': usage
+            })
+
+        # SSE形式で少しずつ返す
+        events = []
+        for i in range(0, len(text), 40):
+            chunk = {'id': completion_id, 'object': 'chat.completion.chunk',
+                     'choices': [{'index': 0, 'delta': {'content': text[i:i + 40]}}]}
+            events.append(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n")
+        events.append(f"data: {json.dumps({'id': completion_id, 'choices': [], 'usage': usage})}\n\n")
+        events.append("data: [DONE]\n\n")
+        return 200, {'Content-Type': 'text/event-stream; charset=utf-8'}, ''.join(events).encode('utf-8')
+
+    def _anthropic_message(self, payload: Dict) -> TransportResult:
+        prompt = self._prompt_text(payload)
+        text = self._completion_text(prompt)
+        return self._json({
+            'id': f"msg_synthetic_{self._next_id('message')}",
+            'type': 'message',
+            'role': 'assistant',
+            'model': payload.get('model', 'synthetic'),
+            'content': [{'type': 'text', 'text': text}],
+            'stop_reason': 'end_turn',
+            'usage': {
+                'input_tokens': max(1, len(prompt) // 2),
+                'output_tokens': max(1, len(text) // 2),
+                'cache_read_input_tokens': 0,
+                'cache_creation_input_tokens': 0
+            }
+        })
+
+    # --- 画像 ---
+
+    def _image_generation(self, payload: Dict) -> TransportResult:
+        count = int(payload.get('n', 1) or 1)
+        data = []
+        for _ in range(count):
+            image_id = self._next_id('image')
+            if payload.get('response_format') == 'b64_json':
+                data.append({'b64_json': base64.b64encode(self._png).decode('ascii')})
+            else:
+                data.append({'url': f"https://images.synthetic.invalid/generated/{image_id}.png"})
+        return self._json({'created': int(time.time()), 'data': data})
+
+    def _gemini(self, payload: Dict) -> TransportResult:
+        count = int(payload.get('generationConfig', {}).get('candidateCount', 1) or 1)
+        candidates = [{
+            'content': {'parts': [
+                {'text': 'synthetic image'},
+                {'inlineData': {'mimeType': 'image/png',
+                                'data': base64.b64encode(self._png).decode('ascii')}}
+            ]},
+            'finishReason': 'STOP'
+        } for _ in range(count)]
+        return self._json({'candidates': candidates})
+
+    def _unsplash(self, path: str) -> TransportResult:
+        if path.startswith('/photos/') and path.endswith('/download'):
+            return self._json({'url': 'https://images.synthetic.invalid/unsplash/download.png'})
+        results = []
+        for _ in range(3):
+            photo_id = f"synthetic{self._next_id('photo')}"
+            results.append({
+                'id': photo_id,
+                'width': 1920,
+                'height': 1080,
+                'description': 'synthetic photo',
+                'alt_description': 'synthetic photo',
+                'urls': {
+                    'regular': f"https://images.synthetic.invalid/unsplash/{photo_id}.png",
+                    'thumb': f"https://images.synthetic.invalid/unsplash/{photo_id}_thumb.png",
+                    'full': f"https://images.synthetic.invalid/unsplash/{photo_id}_full.png"
+                },
+                'user': {'name': 'Synthetic', 'links': {'html': 'https://unsplash.com/@synthetic'}},
+                'links': {'html': f"https://unsplash.com/photos/{photo_id}"}
+            })
+        return self._json({'total': len(results), 'results': results})
+
+    # --- WordPress ---
+
+    def _wordpress(self, method: str, path: str, query: Dict, payload: Dict) -> TransportResult:
+        method = method.upper()
+        resource = path.split('/wp-json', 1)[1].strip('/')
+        if resource in ('', 'wp/v2'):
+            return self._json({'name': 'Synthetic WordPress', 'namespaces': ['wp/v2']})
+        if resource == 'wp/v2/users/me':
+            return self._json({'id': 1, 'name': 'synthetic'})
+        if resource in ('wp/v2/categories', 'wp/v2/tags'):
+            taxonomy = resource.rsplit('/', 1)[1]
+            if method == 'GET':
+                if taxonomy == 'categories':
+                    return self._json([{'id': i, 'name': name, 'slug': f'cat-{i}', 'count': 0}
+                                       for i, name in enumerate(['未分類', 'ノウハウ', 'レビュー'], 1)])
+                return self._json([])
+            term_id = self._next_id(taxonomy)
+            return self._json({'id': term_id, 'name': payload.get('name', f'{taxonomy}-{term_id}')}, 201)
+        if resource.startswith('wp/v2/media'):
+            tail = resource.rsplit('/', 1)[1]
+            if tail.isdigit():
+                # alt_text などの更新
+                return self._json({'id': int(tail), 'alt_text': payload.get('alt_text', '')})
+            media_id = self._next_id('media')
+            return self._json({
+                'id': media_id,
+                'alt_text': query.get('alt_text', ''),
+                'source_url': f"https://wordpress.synthetic.invalid/uploads/{media_id}.png"
+            }, 201)
+        if resource.startswith('wp/v2/posts'):
+            if method == 'GET':
+                return self._json([])
+            post_id = self._next_id('post')
+            return self._json({
+                'id': post_id,
+                'link': f"https://wordpress.synthetic.invalid/?p={post_id}",
+                'status': 'publish'
+            }, 201)
+        return self._json({})
+
+
+class TransportCore:
+    """モードに応じてリクエストを処理する共通部分"""
+
+    def __init__(self, mode: str = 'live', cassette_dir: str = 'data/cassettes',
+                 latency: float = 0.0, jitter: float = 0.0, seed: int = 0,
+                 article_length: Optional[int] = None):
+        """
+        初期化
+
+        Args:
+            mode: live / record / replay / synthetic
+            cassette_dir: 記録の保存先
+            latency: replay・syntheticで付与する疑似レイテンシ（秒）
+            jitter: 疑似レイテンシのばらつき（秒、±）
+            seed: 乱数シード
+            article_length: syntheticで合成する本文の文字数
+        """
+        if mode not in MODES:
+            raise ValueError(f"不明なトランスポートモード: {mode}")
+        self.mode = mode
+        self.latency = latency
+        self.jitter = jitter
+        self.store = CassetteStore(cassette_dir) if mode in ('record', 'replay') else None
+        self.synthetic = SyntheticResponder(seed, article_length) if mode == 'synthetic' else None
+        self._rng = random.Random(seed)
+        self._rng_lock = threading.Lock()
+
+    def _simulate_latency(self):
+        if self.latency <= 0 and self.jitter <= 0:
+            return
+        with self._rng_lock:
+            delay = self.latency + self._rng.uniform(-self.jitter, self.jitter)
+        if delay > 0:
+            time.sleep(delay)
+
+    def handle(self, method: str, url: str, body: bytes,
+               live_send: Callable[[], TransportResult]) -> TransportResult:
+        """
+        リクエストを処理
+
+        Args:
+            method: HTTPメソッド
+            url: リクエストURL
+            body: リクエストボディ
+            live_send: 実際に外部へ送信する関数（live・recordで使用）
+        """
+        if self.mode == 'live':
+            return live_send()
+        if self.mode == 'record':
+            result = live_send()
+            self.store.save(method, url, body, result)
+            return result
+        if self.mode == 'replay':
+            result = self.store.load(method, url, body)
+            if result is None:
+                raise requests.ConnectionError(f"リプレイデータがありません: {method} {_strip_secrets(url)}")
+            self._simulate_latency()
+            return result
+        self._simulate_latency()
+        return self.synthetic.respond(method, url, body)
+
+
+class TransportAdapter(BaseAdapter):
+    """requests用のアダプター（全URLのリクエストをTransportCore経由にする）"""
+
+    def __init__(self, core: TransportCore):
+        super().__init__()
+        self.core = core
+        self._live = HTTPAdapter()
+
+    def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None):
+        body = _body_bytes(request.body)
+        if request.body is not None and not isinstance(request.body, (str, bytes, bytearray)):
+            # ストリーミングの本文は読み切ったため、実通信用にバイト列へ差し替える
+            request.body = body
+            request.headers.pop('Transfer-Encoding', None)
+            request.headers['Content-Length'] = str(len(body))
+        # multipartの境界文字列は毎回変わるため、キー計算用に固定値へ置き換える
+        boundary = re.search(r'boundary=([^;\s]+)', request.headers.get('Content-Type', ''))
+        if boundary:
+            body = body.replace(boundary.group(1).encode('utf-8'), b'BOUNDARY')
+
+        def live_send() -> TransportResult:
+            response = self._live.send(request, stream=False, timeout=timeout,
+                                       verify=verify, cert=cert, proxies=proxies)
+            return response.status_code, dict(response.headers), response.content
+
+        status, headers, content = self.core.handle(request.method, request.url, body, live_send)
+        return self._build_response(request, status, headers, content)
+
+    @staticmethod
+    def _build_response(request, status: int, headers: Dict[str, str], content: bytes):
+        response = requests.Response()
+        response.status_code = status
+        # 保存済みの本文は展開済みのため、圧縮関連のヘッダーは除く
+        response.headers = CaseInsensitiveDict({
+            k: v for k, v in headers.items()
+            if k.lower() not in ('content-encoding', 'transfer-encoding', 'content-length')
+        })
+        response.encoding = get_encoding_from_headers(response.headers)
+        response.raw = io.BytesIO(content)
+        response.url = request.url
+        response.request = request
+        response.reason = 'OK' if status < 400 else 'Error'
+        return response
+
+    def close(self):
+        self._live.close()
+
+
+_installed_core: Optional[TransportCore] = None
+_original_get_adapter = None
+
+
+def install(mode: str, cassette_dir: str = 'data/cassettes', latency: float = 0.0,
+            jitter: float = 0.0, seed: int = 0, article_length: Optional[int] = None) -> TransportCore:
+    """
+    requests経由の全通信をトランスポート層に切り替える
+
+    openai（0.x）・各モジュールの requests.get/post・requests.Session がすべて対象になる
+    """
+    global _installed_core, _original_get_adapter
+    core = TransportCore(mode, cassette_dir, latency, jitter, seed, article_length)
+    adapter = TransportAdapter(core)
+    if _original_get_adapter is None:
+        _original_get_adapter = requests.Session.get_adapter
+    requests.Session.get_adapter = lambda session, url: adapter
+    _installed_core = core
+    logger.info(f"トランスポートモード: {mode}" + (f" ({cassette_dir})" if core.store else ''))
+    return core
+
+
+def uninstall():
+    """トランスポート層を解除して通常の通信に戻す"""
+    global _installed_core, _original_get_adapter
+    if _original_get_adapter is not None:
+        requests.Session.get_adapter = _original_get_adapter
+        _original_get_adapter = None
+    _installed_core = None
+
+
+def install_from_env() -> Optional[TransportCore]:
+    """環境変数 PAE_TRANSPORT が live 以外なら有効化"""
+    mode = os.getenv('PAE_TRANSPORT', 'live')
+    if mode == 'live':
+        return None
+    return install(
+        mode,
+        cassette_dir=os.getenv('PAE_CASSETTE_DIR', 'data/cassettes'),
+        latency=float(os.getenv('PAE_TRANSPORT_LATENCY', '0')),
+        jitter=float(os.getenv('PAE_TRANSPORT_JITTER', '0')),
+        seed=int(os.getenv('PAE_TRANSPORT_SEED', '0'))
+    )
+
+
+def get_installed_core() -> Optional[TransportCore]:
+    """有効なトランスポート層（未設定ならNone）"""
+    return _installed_core
+
+
+def get_httpx_client():
+    """
+    httpx を使うSDK（anthropic）向けのクライアントを返す
+
+    トランスポート層が無効、または httpx が無い場合は None（SDKの既定クライアントを使用）
+    """
+    core = _installed_core
+    if core is None:
+        return None
+    try:
+        import httpx
+    except ImportError:
+        logger.warning("httpxが無いため、Claude APIはトランスポート層を経由しません")
+        return None
+
+    class _HttpxTransport(httpx.BaseTransport):
+        def __init__(self):
+            self._live = httpx.HTTPTransport()
+
+        def handle_request(self, request):
+            body = request.read()
+
+            def live_send() -> TransportResult:
+                response = self._live.handle_request(request)
+                response.read()
+                return response.status_code, dict(response.headers), response.content
+
+            status, headers, content = core.handle(request.method, str(request.url), body, live_send)
+            headers = {k: v for k, v in headers.items()
+                       if k.lower() not in ('content-encoding', 'transfer-encoding', 'content-length')}
+            return httpx.Response(status, headers=headers, content=content, request=request)
+
+    return httpx.Client(transport=_HttpxTransport())
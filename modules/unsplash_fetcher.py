@@ -8,6 +8,7 @@ from typing import Optional, Dict, List
 import logging
 import random
 from .image_history_manager import ImageHistoryManager
+from .rate_limiter import get_rate_limiter
 
 logger = logging.getLogger(__name__)
 
@@ -67,7 +68,7 @@ class UnsplashFetcher:
             return None
         
         try:
-            response = requests.get(
+            response = get_rate_limiter().call('unsplash', lambda: requests.get(
                 f"{self.base_url}/search/photos",
                 headers=self.headers,
                 params={
@@ -75,8 +76,9 @@ class UnsplashFetcher:
                     "per_page": per_page,
                     "orientation": orientation,
                     "order_by": "relevant"
-                }
-            )
+                },
+                timeout=15
+            ))
             
             if response.status_code == 200:
                 data = response.json()
@@ -212,10 +214,11 @@ class UnsplashFetcher:
             return False
         
         try:
-            response = requests.get(
+            response = get_rate_limiter().call('unsplash', lambda: requests.get(
                 f"{self.base_url}/photos/{photo_id}/download",
-                headers=self.headers
-            )
+                headers=self.headers,
+                timeout=15
+            ))
             return response.status_code == 200
         except:
             return False
\ No newline at end of file
@@ -7,8 +7,11 @@ import json
 import re
 import requests
 from datetime import datetime
-from typing import Dict, List, Optional
+from typing import Any, Callable, Dict, List, Optional, Tuple
 import logging
+from modules.stream_parser import StreamingTagParser
+from modules.prompt_cache import get_prompt_cache_stats
+from modules.rate_limiter import get_rate_limiter
 
 # ロギング設定
 logging.basicConfig(level=logging.INFO)
@@ -63,7 +66,10 @@ class VeniceArticleGenerator:
                         keywords: Optional[List[str]] = None,
                         length: int = 7000,
                         tone: str = 'professional',
-                        affiliate_products: Optional[List[Dict]] = None) -> Dict:
+                        affiliate_products: Optional[List[Dict]] = None,
+                        stream: bool = False,
+                        on_field: Optional[Callable[[str, Any], None]] = None,
+                        on_progress: Optional[Callable[[int], None]] = None) -> Dict:
         """
         記事を生成
         
@@ -74,6 +80,9 @@ class VeniceArticleGenerator:
             length: 目標文字数
             tone: 文体
             affiliate_products: 使用するアフィリエイト商品
+            stream: ストリーミングで受信し、</content>受信時点で打ち切る
+            on_field: ストリーミング時、タグ受信ごとに呼ばれる (タグ名, 値)
+            on_progress: ストリーミング時、本文の受信文字数を通知
         
         Returns:
             生成された記事情報
@@ -83,8 +92,8 @@ class VeniceArticleGenerator:
             if article_type == 'auto':
                 article_type = self._select_article_type(site_info)
             
-            # プロンプトを構築
-            prompt = self._build_prompt(
+            # プロンプトを固定部分と可変部分に分けて構築
+            static_prompt, variable_prompt = self._build_prompt(
                 site_info, article_type, keywords, length, tone, affiliate_products
             )
             
@@ -96,31 +105,35 @@ class VeniceArticleGenerator:
                 "messages": [
                     {
                         "role": "system",
-                        "content": "あなたは優秀な日本語コンテンツライターです。SEOに強く、読者に価値を提供する記事を作成します。"
+                        "content": "あなたは優秀な日本語コンテンツライターです。SEOに強く、読者に価値を提供する記事を作成します。\n" + static_prompt
                     },
                     {
                         "role": "user",
-                        "content": prompt
+                        "content": variable_prompt
                     }
                 ],
                 "temperature": 0.7,
                 "max_tokens": 8000,
-                "stream": False
+                "stream": stream
             }
             
-            response = requests.post(
-                f"{self.api_base}/chat/completions",
-                headers=self.headers,
-                json=payload
-            )
-            
-            if response.status_code != 200:
-                logger.error(f"VeniceAI APIエラー: {response.status_code} - {response.text}")
-                raise Exception(f"API Error: {response.status_code}")
-            
-            # レスポンスを解析
-            result = response.json()
-            content = result['choices'][0]['message']['content']
+            if stream:
+                content = self._stream_completion(payload, on_field, on_progress)
+            else:
+                response = get_rate_limiter().call('venice', lambda: requests.post(
+                    f"{self.api_base}/chat/completions",
+                    headers=self.headers,
+                    json=payload
+                ))
+                
+                if response.status_code != 200:
+                    logger.error(f"VeniceAI APIエラー: {response.status_code} - {response.text}")
+                    raise Exception(f"API Error: {response.status_code}")
+                
+                # レスポンスを解析
+                result = response.json()
+                get_prompt_cache_stats().record_openai_usage('venice', result.get('usage'))
+                content = result['choices'][0]['message']['content']
             article = self._parse_response(content)
             
             # アフィリエイトリンクを挿入
@@ -147,10 +160,65 @@ class VeniceArticleGenerator:
             logger.error(f"VeniceAI記事生成エラー: {str(e)}")
             raise
     
+    def _stream_completion(self, payload: Dict,
+                           on_field: Optional[Callable[[str, Any], None]] = None,
+                           on_progress: Optional[Callable[[int], None]] = None) -> str:
+        """
+        SSEで生成結果を受信しながらタグを解析する
+        
+        </content> を受信した時点で接続を閉じる
+        
+        Returns:
+            受信したテキスト全体
+        """
+        parser = StreamingTagParser(on_field=on_field, on_progress=on_progress)
+        response = get_rate_limiter().call('venice', lambda: requests.post(
+            f"{self.api_base}/chat/completions",
+            headers=self.headers,
+            json=payload,
+            stream=True
+        ))
+        
+        try:
+            if response.status_code != 200:
+                logger.error(f"VeniceAI APIエラー: {response.status_code} - {response.text}")
+                raise Exception(f"API Error: {response.status_code}")
+            
+            for raw_line in response.iter_lines():
+                line = raw_line.decode('utf-8', errors='replace') if raw_line else ''
+                if not line.startswith('data:'):
+                    continue
+                data = line[len('data:'):].strip()
+                if data == '[DONE]':
+                    break
+                try:
+                    chunk = json.loads(data)
+                except json.JSONDecodeError:
+                    logger.warning(f"VeniceAIストリームの解析に失敗: {data[:100]}")
+                    continue
+                if chunk.get('usage'):
+                    get_prompt_cache_stats().record_openai_usage('venice', chunk['usage'])
+                choices = chunk.get('choices') or []
+                delta = choices[0].get('delta', {}).get('content') if choices else None
+                if delta and parser.feed(delta):
+                    logger.info("</content>を受信したためストリームを終了します")
+                    break
+        finally:
+            response.close()
+        
+        if not parser.text:
+            raise Exception("VeniceAIから応答がありませんでした")
+        return parser.text
+    
     def _build_prompt(self, site_info: Dict, article_type: str, 
                       keywords: Optional[List[str]], length: int, tone: str,
-                      affiliate_products: Optional[List[Dict]] = None) -> str:
-        """プロンプトを構築"""
+                      affiliate_products: Optional[List[Dict]] = None) -> Tuple[str, str]:
+        """
+        プロンプトを構築
+        
+        Returns:
+            (サイトごとに変わらない固定部分, 記事ごとの可変部分)
+        """
         
         # 基本情報
         site_name = site_info.get('name', 'ブログ')
@@ -180,9 +248,9 @@ class VeniceArticleGenerator:
   プロモーション指針: {product.get('promotion_guidelines')}
 """
         
-        prompt = f"""
+        static_prompt = f"""
 あなたは{site_name}の専門ライターです。
-以下の条件で{genre}に関する詳細な記事を作成してください。
+{genre}に関する詳細な記事を作成してください。
 
 【サイト情報】
 - サイト名: {site_name}
@@ -194,17 +262,14 @@ class VeniceArticleGenerator:
 - コンテンツガイドライン: {content_guidelines}
 - 文体: {self._get_tone_description(tone)}
 
-【記事要件】
-- 記事タイプ: {template['name']}
-- 目標文字数: {length}文字（必須）
-- キーワード: {keyword_str}
-{affiliate_section}
+【記事タイプ】
+{template['name']}
 
 【記事構成】
 {template['structure']}
 
 【重要な指示】
-1. 必ず{length}文字程度の充実した内容にしてください
+1. 指定された目標文字数程度の充実した内容にしてください
 2. 各セクションを詳細に展開し、具体例や実践的なアドバイスを含めてください
 3. 読者が実際に行動できる具体的な情報を提供してください
 4. 専門的な内容も分かりやすく解説してください
@@ -225,7 +290,15 @@ class VeniceArticleGenerator:
 アフィリエイトリンクは [商品名](AFFILIATE_LINK_商品ID) の形式で記載
 </content>
 """
-        return prompt
+        
+        variable_prompt = f"""
+【記事要件】
+- 目標文字数: {length}文字（必須）
+- キーワード: {keyword_str}
+{affiliate_section}
+必ず{length}文字程度の記事を作成してください。
+"""
+        return static_prompt, variable_prompt
     
     def _parse_response(self, content: str) -> Dict:
         """レスポンスを解析して記事データを抽出"""
@@ -5,17 +5,89 @@ WordPress REST APIを使用して記事を自動投稿
 import requests
 import base64
 import json
-from typing import Dict, Optional, List
+import time
+import threading
+import html as html_lib
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional, List, Tuple
 import logging
 from datetime import datetime
 import os
+from .markdown_renderer import render_markdown
+from .rate_limiter import get_rate_limiter
 
 logger = logging.getLogger(__name__)
 
+# サイトごとに使い回すパブリッシャー（キー: (サイトURL, ユーザー名, アプリケーションパスワード)）
+_publisher_pool: Dict[Tuple[str, str, str], 'WordPressPublisher'] = {}
+_publisher_pool_lock = threading.Lock()
+
+# Content-Type → アップロード時の拡張子
+IMAGE_EXTENSIONS = {
+    'image/jpeg': '.jpg',
+    'image/png': '.png',
+    'image/webp': '.webp',
+    'image/gif': '.gif',
+    'image/avif': '.avif'
+}
+
+
+class _UploadStream:
+    """
+    チャンク単位で送信するアップロード本文
+
+    長さが分かる場合は len() を返し、requests に Content-Length を付けさせる
+    （0 の場合はチャンク転送になる）
+    """
+
+    def __init__(self, chunks, length: Optional[int] = None):
+        self._chunks = chunks
+        self._length = length or 0
+
+    def __iter__(self):
+        return iter(self._chunks)
+
+    def __len__(self):
+        return self._length
+
 
 class WordPressPublisher:
     """WordPress投稿管理クラス"""
     
+    # 接続確認結果を再利用する秒数
+    HEALTH_TTL = 300
+    # タイムアウト未指定のリクエストに使う秒数
+    DEFAULT_TIMEOUT = 60
+    # カテゴリ・タグのキャッシュを差分更新するまでの秒数
+    TAXONOMY_TTL = 600
+    # 1ページあたりの取得件数（REST APIの上限）
+    TERMS_PER_PAGE = 100
+    # 未登録タグを並列に作成するスレッド数
+    TERM_CREATE_WORKERS = 4
+    # 画像URLからのアップロードで1回に転送するバイト数
+    UPLOAD_CHUNK_SIZE = 64 * 1024
+    
+    @classmethod
+    def for_site(cls, site_url: str, username: str, app_password: str) -> 'WordPressPublisher':
+        """
+        サイトごとに共有するパブリッシャーを取得（HTTPセッションと接続確認結果を使い回す）
+        
+        Args:
+            site_url: WordPressサイトのURL
+            username: WordPressユーザー名
+            app_password: アプリケーションパスワード
+            
+        Returns:
+            プロセス内で共有されるWordPressPublisher
+        """
+        key = (site_url.rstrip('/'), username, app_password)
+        with _publisher_pool_lock:
+            publisher = _publisher_pool.get(key)
+            if publisher is None:
+                publisher = cls(site_url, username, app_password)
+                _publisher_pool[key] = publisher
+            return publisher
+    
     def __init__(self, site_url: str, username: str, app_password: str):
         """
         初期化
@@ -39,6 +111,58 @@ class WordPressPublisher:
         
         # APIエンドポイント
         self.api_base = f"{self.site_url}/wp-json/wp/v2"
+        
+        # keep-aliveで接続を使い回すセッション
+        self.session = requests.Session()
+        
+        # 直近の接続確認結果（成功したAPI呼び出しでも更新）
+        self._healthy = False
+        self._health_checked_at = 0.0
+        
+        # タクソノミー（categories / tags）ごとの 名前 → タームのキャッシュ
+        self._terms: Dict[str, Dict[str, Dict]] = {}
+        self._terms_loaded_at: Dict[str, float] = {}
+        self._terms_lock = threading.Lock()
+    
+    def _request(self, method: str, url: str, max_retries: int = 3, **kwargs) -> requests.Response:
+        """
+        セッション経由でリクエストし、結果を接続状態に反映
+        
+        ホストごとのレート制限を適用し、429 の場合は Retry-After に従って再試行する
+        （本文をストリーミングするリクエストは max_retries=0 で呼ぶ）
+        """
+        kwargs.setdefault('timeout', self.DEFAULT_TIMEOUT)
+        try:
+            response = get_rate_limiter().call(
+                'wordpress',
+                lambda: self.session.request(method, url, **kwargs),
+                key=self.site_url,
+                max_retries=max_retries
+            )
+        except requests.RequestException:
+            self._mark_health(False)
+            raise
+        if response.status_code < 400:
+            self._mark_health(True)
+        elif response.status_code in (401, 403):
+            self._mark_health(False)
+        return response
+    
+    def _mark_health(self, healthy: bool):
+        """接続状態を記録"""
+        self._healthy = healthy
+        self._health_checked_at = time.monotonic()
+    
+    def ensure_connection(self) -> bool:
+        """
+        接続可能か確認（HEALTH_TTL 以内の成功結果があれば再確認しない）
+        
+        Returns:
+            接続可能な場合True
+        """
+        if self._healthy and time.monotonic() - self._health_checked_at < self.HEALTH_TTL:
+            return True
+        return self.test_connection()
     
     def test_connection(self) -> bool:
         """
@@ -49,7 +173,8 @@ class WordPressPublisher:
         """
         try:
             # カテゴリエンドポイントで接続テスト（認証不要）
-            response = requests.get(
+            response = self._request(
+                'GET',
                 f"{self.api_base}/categories",
                 headers=self.headers,
                 params={'per_page': 1},
@@ -59,36 +184,134 @@ class WordPressPublisher:
                 return True
                 
             # 認証が必要なエンドポイントも試す
-            response = requests.get(
+            response = self._request(
+                'GET',
                 f"{self.api_base}/users/me",
                 headers=self.headers,
                 timeout=10
             )
-            return response.status_code == 200
+            healthy = response.status_code == 200
+            self._mark_health(healthy)
+            return healthy
         except Exception as e:
             logger.error(f"WordPress接続エラー: {str(e)}")
             return False
     
+    @staticmethod
+    def _term_key(name: str) -> str:
+        """キャッシュのキー（REST APIはHTMLエスケープ済みの名前を返すため揃える）"""
+        return html_lib.unescape(name).strip().lower()
+    
+    def _fetch_term_pages(self, taxonomy: str, stop_at_known: bool = False) -> List[Dict]:
+        """
+        タームを新しい順に全ページ取得
+        
+        Args:
+            taxonomy: categories または tags
+            stop_at_known: Trueの場合はキャッシュ済みのIDが現れたページで打ち切る（差分更新）
+        """
+        known_ids = {term['id'] for term in self._terms.get(taxonomy, {}).values()}
+        terms = []
+        page = 1
+        while True:
+            response = self._request(
+                'GET',
+                f"{self.api_base}/{taxonomy}",
+                headers=self.headers,
+                params={'per_page': self.TERMS_PER_PAGE, 'page': page,
+                        'orderby': 'id', 'order': 'desc', 'hide_empty': False},
+                timeout=30
+            )
+            if response.status_code != 200:
+                raise Exception(f"{taxonomy} 取得エラー: {response.status_code}")
+            batch = response.json()
+            terms.extend(batch)
+            total_pages = int(response.headers.get('X-WP-TotalPages', page) or page)
+            if stop_at_known and any(term['id'] in known_ids for term in batch):
+                break
+            if page >= total_pages or not batch:
+                break
+            page += 1
+        return terms
+    
+    def _load_terms(self, taxonomy: str, force: bool = False) -> Dict[str, Dict]:
+        """
+        タームのキャッシュを取得（初回は全件取得、TTL経過後は新しく追加された分だけ取得）
+        
+        Returns:
+            名前 → タームの辞書
+        """
+        with self._terms_lock:
+            loaded_at = self._terms_loaded_at.get(taxonomy)
+            if not force and loaded_at is not None and time.monotonic() - loaded_at < self.TAXONOMY_TTL:
+                return self._terms[taxonomy]
+            
+            incremental = not force and taxonomy in self._terms
+            fetched = self._fetch_term_pages(taxonomy, stop_at_known=incremental)
+            terms = dict(self._terms.get(taxonomy, {})) if incremental else {}
+            for term in fetched:
+                terms[self._term_key(term['name'])] = term
+            self._terms[taxonomy] = terms
+            self._terms_loaded_at[taxonomy] = time.monotonic()
+            logger.info(f"{taxonomy} キャッシュ更新: {len(fetched)}件取得（計{len(terms)}件）")
+            return terms
+    
+    def _remember_term(self, taxonomy: str, term: Dict):
+        """作成したタームをキャッシュに追加"""
+        with self._terms_lock:
+            self._terms.setdefault(taxonomy, {})[self._term_key(term['name'])] = term
+    
+    def invalidate_terms(self):
+        """カテゴリ・タグのキャッシュを破棄（次回は全件取得）"""
+        with self._terms_lock:
+            self._terms.clear()
+            self._terms_loaded_at.clear()
+    
     def get_categories(self) -> List[Dict]:
         """
-        カテゴリ一覧を取得
+        カテゴリ一覧を取得（キャッシュ経由、全ページ）
         
         Returns:
             カテゴリのリスト
         """
         try:
-            response = requests.get(
-                f"{self.api_base}/categories",
-                headers=self.headers,
-                params={'per_page': 100}
-            )
-            if response.status_code == 200:
-                return response.json()
-            return []
+            return sorted(self._load_terms('categories').values(), key=lambda c: c['id'])
         except Exception as e:
             logger.error(f"カテゴリ取得エラー: {str(e)}")
             return []
     
+    def _create_term(self, taxonomy: str, name: str) -> Optional[int]:
+        """
+        タームを作成してIDを返す（既に存在する場合は既存のID）
+        
+        Args:
+            taxonomy: categories または tags
+            name: ターム名
+        """
+        response = self._request(
+            'POST',
+            f"{self.api_base}/{taxonomy}",
+            headers=self.headers,
+            json={'name': name}
+        )
+        if response.status_code in [200, 201]:
+            term = response.json()
+            self._remember_term(taxonomy, term)
+            return term['id']
+        
+        # キャッシュ後に他から作成された場合は既存のIDが返る
+        try:
+            error = response.json()
+        except ValueError:
+            error = {}
+        if error.get('code') == 'term_exists':
+            term_id = error.get('data', {}).get('term_id')
+            if term_id:
+                self._remember_term(taxonomy, {'id': term_id, 'name': name})
+                return term_id
+        logger.error(f"{taxonomy} 作成エラー: {response.status_code} - {response.text}")
+        return None
+    
     def get_or_create_category(self, category_name: str) -> Optional[int]:
         """
         カテゴリを取得または作成
@@ -99,69 +322,148 @@ class WordPressPublisher:
         Returns:
             カテゴリID
         """
-        # 既存のカテゴリを検索
-        categories = self.get_categories()
-        for cat in categories:
-            if cat['name'] == category_name:
-                return cat['id']
-        
-        # 新規作成
         try:
-            response = requests.post(
-                f"{self.api_base}/categories",
-                headers=self.headers,
-                json={'name': category_name}
-            )
-            if response.status_code in [200, 201]:
-                return response.json()['id']
+            # 既存のカテゴリを検索
+            category = self._load_terms('categories').get(self._term_key(category_name))
+            if category:
+                return category['id']
+            
+            # 新規作成
+            return self._create_term('categories', category_name)
         except Exception as e:
             logger.error(f"カテゴリ作成エラー: {str(e)}")
         
         return None
     
-    def upload_media(self, image_url: str, alt_text: str = "") -> Optional[int]:
+    def resolve_tags(self, tag_names: List[str]) -> List[int]:
         """
-        画像をメディアライブラリにアップロード
+        タグ名をIDに変換（キャッシュにないタグは並列に作成）
         
         Args:
-            image_url: 画像URL
-            alt_text: 代替テキスト
+            tag_names: タグ名のリスト
             
         Returns:
-            メディアID
+            タグIDのリスト（入力順、解決できなかったタグは除く）
         """
         try:
-            # 画像をダウンロード
-            image_response = requests.get(image_url, timeout=30)
-            if image_response.status_code != 200:
-                return None
-            
-            # ファイル名を生成
-            filename = f"image_{datetime.now().strftime('%Y%m%d%H%M%S')}.jpg"
-            
-            # WordPressにアップロード
-            headers = self.headers.copy()
-            headers['Content-Type'] = 'image/jpeg'
-            headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+            tags = self._load_terms('tags')
+        except Exception as e:
+            logger.error(f"タグ取得エラー: {str(e)}")
+            tags = self._terms.get('tags', {})
+        
+        resolved = {}
+        missing = []
+        for name in tag_names:
+            term = tags.get(self._term_key(name))
+            if term:
+                resolved[name] = term['id']
+            elif name not in missing:
+                missing.append(name)
+        
+        if missing:
+            with ThreadPoolExecutor(max_workers=min(self.TERM_CREATE_WORKERS, len(missing))) as executor:
+                for name, tag_id in zip(missing, executor.map(self._get_or_create_tag, missing)):
+                    if tag_id:
+                        resolved[name] = tag_id
+        
+        tag_ids = []
+        for name in tag_names:
+            tag_id = resolved.get(name)
+            if tag_id and tag_id not in tag_ids:
+                tag_ids.append(tag_id)
+        return tag_ids
+    
+    def _upload_media_body(self, body, file_name: str, content_type: str,
+                           alt_text: str = "", caption: str = "") -> Optional[int]:
+        """
+        メディアを1リクエストでアップロード（alt_text・captionはクエリで同時に設定）
+        
+        Args:
+            body: 送信する本文（ファイルオブジェクトまたはチャンクのイテラブル）
+            file_name: ファイル名
+            content_type: Content-Type
+            alt_text: 代替テキスト
+            caption: キャプション
             
-            response = requests.post(
-                f"{self.api_base}/media",
-                headers=headers,
-                data=image_response.content
+        Returns:
+            メディアID、失敗時はNone
+        """
+        headers = {
+            **self.headers,
+            'Content-Type': content_type,
+            'Content-Disposition': f'attachment; filename="{file_name}"'
+        }
+        params = {}
+        if alt_text:
+            params['alt_text'] = alt_text
+        if caption:
+            params['caption'] = caption
+        
+        response = self._request(
+            'POST',
+            f"{self.api_base}/media",
+            headers=headers,
+            params=params,
+            data=body,
+            max_retries=0
+        )
+        
+        if response.status_code not in [200, 201]:
+            logger.error(f"メディアアップロードエラー: {response.status_code}")
+            return None
+        
+        media = response.json()
+        media_id = media['id']
+        
+        # クエリのalt_textを受け付けない環境のみ追加で設定する
+        if alt_text and not media.get('alt_text'):
+            update_data = {'alt_text': alt_text}
+            if caption:
+                update_data['caption'] = caption
+            self._request(
+                'POST',
+                f"{self.api_base}/media/{media_id}",
+                headers=self.headers,
+                json=update_data
             )
+        
+        logger.info(f"メディアアップロード成功: {media_id}")
+        return media_id
+    
+    def upload_media(self, image_url: str, alt_text: str = "", caption: str = "") -> Optional[int]:
+        """
+        画像をメディアライブラリにアップロード（ダウンロードしながら転送し、全体をメモリに載せない）
+        
+        Args:
+            image_url: 画像URL
+            alt_text: 代替テキスト
+            caption: キャプション
             
-            if response.status_code in [200, 201]:
-                media_id = response.json()['id']
+        Returns:
+            メディアID
+        """
+        try:
+            # 画像をストリーミングでダウンロード
+            with requests.get(image_url, stream=True, timeout=30) as image_response:
+                if image_response.status_code != 200:
+                    return None
                 
-                # 代替テキストを設定
-                if alt_text:
-                    requests.post(
-                        f"{self.api_base}/media/{media_id}",
-                        headers=self.headers,
-                        json={'alt_text': alt_text}
-                    )
+                content_type = image_response.headers.get('Content-Type', 'image/jpeg').split(';')[0].strip()
+                if not content_type.startswith('image/'):
+                    content_type = 'image/jpeg'
                 
-                return media_id
+                # ファイル名を生成
+                extension = IMAGE_EXTENSIONS.get(content_type, '.jpg')
+                filename = f"image_{datetime.now().strftime('%Y%m%d%H%M%S')}{extension}"
+                
+                # 圧縮転送の場合は展開後の長さが分からないためチャンク転送にする
+                length = None
+                if not image_response.headers.get('Content-Encoding'):
+                    length = int(image_response.headers.get('Content-Length', 0) or 0)
+                
+                # WordPressにアップロード
+                body = _UploadStream(image_response.iter_content(self.UPLOAD_CHUNK_SIZE), length)
+                return self._upload_media_body(body, filename, content_type, alt_text, caption)
                 
         except Exception as e:
             logger.error(f"画像アップロードエラー: {str(e)}")
@@ -175,7 +477,8 @@ class WordPressPublisher:
                     categories: List[int] = None,
                     tags: List[str] = None,
                     featured_media_id: Optional[int] = None,
-                    status: str = "publish") -> Optional[Dict]:
+                    status: str = "publish",
+                    idempotency_key: Optional[str] = None) -> Optional[Dict]:
         """
         記事を投稿
         
@@ -187,6 +490,7 @@ class WordPressPublisher:
             tags: タグのリスト
             featured_media_id: アイキャッチ画像ID
             status: 投稿ステータス（publish, draft, private）
+            idempotency_key: 再投稿防止用のキー（本文末尾にHTMLコメントとして埋め込む）
             
         Returns:
             投稿結果の辞書、失敗時None
@@ -194,6 +498,8 @@ class WordPressPublisher:
         try:
             # マークダウンをHTMLに変換
             html_content = self._markdown_to_html(content)
+            if idempotency_key:
+                html_content += f"\n{self._idempotency_marker(idempotency_key)}"
             
             # 投稿データを構築
             post_data = {
@@ -211,11 +517,7 @@ class WordPressPublisher:
             
             # タグを設定
             if tags:
-                tag_ids = []
-                for tag_name in tags:
-                    tag_id = self._get_or_create_tag(tag_name)
-                    if tag_id:
-                        tag_ids.append(tag_id)
+                tag_ids = self.resolve_tags(tags)
                 if tag_ids:
                     post_data['tags'] = tag_ids
             
@@ -224,7 +526,8 @@ class WordPressPublisher:
                 post_data['featured_media'] = featured_media_id
             
             # 投稿
-            response = requests.post(
+            response = self._request(
+                'POST',
                 f"{self.api_base}/posts",
                 headers=self.headers,
                 json=post_data
@@ -247,6 +550,51 @@ class WordPressPublisher:
         
         return None
     
+    @staticmethod
+    def _idempotency_marker(idempotency_key: str) -> str:
+        """本文に埋め込む冪等キーのHTMLコメント（表示されない）"""
+        return f"<!-- pae-publish:{idempotency_key} -->"
+    
+    def find_post_by_idempotency_key(self, idempotency_key: str) -> Optional[Dict]:
+        """
+        冪等キーを埋め込んだ投稿を検索（前回の投稿がタイムアウトした場合の確認用）
+        
+        Args:
+            idempotency_key: 投稿時に指定した冪等キー
+            
+        Returns:
+            publish_post と同じ形式の辞書、見つからない場合None
+        """
+        marker = self._idempotency_marker(idempotency_key)
+        try:
+            response = self._request(
+                'GET',
+                f"{self.api_base}/posts",
+                headers=self.headers,
+                params={
+                    'search': f"pae-publish:{idempotency_key}",
+                    'status': 'publish,future,draft,pending,private',
+                    'context': 'edit',
+                    'per_page': 5
+                },
+                timeout=30
+            )
+            if response.status_code != 200:
+                logger.error(f"投稿検索エラー: {response.status_code}")
+                return None
+            for post in response.json():
+                content = post.get('content', {})
+                if marker in (content.get('raw') or content.get('rendered') or ''):
+                    return {
+                        'id': post['id'],
+                        'link': post['link'],
+                        'title': post.get('title', {}).get('rendered', ''),
+                        'status': post['status']
+                    }
+        except Exception as e:
+            logger.error(f"投稿検索エラー: {str(e)}")
+        return None
+    
     def _get_or_create_tag(self, tag_name: str) -> Optional[int]:
         """
         タグを取得または作成
@@ -258,29 +606,10 @@ class WordPressPublisher:
             タグID
         """
         try:
-            # 既存のタグを検索
-            response = requests.get(
-                f"{self.api_base}/tags",
-                headers=self.headers,
-                params={'search': tag_name}
-            )
-            
-            if response.status_code == 200:
-                tags = response.json()
-                for tag in tags:
-                    if tag['name'] == tag_name:
-                        return tag['id']
-            
-            # 新規作成
-            response = requests.post(
-                f"{self.api_base}/tags",
-                headers=self.headers,
-                json={'name': tag_name}
-            )
-            
-            if response.status_code in [200, 201]:
-                return response.json()['id']
-                
+            tag = self._terms.get('tags', {}).get(self._term_key(tag_name))
+            if tag:
+                return tag['id']
+            return self._create_term('tags', tag_name)
         except Exception as e:
             logger.error(f"タグ作成エラー: {str(e)}")
         
@@ -288,7 +617,7 @@ class WordPressPublisher:
     
     def _markdown_to_html(self, markdown_text: str) -> str:
         """
-        マークダウンをHTMLに変換
+        マークダウンをHTMLに変換（同じ本文の変換結果はキャッシュを使う）
         
         Args:
             markdown_text: マークダウンテキスト
@@ -296,93 +625,40 @@ class WordPressPublisher:
         Returns:
             HTML
         """
-        # 簡易的な変換（必要に応じてmarkdownライブラリを使用）
-        html = markdown_text
-        
-        # 見出しを変換
-        html = html.replace('### ', '<h3>')
-        html = html.replace('## ', '<h2>')
-        html = html.replace('# ', '<h1>')
-        
-        # 改行を追加
-        lines = html.split('\n')
-        for i, line in enumerate(lines):
-            if line.startswith('<h'):
-                lines[i] = line + '</h' + line[2] + '>'
-            elif line.strip():
-                lines[i] = f'<p>{line}</p>'
-        
-        # リンクを変換
-        import re
-        html = '\n'.join(lines)
-        html = re.sub(r'\[([^\]]+)\]\(([^\)]+)\)', r'<a href="\2">\1</a>', html)
-        
-        # 太字を変換
-        html = re.sub(r'\*\*([^\*]+)\*\*', r'<strong>\1</strong>', html)
-        
-        return html
+        return render_markdown(markdown_text)
     
-    def upload_media_from_file(self, file_path: str, alt_text: str = "") -> Optional[int]:
+    def upload_media_from_file(self, file_path: str, alt_text: str = "",
+                               caption: Optional[str] = None) -> Optional[int]:
         """
-        ローカルファイルから画像をアップロード
+        ローカルファイルから画像をアップロード（ファイルを開いたまま送信し、全体を読み込まない）
         
         Args:
             file_path: アップロードするファイルのパス
             alt_text: 代替テキスト
+            caption: キャプション（省略時は代替テキスト）
             
         Returns:
             メディアID、失敗時はNone
         """
         try:
-            # ファイルを読み込む
-            with open(file_path, 'rb') as f:
-                file_data = f.read()
-            
             # ファイル名を取得
             file_name = os.path.basename(file_path)
             
             # Content-Typeを判定
             content_type = 'image/jpeg'
-            if file_name.lower().endswith('.png'):
-                content_type = 'image/png'
-            elif file_name.lower().endswith('.webp'):
-                content_type = 'image/webp'
+            for candidate, extension in IMAGE_EXTENSIONS.items():
+                if file_name.lower().endswith(extension):
+                    content_type = candidate
+                    break
             
             # WordPressにアップロード
-            headers = {
-                **self.headers,
-                'Content-Type': content_type,
-                'Content-Disposition': f'attachment; filename="{file_name}"'
-            }
-            
-            response = requests.post(
-                f"{self.api_base}/media",
-                headers=headers,
-                data=file_data
-            )
-            
-            if response.status_code in [200, 201]:
-                media = response.json()
-                media_id = media['id']
-                
-                # altテキストを設定
-                if alt_text:
-                    update_data = {
-                        'alt_text': alt_text,
-                        'caption': alt_text
-                    }
-                    requests.post(
-                        f"{self.api_base}/media/{media_id}",
-                        headers=self.headers,
-                        json=update_data
-                    )
-                
-                logger.info(f"メディアアップロード成功: {media_id}")
-                return media_id
-            else:
-                logger.error(f"メディアアップロードエラー: {response.status_code}")
+            with open(file_path, 'rb') as f:
+                return self._upload_media_body(
+                    f, file_name, content_type, alt_text,
+                    alt_text if caption is None else caption
+                )
                 
         except Exception as e:
             logger.error(f"ファイルアップロードエラー: {str(e)}")
         
-        return None
\ No newline at end of file
+        return None
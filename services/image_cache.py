@@ -1,11 +1,20 @@
 """
 軽量画像キャッシュ管理システム
 メモリ効率を考慮した画像キャッシュ
+
+インデックスは SQLite（WALモード）に保存し、アプリとデーモンなど複数のプロセスで共有する。
+アクセス時刻と統計の更新はメモリにためて差分としてまとめて書き出し、期限切れの削除は
+バックグラウンドのタイマーで行う
 """
-import os
 import json
+import time
+import atexit
+import uuid
+import sqlite3
 import hashlib
 import shutil
+import threading
+from contextlib import contextmanager
 from datetime import datetime, timedelta
 from pathlib import Path
 from typing import Optional, Dict, List
@@ -18,58 +27,269 @@ logger = logging.getLogger(__name__)
 class ImageCache:
     """軽量画像キャッシュ管理"""
     
-    def __init__(self, cache_dir: str = "data/image_cache", max_size_gb: float = 1.0):
+    # アクセス時刻などの更新をインデックスへ書き出す間隔（秒）
+    FLUSH_INTERVAL = 30
+    # 期限切れキャッシュを削除する間隔（秒）
+    CLEANUP_INTERVAL = 3600
+    # 期限切れとみなす日数
+    MAX_AGE_DAYS = 30
+    # 上限超過時に1回の問い合わせで削除候補として読むエントリ数
+    EVICT_BATCH = 50
+    
+    def __init__(self, cache_dir: str = "data/image_cache", max_size_gb: float = 1.0,
+                 background: bool = True):
+        """
+        初期化
+        
+        Args:
+            cache_dir: キャッシュディレクトリ
+            max_size_gb: キャッシュの上限サイズ（GB）
+            background: 書き出しとクリーンアップを行うタイマースレッドを起動するか
+        """
         self.cache_dir = Path(cache_dir)
         self.cache_dir.mkdir(parents=True, exist_ok=True)
         self.max_size = int(max_size_gb * 1024 * 1024 * 1024)  # GB→Byte変換
+        self.db_path = self.cache_dir / "cache_index.db"
+        # 移行元のJSONインデックス
         self.index_file = self.cache_dir / "cache_index.json"
-        self.index = self._load_index()
+        self._local = threading.local()
+        # まだ書き出していないアクセス時刻と統計の差分
+        self._lock = threading.Lock()
+        self._pending_access: Dict[str, str] = {}
+        self._pending_stats = {"hits": 0, "misses": 0}
+        self._init_db()
         
-    def _load_index(self) -> Dict:
-        """キャッシュインデックスを読み込む"""
+        # 初回のみ既存のJSONインデックスを取り込む
+        if not self._get_meta('legacy_imported'):
+            self._import_legacy_index()
+        
+        self._stop_event = threading.Event()
+        self._worker = None
+        if background:
+            self._worker = threading.Thread(target=self._background_loop, name="image-cache", daemon=True)
+            self._worker.start()
+            atexit.register(self.close)
+    
+    def _get_connection(self) -> sqlite3.Connection:
+        """スレッドごとの接続を取得（トランザクションは明示的に開始する）"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(str(self.db_path), timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+    
+    @contextmanager
+    def _write_transaction(self):
+        """書き込みロックを取得したトランザクション（他のプロセスの書き込みと排他にする）"""
+        conn = self._get_connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield conn
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+    
+    def _init_db(self):
+        """テーブルとインデックスを作成"""
+        self._get_connection().executescript('''
+            CREATE TABLE IF NOT EXISTS cache_entries (
+                key TEXT PRIMARY KEY,
+                path TEXT NOT NULL,
+                service TEXT,
+                created TEXT NOT NULL,
+                last_access TEXT NOT NULL,
+                size INTEGER NOT NULL DEFAULT 0,
+                spare_pool TEXT,
+                spare_genre TEXT,
+                spare_keywords TEXT
+            );
+            CREATE INDEX IF NOT EXISTS idx_cache_last_access
+                ON cache_entries(last_access);
+            CREATE INDEX IF NOT EXISTS idx_cache_spare_pool
+                ON cache_entries(spare_pool);
+            CREATE TABLE IF NOT EXISTS cache_stats (
+                name TEXT PRIMARY KEY,
+                value INTEGER NOT NULL DEFAULT 0
+            );
+            CREATE TABLE IF NOT EXISTS cache_meta (
+                key TEXT PRIMARY KEY,
+                value TEXT
+            );
+        ''')
+        # 合計サイズは登録・削除のたびに cache_stats の total_size に加減する（以前のデータベースは初回に集計）
+        with self._write_transaction() as conn:
+            if conn.execute("SELECT 1 FROM cache_stats WHERE name = 'total_size'").fetchone() is None:
+                conn.execute(
+                    '''INSERT INTO cache_stats (name, value)
+                       SELECT 'total_size', COALESCE(SUM(size), 0) FROM cache_entries'''
+                )
+    
+    def _get_meta(self, key: str) -> Optional[str]:
+        """メタ情報を取得"""
+        row = self._get_connection().execute(
+            'SELECT value FROM cache_meta WHERE key = ?', (key,)
+        ).fetchone()
+        return row['value'] if row else None
+    
+    def _import_legacy_index(self):
+        """JSONのキャッシュインデックスを取り込む（取り込み済みのキーは上書きしない）"""
+        data = {}
         if self.index_file.exists():
             try:
                 with open(self.index_file, 'r', encoding='utf-8') as f:
-                    return json.load(f)
-            except:
-                return {"entries": {}}
-        return {"entries": {}}
+                    data = json.load(f)
+            except Exception as e:
+                logger.warning(f"キャッシュインデックス読み込みエラー: {str(e)}")
+        
+        with self._write_transaction() as conn:
+            for key, entry in data.get("entries", {}).items():
+                if conn.execute('SELECT 1 FROM cache_entries WHERE key = ?', (key,)).fetchone():
+                    continue
+                self._insert_entry(conn, key, entry["path"], entry.get("service"), entry["created"],
+                                   entry.get("last_access", entry["created"]), entry.get("size", 0),
+                                   spare=entry.get("spare"))
+            for name, value in data.get("stats", {}).items():
+                self._add_stat(conn, name, value)
+            conn.execute("INSERT OR REPLACE INTO cache_meta (key, value) VALUES ('legacy_imported', ?)",
+                         (datetime.now().isoformat(),))
+        if data:
+            logger.info(f"キャッシュインデックスをSQLiteに移行: {len(data.get('entries', {}))}件")
+    
+    @staticmethod
+    def _add_stat(conn: sqlite3.Connection, name: str, delta: int):
+        """統計に差分を加算"""
+        if delta:
+            conn.execute(
+                '''INSERT INTO cache_stats (name, value) VALUES (?, ?)
+                   ON CONFLICT(name) DO UPDATE SET value = value + excluded.value''',
+                (name, delta)
+            )
+    
+    @staticmethod
+    def _get_stat(conn: sqlite3.Connection, name: str) -> int:
+        """統計の値を取得"""
+        row = conn.execute('SELECT value FROM cache_stats WHERE name = ?', (name,)).fetchone()
+        return row['value'] if row else 0
     
-    def _save_index(self):
-        """キャッシュインデックスを保存"""
-        with open(self.index_file, 'w', encoding='utf-8') as f:
-            json.dump(self.index, f, indent=2, ensure_ascii=False)
+    def _apply_pending(self, conn: sqlite3.Connection):
+        """ためていたアクセス時刻と統計の差分をトランザクション内で反映"""
+        with self._lock:
+            access = self._pending_access
+            stats = self._pending_stats
+            self._pending_access = {}
+            self._pending_stats = {"hits": 0, "misses": 0}
+        # 他のプロセスが記録したより新しいアクセス時刻は残す
+        conn.executemany(
+            'UPDATE cache_entries SET last_access = max(last_access, ?) WHERE key = ?',
+            [(accessed, key) for key, accessed in access.items()]
+        )
+        for name, delta in stats.items():
+            self._add_stat(conn, name, delta)
+    
+    def flush(self):
+        """未保存の更新があればインデックスに書き出す"""
+        with self._lock:
+            dirty = bool(self._pending_access) or any(self._pending_stats.values())
+        if not dirty:
+            return
+        try:
+            with self._write_transaction() as conn:
+                self._apply_pending(conn)
+        except Exception as e:
+            logger.error(f"キャッシュインデックス保存エラー: {str(e)}")
+    
+    def _background_loop(self):
+        """一定間隔で書き出しと期限切れの削除を行う"""
+        last_cleanup = time.monotonic()
+        while not self._stop_event.wait(self.FLUSH_INTERVAL):
+            if time.monotonic() - last_cleanup >= self.CLEANUP_INTERVAL:
+                self.cleanup_old_cache()
+                last_cleanup = time.monotonic()
+            self.flush()
+    
+    def close(self):
+        """タイマーを止めて未保存の更新を書き出す"""
+        self._stop_event.set()
+        self.flush()
     
     def get_cache_key(self, prompt: str, service: str) -> str:
         """プロンプトとサービスからキャッシュキーを生成"""
         content = f"{prompt}_{service}"
         return hashlib.md5(content.encode()).hexdigest()
     
+    @staticmethod
+    def _delete_files(paths: List[str]):
+        """インデックスから外したキャッシュファイルを削除"""
+        for path in paths:
+            try:
+                Path(path).unlink()
+            except FileNotFoundError:
+                pass
+            except Exception as e:
+                logger.warning(f"キャッシュファイル削除エラー: {str(e)}")
+    
+    def _insert_entry(self, conn: sqlite3.Connection, key: str, path: str, service: Optional[str],
+                      created: str, last_access: str, size: int, spare: Optional[Dict] = None):
+        """トランザクション内でインデックスにエントリを追加し、合計サイズに加算"""
+        conn.execute(
+            '''INSERT INTO cache_entries
+               (key, path, service, created, last_access, size,
+                spare_pool, spare_genre, spare_keywords)
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)''',
+            (key, path, service, created, last_access, size,
+             spare["pool"] if spare else None, spare["genre"] if spare else None,
+             json.dumps(spare["keywords"], ensure_ascii=False) if spare else None)
+        )
+        self._add_stat(conn, "total_size", size)
+    
+    def _remove_entry(self, conn: sqlite3.Connection, prompt_hash: str,
+                      path: Optional[str] = None) -> Optional[sqlite3.Row]:
+        """
+        トランザクション内でインデックスからエントリを外し、合計サイズから減算
+        （path を指定した場合はそのファイルのエントリのときだけ外す。ファイルは呼び出し元で削除）
+        """
+        row = conn.execute('SELECT * FROM cache_entries WHERE key = ?', (prompt_hash,)).fetchone()
+        if row is None or (path is not None and row['path'] != path):
+            return None
+        conn.execute('DELETE FROM cache_entries WHERE key = ?', (prompt_hash,))
+        self._add_stat(conn, "total_size", -row['size'])
+        with self._lock:
+            self._pending_access.pop(prompt_hash, None)
+        return row
+    
     def get_cached_image(self, prompt_hash: str) -> Optional[str]:
         """
-        キャッシュから画像を取得
+        キャッシュから画像を取得（アクセス時刻の更新は後でまとめて保存）
         
         Args:
             prompt_hash: プロンプトのハッシュ値
-            
+        
         Returns:
             キャッシュされた画像のパス、なければNone
         """
-        if prompt_hash in self.index["entries"]:
-            entry = self.index["entries"][prompt_hash]
-            image_path = Path(entry["path"])
+        row = self._get_connection().execute(
+            'SELECT path FROM cache_entries WHERE key = ? AND spare_pool IS NULL', (prompt_hash,)
+        ).fetchone()
+        if row is not None:
+            image_path = Path(row['path'])
             
             if image_path.exists():
-                # アクセス時刻を更新
-                entry["last_access"] = datetime.now().isoformat()
-                self._save_index()
+                with self._lock:
+                    self._pending_access[prompt_hash] = datetime.now().isoformat()
+                    self._pending_stats["hits"] += 1
                 logger.info(f"キャッシュヒット: {prompt_hash}")
                 return str(image_path)
-            else:
-                # ファイルが存在しない場合はインデックスから削除
-                del self.index["entries"][prompt_hash]
-                self._save_index()
+            
+            # ファイルが存在しない場合はインデックスから削除
+            with self._write_transaction() as conn:
+                self._remove_entry(conn, prompt_hash, row['path'])
         
+        with self._lock:
+            self._pending_stats["misses"] += 1
         return None
     
     def save_to_cache(self, prompt_hash: str, image_path: str, service: str) -> str:
@@ -80,30 +300,118 @@ class ImageCache:
             prompt_hash: プロンプトのハッシュ値
             image_path: 元画像のパス
             service: 使用したサービス名
-            
+        
         Returns:
             キャッシュ内の画像パス
         """
+        return self._store(prompt_hash, image_path, service)
+    
+    def remove(self, prompt_hash: str):
+        """
+        キャッシュからエントリと画像を削除（使わなくなった生成画像の破棄用）
+        
+        Args:
+            prompt_hash: プロンプトのハッシュ値
+        """
+        with self._write_transaction() as conn:
+            row = self._remove_entry(conn, prompt_hash)
+        if row is not None:
+            self._delete_files([row['path']])
+    
+    def add_spare(self, pool_key: str, image_path: str, service: str,
+                  genre: str, keywords: List[str]) -> str:
+        """
+        複数候補の生成で余った画像を予備として保存
+        
+        Args:
+            pool_key: ジャンル・スタイルが同じ記事で共有するプールのキー
+            image_path: 元画像のパス
+            service: 使用したサービス名
+            genre: ジャンル
+            keywords: 画像のキーワード（正規化済み）
+        
+        Returns:
+            キャッシュ内の画像パス
+        """
+        spare_key = f"spare-{uuid.uuid4().hex}"
+        spare = {"pool": pool_key, "genre": genre, "keywords": sorted(set(keywords))}
+        return self._store(spare_key, image_path, service, spare=spare)
+    
+    def take_spare(self, pool_key: str, keywords: List[str], prompt_hash: str,
+                   min_overlap: int = 1) -> Optional[str]:
+        """
+        プールからキーワードが最も多く一致する予備画像を取り出す
+        
+        取り出した画像は prompt_hash の通常のエントリになり、他の記事には渡さない
+        
+        Args:
+            pool_key: プールのキー
+            keywords: 記事のキーワード（正規化済み）
+            prompt_hash: 取り出した画像を登録するキャッシュキー
+            min_overlap: 必要な一致キーワード数（0でプール内のどの画像でもよい）
+        
+        Returns:
+            画像のパス、該当がなければNone
+        """
+        wanted = set(keywords)
+        removed = []
+        with self._write_transaction() as conn:
+            # 選択から取り出しまでを書き込みロック内で行い、同じ予備画像を複数のプロセスに渡さない
+            rows = conn.execute(
+                'SELECT * FROM cache_entries WHERE spare_pool = ? ORDER BY last_access', (pool_key,)
+            ).fetchall()
+            candidates = sorted(
+                ((len(wanted & set(json.loads(row['spare_keywords']))), row) for row in rows),
+                key=lambda candidate: -candidate[0]
+            )
+            best, best_overlap = None, 0
+            for overlap, row in candidates:
+                if overlap < min_overlap:
+                    break
+                self._remove_entry(conn, row['key'])
+                if Path(row['path']).exists():
+                    best, best_overlap = row, overlap
+                    break
+                # ファイルが消えている予備画像はインデックスから外して次の候補を試す
+            if best is None:
+                return None
+            
+            previous = self._remove_entry(conn, prompt_hash)
+            if previous is not None and previous['path'] != best['path']:
+                removed.append(previous['path'])
+            self._insert_entry(conn, prompt_hash, best['path'], best['service'], best['created'],
+                               datetime.now().isoformat(), best['size'])
+            self._add_stat(conn, "spare_hits", 1)
+        self._delete_files(removed)
+        
+        logger.info(f"予備画像を使用: {best['path']}（一致キーワード {best_overlap}件）")
+        return best['path']
+    
+    def _store(self, prompt_hash: str, image_path: str, service: str,
+               spare: Optional[Dict] = None) -> str:
+        """画像を圧縮してキャッシュに登録"""
         # キャッシュファイル名を生成
         cache_filename = f"{prompt_hash}_{service}.jpg"
         cache_path = self.cache_dir / cache_filename
         
         # 画像を圧縮して保存
         self.compress_image(image_path, str(cache_path))
+        size = cache_path.stat().st_size
         
-        # インデックスに追加
-        self.index["entries"][prompt_hash] = {
-            "path": str(cache_path),
-            "service": service,
-            "created": datetime.now().isoformat(),
-            "last_access": datetime.now().isoformat(),
-            "size": cache_path.stat().st_size
-        }
-        
-        self._save_index()
-        
-        # 容量チェックと古いファイルの削除
-        self.optimize_storage()
+        now = datetime.now().isoformat()
+        removed = []
+        with self._write_transaction() as conn:
+            previous = self._remove_entry(conn, prompt_hash)
+            if previous is not None and previous['path'] != str(cache_path):
+                removed.append(previous['path'])
+            
+            # インデックスに追加（最新アクセスとして登録）
+            self._insert_entry(conn, prompt_hash, str(cache_path), service, now, now, size, spare=spare)
+            
+            # 容量チェックと古いファイルの削除（削除順に使うアクセス時刻を先に反映する）
+            self._apply_pending(conn)
+            removed.extend(self._evict(conn))
+        self._delete_files(removed)
         
         return str(cache_path)
     
@@ -135,77 +443,101 @@ class ImageCache:
                 # JPEG形式で保存
                 img.save(output_path, 'JPEG', quality=quality, optimize=True)
                 logger.info(f"画像圧縮完了: {output_path}")
-                
+        
         except Exception as e:
             logger.error(f"画像圧縮エラー: {str(e)}")
             # 圧縮失敗時は元画像をコピー
             shutil.copy2(image_path, output_path)
     
-    def optimize_storage(self):
-        """ストレージ最適化"""
-        # 現在のキャッシュサイズを計算
-        total_size = sum(entry["size"] for entry in self.index["entries"].values())
+    def _evict(self, conn: sqlite3.Connection) -> List[str]:
+        """上限を超えていれば最終アクセスの古い順に80%まで削減（削除したファイルのパスを返す）"""
+        total_size = self._get_stat(conn, "total_size")
+        if total_size <= self.max_size:
+            return []
         
-        if total_size > self.max_size:
-            logger.info(f"キャッシュサイズ超過: {total_size / 1024 / 1024:.1f}MB")
-            
-            # アクセス時刻でソート（古い順）
-            sorted_entries = sorted(
-                self.index["entries"].items(),
-                key=lambda x: x[1].get("last_access", x[1]["created"])
-            )
-            
-            # 古いファイルから削除
-            for prompt_hash, entry in sorted_entries:
-                if total_size <= self.max_size * 0.8:  # 80%まで削減
+        logger.info(f"キャッシュサイズ超過: {total_size / 1024 / 1024:.1f}MB")
+        removed = []
+        target = self.max_size * 0.8
+        while total_size > target:
+            # 古い順に少しずつ読み、目標を下回った時点で止める
+            rows = conn.execute(
+                'SELECT key, path, size FROM cache_entries ORDER BY last_access LIMIT ?', (self.EVICT_BATCH,)
+            ).fetchall()
+            if not rows:
+                break
+            for row in rows:
+                if total_size <= target:
                     break
-                
-                try:
-                    Path(entry["path"]).unlink()
-                    total_size -= entry["size"]
-                    del self.index["entries"][prompt_hash]
-                    logger.info(f"古いキャッシュを削除: {entry['path']}")
-                except:
-                    pass
-            
-            self._save_index()
-        
-        # 30日以上古いファイルも削除
-        self.cleanup_old_cache()
+                self._remove_entry(conn, row['key'])
+                total_size -= row['size']
+                removed.append(row['path'])
+                logger.info(f"古いキャッシュを削除: {row['path']}")
+        return removed
     
-    def cleanup_old_cache(self, days: int = 30):
-        """定期的なキャッシュクリーンアップ"""
-        cutoff_date = datetime.now() - timedelta(days=days)
-        entries_to_delete = []
-        
-        for prompt_hash, entry in self.index["entries"].items():
-            last_access = datetime.fromisoformat(entry.get("last_access", entry["created"]))
-            if last_access < cutoff_date:
-                entries_to_delete.append(prompt_hash)
+    def optimize_storage(self):
+        """ストレージ最適化（上限を超えたら最終アクセスの古い順に80%まで削減）"""
+        with self._write_transaction() as conn:
+            self._apply_pending(conn)
+            removed = self._evict(conn)
+        self._delete_files(removed)
+    
+    def cleanup_old_cache(self, days: Optional[int] = None):
+        """定期的なキャッシュクリーンアップ（タイマーから呼ばれる）"""
+        cutoff = (datetime.now() - timedelta(days=days or self.MAX_AGE_DAYS)).isoformat()
         
-        for prompt_hash in entries_to_delete:
-            entry = self.index["entries"][prompt_hash]
-            try:
-                Path(entry["path"]).unlink()
-                del self.index["entries"][prompt_hash]
-                logger.info(f"期限切れキャッシュを削除: {entry['path']}")
-            except:
-                pass
+        try:
+            with self._write_transaction() as conn:
+                self._apply_pending(conn)
+                rows = conn.execute(
+                    'SELECT key, path, size FROM cache_entries WHERE last_access < ?', (cutoff,)
+                ).fetchall()
+                conn.execute('DELETE FROM cache_entries WHERE last_access < ?', (cutoff,))
+                self._add_stat(conn, "total_size", -sum(row['size'] for row in rows))
+        except Exception as e:
+            logger.error(f"キャッシュクリーンアップエラー: {str(e)}")
+            return
         
-        if entries_to_delete:
-            self._save_index()
+        for row in rows:
+            logger.info(f"期限切れキャッシュを削除: {row['path']}")
+        self._delete_files([row['path'] for row in rows])
     
     def get_cache_stats(self) -> Dict:
-        """キャッシュ統計を取得"""
-        total_size = sum(entry["size"] for entry in self.index["entries"].values())
+        """キャッシュ統計を取得（未保存の差分を含む）"""
+        conn = self._get_connection()
+        totals = conn.execute(
+            '''SELECT COUNT(*) AS total_entries, COUNT(spare_pool) AS spare_entries,
+                      MIN(last_access) AS oldest_entry
+               FROM cache_entries'''
+        ).fetchone()
+        stats = {row['name']: row['value'] for row in conn.execute('SELECT name, value FROM cache_stats')}
+        with self._lock:
+            hits = stats.get("hits", 0) + self._pending_stats["hits"]
+            misses = stats.get("misses", 0) + self._pending_stats["misses"]
+        total_size = stats.get("total_size", 0)
+        lookups = hits + misses
         
         return {
-            "total_entries": len(self.index["entries"]),
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": round(hits / lookups * 100, 1) if lookups else 0,
+            "spare_hits": stats.get("spare_hits", 0),
+            "spare_entries": totals['spare_entries'],
+            "total_entries": totals['total_entries'],
             "total_size_mb": round(total_size / 1024 / 1024, 2),
             "max_size_mb": round(self.max_size / 1024 / 1024, 2),
             "usage_percentage": round((total_size / self.max_size) * 100, 2) if self.max_size > 0 else 0,
-            "oldest_entry": min(
-                (entry.get("last_access", entry["created"]) for entry in self.index["entries"].values()),
-                default=None
-            )
-        }
\ No newline at end of file
+            "oldest_entry": totals['oldest_entry']
+        }
+
+
+_shared_cache: Optional[ImageCache] = None
+_shared_lock = threading.Lock()
+
+
+def get_image_cache() -> ImageCache:
+    """プロセス内で共有するImageCacheを取得"""
+    global _shared_cache
+    with _shared_lock:
+        if _shared_cache is None:
+            _shared_cache = ImageCache()
+        return _shared_cache
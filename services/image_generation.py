@@ -4,28 +4,85 @@ Google Gemini 2.0とGPT Image 1による自動画像生成
 """
 import json
 import os
+import copy
 import hashlib
 import logging
+import time
+import queue
+import threading
+from collections import OrderedDict
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
 from datetime import datetime, timedelta
-from typing import Dict, Optional, List, Any
+from typing import Callable, Dict, Iterable, Iterator, Optional, List, Any, Tuple
 import requests
 from pathlib import Path
+from modules.provider_limits import get_provider_limiter
+from modules.rate_limiter import get_rate_limiter
+from modules.unsplash_fetcher import UnsplashFetcher
+from services.image_cache import get_image_cache
+from services.image_pipeline import get_image_pipeline
 
 logger = logging.getLogger(__name__)
 
 
+# 破棄に備えてキャッシュキーを覚えておく新規生成画像の数
+GENERATED_KEYS_LIMIT = 256
+
+# 画像生成サービス → ProviderLimiter / RateLimiter のプロバイダー名
+SERVICE_PROVIDERS = {
+    'gemini_image': 'gemini',
+    'gpt_image': 'gpt_image'
+}
+
+
 class ImageGenerationManager:
-    """画像生成統合管理クラス"""
+    """
+    画像生成統合管理クラス
+    
+    プロセス内では get_image_manager() で共有し、設定ファイルが更新された場合のみ読み直す
+    """
     
     def __init__(self, config_path: str = "config/image_apis.json"):
         self.config_path = config_path
+        self._config_lock = threading.Lock()
+        self._config_mtime = self._get_config_mtime()
         self.config = self._load_config()
         self.preference_manager = UserPreferenceManager()
-        self.selection_engine = AutoSelectionEngine(self.config)
+        self.latency_tracker = ServiceLatencyTracker()
+        self.selection_engine = AutoSelectionEngine(self.config, self.latency_tracker)
         self.prompt_generator = PromptGenerator()
+        self.image_cache = get_image_cache()
+        # 新規に取得した画像のパス → キャッシュキー（discard_image で使う。キャッシュ未保存なら空文字）
+        self._generated_keys: 'OrderedDict[str, str]' = OrderedDict()
+        self._generated_lock = threading.Lock()
         
         # 各APIクライアントの初期化
         self._init_api_clients()
+    
+    def _get_config_mtime(self) -> Optional[float]:
+        """設定ファイルの更新時刻"""
+        try:
+            return os.path.getmtime(self.config_path)
+        except OSError:
+            return None
+    
+    def refresh_config(self):
+        """設定ファイルが更新されていれば読み直し、APIクライアントを作り直す"""
+        mtime = self._get_config_mtime()
+        if mtime == self._config_mtime:
+            return
+        with self._config_lock:
+            if mtime == self._config_mtime:
+                return
+            try:
+                self.config = self._load_config()
+            except Exception as e:
+                logger.error(f"画像生成設定の読み込みエラー: {str(e)}")
+                return
+            self.selection_engine = AutoSelectionEngine(self.config, self.latency_tracker)
+            self._init_api_clients()
+            self._config_mtime = mtime
+            logger.info("画像生成設定を再読み込みしました")
         
     def _load_config(self) -> Dict:
         """設定ファイルを読み込む"""
@@ -69,12 +126,18 @@ class ImageGenerationManager:
                 )
             except Exception as e:
                 logger.error(f"GPT Image API初期化エラー: {str(e)}")
+        
+        # Unsplash（生成が遅い・失敗した場合の代替）
+        fetcher = UnsplashFetcher(self.config.get('image_generation', {}).get('unsplash', {}).get('access_key'))
+        if fetcher.is_configured():
+            self.unsplash_client = UnsplashImageAPI(fetcher)
     
     def generate_article_image(self, 
                              article_title: str, 
                              keywords: List[str], 
                              genre: str,
-                             user_preference: Optional[str] = None) -> Optional[str]:
+                             user_preference: Optional[str] = None,
+                             prompt_settings: Optional[Dict] = None) -> Optional[str]:
         """
         記事用画像を自動生成
         
@@ -83,16 +146,132 @@ class ImageGenerationManager:
             keywords: キーワードリスト
             genre: ジャンル
             user_preference: ユーザー指定のサービス
+            prompt_settings: サイトごとのプロンプト設定（style, quality, tone, additional_instructions, avoid_terms）
             
         Returns:
             画像パスまたはURL、失敗時はNone
         """
+        self.refresh_config()
+        image_path, selection = self._generate_image(
+            article_title, keywords, genre, user_preference, prompt_settings
+        )
+        if selection:
+            self.preference_manager.record_selections([selection])
+        return image_path
+    
+    def generate_batch(self, items: Iterable[Dict],
+                       max_workers: Optional[int] = None) -> Iterator[Tuple[int, Optional[str]]]:
+        """
+        複数記事の画像をまとめて生成し、完了した順に返す
+        
+        items は記事のタイトルを受信するたびに要素を返すイテレーターでもよく、
+        受け取った要素から順に生成を始める。プロバイダーごとの同時実行数は ProviderLimiter で制御し、
+        選択履歴はすべて完了した後に1回の書き込みで記録する
+        
+        Args:
+            items: generate_article_image の引数（article_title, keywords, genre,
+                   user_preference, prompt_settings）の辞書
+            max_workers: 同時に処理する件数（省略時は画像生成プロバイダーの上限の合計）
+            
+        Yields:
+            (items内の位置, 画像パス（失敗時はNone）)
+        """
+        self.refresh_config()
+        if max_workers is None:
+            limiter = get_provider_limiter()
+            max_workers = limiter.get_limit('gemini') + limiter.get_limit('gpt_image')
+        if isinstance(items, (list, tuple)):
+            if not items:
+                return
+            max_workers = min(max_workers, len(items))
+        
+        selections = []
+        executor = ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix="image-batch")
+        completed: 'queue.Queue[Tuple[Optional[int], Any]]' = queue.Queue()
+        
+        def feed():
+            # 要素を受け取るたびに生成を開始し、最後に件数を知らせる
+            count = 0
+            try:
+                for index, item in enumerate(items):
+                    future = executor.submit(
+                        self._generate_image,
+                        item['article_title'],
+                        item.get('keywords', []),
+                        item.get('genre', ''),
+                        item.get('user_preference'),
+                        item.get('prompt_settings')
+                    )
+                    future.add_done_callback(lambda f, index=index: completed.put((index, f)))
+                    count += 1
+            except Exception as e:
+                logger.error(f"バッチ画像生成の開始エラー: {str(e)}")
+            finally:
+                completed.put((None, count))
+        
+        threading.Thread(target=feed, name="image-batch-feed", daemon=True).start()
+        try:
+            total, finished = None, 0
+            while total is None or finished < total:
+                index, future = completed.get()
+                if index is None:
+                    total = future
+                    continue
+                finished += 1
+                try:
+                    image_path, selection = future.result()
+                except Exception as e:
+                    logger.error(f"バッチ画像生成エラー: {str(e)}")
+                    image_path, selection = None, None
+                if selection:
+                    selections.append(selection)
+                yield index, image_path
+        finally:
+            # 途中で打ち切られた場合は未完了の分を破棄し、完了分だけを記録する
+            executor.shutdown(wait=False, cancel_futures=True)
+            if selections:
+                self.preference_manager.record_selections(selections)
+    
+    def _generate_image(self,
+                        article_title: str,
+                        keywords: List[str],
+                        genre: str,
+                        user_preference: Optional[str] = None,
+                        prompt_settings: Optional[Dict] = None) -> Tuple[Optional[str], Optional[Dict]]:
+        """
+        画像を生成（選択履歴の記録は呼び出し元で行う）
+        
+        Returns:
+            (画像パス, 選択履歴（キャッシュから返した場合・無効時はNone）)
+        """
         if not self.config.get('image_generation', {}).get('enabled', True):
             logger.info("画像生成機能が無効です")
-            return None
+            return None, None
+        
+        prompt_generator = self.prompt_generator.with_settings(prompt_settings)
+        
+        # 同じキーワード・ジャンル・スタイルで生成済みの画像があれば再利用
+        cache_key = self._cache_key(prompt_generator, article_title, keywords, genre, user_preference)
+        cached_path = self.image_cache.get_cached_image(cache_key)
+        if cached_path:
+            # アップロード用のバリエーション作成を先に始めておく
+            get_image_pipeline().submit(cached_path)
+            return cached_path, None
+        
+        # ジャンル・スタイルが同じ記事の生成で余った候補画像があれば使う
+        candidates = self.config.get('image_generation', {}).get('candidates', {})
+        pool_key = self._pool_key(prompt_generator, genre, user_preference)
+        normalized_keywords = prompt_generator.normalize_keywords(keywords)
+        spare_path = self.image_cache.take_spare(
+            pool_key, normalized_keywords, cache_key,
+            min_overlap=int(candidates.get('min_keyword_overlap', 1))
+        )
+        if spare_path:
+            get_image_pipeline().submit(spare_path)
+            return spare_path, None
         
         # プロンプト生成
-        prompt = self.prompt_generator.create_image_prompt(
+        prompt = prompt_generator.create_image_prompt(
             article_title, keywords, genre
         )
         
@@ -104,37 +283,246 @@ class ImageGenerationManager:
                 'genre': genre,
                 'keywords': keywords,
                 'time': datetime.now(),
-                'budget_status': self._get_budget_status()
+                'budget_status': self._get_budget_status(),
+                'available_services': self.available_services()
             }
             selected_service = self.selection_engine.select_optimal_service(context)
         
         logger.info(f"選択されたサービス: {selected_service}")
         
-        # 画像生成実行
-        image_path = None
-        success = False
+        # 画像生成実行（応答が遅い・失敗した場合は次のサービスを並行して実行する）
+        candidate_count = max(1, int(candidates.get('count', 1)))
+        attempts = self._hedge_attempts(selected_service, user_preference, prompt, candidate_count,
+                                        article_title, keywords)
+        keep_spares = lambda service, paths: self._keep_spares(
+            service, paths, pool_key, genre, normalized_keywords
+        )
+        service, images = self._run_hedged(attempts, keep_spares)
+        if service == 'unsplash':
+            # Unsplashは採用が決まった写真だけをダウンロードする
+            images = self._download_unsplash(images[0])
+        success = bool(images)
+        image_path = images[0] if images else None
+        
+        if image_path:
+            # 候補数が2以上なら余りを予備として保存する
+            keep_spares(service, images[1:])
+            get_image_pipeline().submit(image_path)
+            if service in SERVICE_PROVIDERS:
+                try:
+                    self.image_cache.save_to_cache(cache_key, image_path, service)
+                except Exception as e:
+                    logger.warning(f"画像キャッシュ保存エラー: {str(e)}")
+            with self._generated_lock:
+                # キャッシュに保存しないUnsplashの画像はファイルだけを破棄対象にする
+                self._generated_keys[image_path] = cache_key if service in SERVICE_PROVIDERS else ''
+                while len(self._generated_keys) > GENERATED_KEYS_LIMIT:
+                    self._generated_keys.popitem(last=False)
+        
+        # 選択履歴
+        selection = {
+            'genre': genre,
+            'service': service or selected_service,
+            'timestamp': datetime.now(),
+            'success': success
+        }
+        
+        return image_path, selection
+    
+    def discard_image(self, image_path: str):
+        """
+        使わなくなった画像を破棄（記事の生成に失敗した場合など）
         
+        新規に生成した画像はファイル・キャッシュ・アップロード用のバリエーションを削除する。
+        キャッシュや予備画像から返した画像は他の記事でも使えるため残す
+        """
+        with self._generated_lock:
+            cache_key = self._generated_keys.pop(image_path, None)
+        if cache_key is None:
+            return
+        logger.info(f"使わなかった画像を破棄: {image_path}")
+        get_image_pipeline().discard(image_path)
         try:
-            if selected_service == 'gemini_image' and self.gemini_client:
-                image_path = self.gemini_client.generate(prompt)
-                success = True
-            elif selected_service == 'gpt_image' and self.gpt_client:
-                image_path = self.gpt_client.generate(prompt)
-                success = True
+            if cache_key:
+                self.image_cache.remove(cache_key)
+            if os.path.exists(image_path):
+                os.remove(image_path)
         except Exception as e:
-            logger.error(f"{selected_service}での画像生成エラー: {str(e)}")
+            logger.warning(f"画像の破棄エラー: {str(e)}")
+    
+    def _hedge_attempts(self, selected_service: str, user_preference: Optional[str], prompt: str,
+                        candidate_count: int, article_title: str,
+                        keywords: List[str]) -> List[Tuple[str, Callable[[], List[Any]]]]:
+        """
+        画像を取得する順のサービスと呼び出し
+        
+        選択したサービスの次に、サービス指定がなければ他の生成サービスと
+        （設定で許可されていれば）Unsplashの検索を試す。サービス指定のあるサイトでは
+        fallback_to_unsplash_when_pinned を有効にした場合だけUnsplashを使う
+        """
+        services = [selected_service]
+        if not user_preference:
+            services += [s for s in self.available_services() if s != selected_service]
+        
+        attempts = []
+        for service in services:
+            client = self._client_for(service)
+            if client:
+                attempts.append((service, lambda client=client: client.generate_candidates(prompt, candidate_count)))
+        
+        rules = self.config.get('image_generation', {}).get('auto_selection_rules', {})
+        use_unsplash = (rules.get('fallback_to_unsplash_when_pinned', False) if user_preference
+                        else rules.get('fallback_to_unsplash', True))
+        if self.unsplash_client and use_unsplash:
+            # 検索だけを並行して行う（ダウンロードは採用後に行うため、採用されなければファイルは残らない）
+            unsplash = self.unsplash_client
+            attempts.append(('unsplash', lambda: unsplash.search(article_title, keywords)))
+        return attempts
+    
+    def _run_hedged(self, attempts: List[Tuple[str, Callable[[], List[Any]]]],
+                    on_discard: Callable[[str, List[Any]], None]) -> Tuple[Optional[str], List[Any]]:
+        """
+        ヘッジ付きで画像を取得
         
-        # フォールバック処理
-        if not success:
-            logger.info("フォールバックサービスを試行中...")
-            # ここでUnsplashなどのフォールバックを実行
+        実行中のサービスが観測した p90 の時間内に応答しない場合（または失敗した場合）は
+        次のサービスを並行して開始し、最初に得られた画像を使う。
+        採用されなかった結果は on_discard に渡す
+        
+        Returns:
+            (画像を返したサービス, 画像パスのリスト（Unsplashは写真情報のリスト）)、
+            得られなければ (None, [])
+        """
+        hedging = self.config.get('image_generation', {}).get('hedging', {})
+        hedge_enabled = hedging.get('enabled', True)
+        deadline = time.monotonic() + float(hedging.get('max_wait_seconds', 90))
+        executor = _get_hedge_executor()
+        pending: Dict[Future, str] = {}
+        next_index = 0
+        next_start = 0.0
+        
+        while pending or next_index < len(attempts):
+            now = time.monotonic()
+            if now >= deadline:
+                logger.warning(f"画像取得が{hedging.get('max_wait_seconds', 90)}秒以内に完了しませんでした: "
+                               f"{list(pending.values())}")
+                break
             
-        # 選択履歴を記録
-        self.preference_manager.record_selection(
-            genre, selected_service, datetime.now(), success
-        )
+            if next_index < len(attempts) and (not pending or (hedge_enabled and now >= next_start)):
+                service, call = attempts[next_index]
+                next_index += 1
+                if pending:
+                    logger.info(f"{'・'.join(pending.values())}の応答待ちのため{service}を並行して実行")
+                elif next_index > 1:
+                    logger.info(f"フォールバックサービスを試行中: {service}")
+                pending[executor.submit(self._attempt, service, call)] = service
+                next_start = now + self._hedge_delay(service, hedging)
+                continue
+            
+            wait_until = deadline
+            if hedge_enabled and next_index < len(attempts):
+                wait_until = min(wait_until, next_start)
+            done, _ = wait(list(pending), timeout=max(0.0, wait_until - now), return_when=FIRST_COMPLETED)
+            for future in done:
+                service = pending.pop(future)
+                images = future.result()
+                if images:
+                    self._discard_pending(pending, on_discard)
+                    return service, images
         
-        return image_path
+        self._discard_pending(pending, on_discard)
+        return None, []
+    
+    @staticmethod
+    def _discard_pending(pending: Dict[Future, str], on_discard: Callable[[str, List[Any]], None]):
+        """採用しなかった実行を取り消す（実行中のものは成功した場合だけ結果を on_discard に渡す）"""
+        def discard(future: Future, service: str):
+            if future.cancelled() or future.exception() is not None:
+                return
+            on_discard(service, future.result())
+        
+        for future, service in pending.items():
+            if not future.cancel():
+                future.add_done_callback(lambda f, service=service: discard(f, service))
+    
+    def _hedge_delay(self, service: str, hedging: Dict) -> float:
+        """次のサービスを並行して開始するまでの秒数（記録が少ない間は既定値）"""
+        delay = None
+        if self.latency_tracker.sample_count(service) >= AutoSelectionEngine.MIN_SAMPLES:
+            delay = self.latency_tracker.percentile(service, float(hedging.get('percentile', 0.9)))
+        if delay is None:
+            delay = float(hedging.get('default_delay_seconds', 30))
+        return max(float(hedging.get('min_delay_seconds', 5)), delay)
+    
+    def _attempt(self, service: str, call: Callable[[], List[Any]]) -> List[Any]:
+        """1つのサービスで画像を取得し、所要時間と結果を記録"""
+        limiter = get_provider_limiter()
+        # 同時実行枠の待ち時間を除いたAPIの所要時間を記録する
+        with limiter.slot(SERVICE_PROVIDERS.get(service, service)):
+            started = time.monotonic()
+            try:
+                images = call()
+            except Exception as e:
+                logger.error(f"{service}での画像生成エラー: {str(e)}")
+                images = []
+            latency = time.monotonic() - started
+        self.latency_tracker.record(service, latency, bool(images))
+        return images
+    
+    def _download_unsplash(self, photo: Dict) -> List[str]:
+        """ヘッジで採用したUnsplashの写真をダウンロード"""
+        if not self.unsplash_client:
+            return []
+        try:
+            with get_provider_limiter().slot('unsplash'):
+                return self.unsplash_client.download(photo)
+        except Exception as e:
+            logger.error(f"Unsplash画像のダウンロードエラー: {str(e)}")
+            return []
+    
+    def _keep_spares(self, service: str, paths: List[str], pool_key: str,
+                     genre: str, normalized_keywords: List[str]):
+        """
+        使わなかった画像の後始末
+        
+        生成した画像は予備として保存する（Unsplashは検索結果だけでファイルがないため何もしない）
+        """
+        if service not in SERVICE_PROVIDERS:
+            return
+        for path in paths:
+            try:
+                self.image_cache.add_spare(pool_key, path, service, genre, normalized_keywords)
+            except Exception as e:
+                logger.warning(f"予備画像の保存エラー: {str(e)}")
+    
+    def _client_for(self, service: str):
+        """サービス名に対応するAPIクライアント（未設定ならNone）"""
+        if service == 'gemini_image':
+            return self.gemini_client
+        if service == 'gpt_image':
+            return self.gpt_client
+        return None
+    
+    def available_services(self) -> List[str]:
+        """APIキーが設定されている画像生成サービス"""
+        return [service for service in SERVICE_PROVIDERS if self._client_for(service)]
+    
+    @staticmethod
+    def _cache_key(prompt_generator: 'PromptGenerator', article_title: str, keywords: List[str],
+                   genre: str, user_preference: Optional[str] = None) -> str:
+        """画像キャッシュのキー（サービス指定時はそのサービスの画像のみ再利用）"""
+        source = prompt_generator.normalized_key(article_title, keywords, genre)
+        if user_preference:
+            source += f"|service={user_preference}"
+        return hashlib.sha256(source.encode('utf-8')).hexdigest()[:32]
+    
+    @staticmethod
+    def _pool_key(prompt_generator: 'PromptGenerator', genre: str,
+                  user_preference: Optional[str] = None) -> str:
+        """予備画像のプールのキー（ジャンル・スタイル・指定サービスが同じ記事で共有）"""
+        source = prompt_generator.style_key(genre)
+        if user_preference:
+            source += f"|service={user_preference}"
+        return hashlib.sha256(source.encode('utf-8')).hexdigest()[:32]
     
     def _get_budget_status(self) -> Dict:
         """予算状況を取得"""
@@ -149,6 +537,9 @@ class ImageGenerationManager:
 class UserPreferenceManager:
     """ユーザー選択パターン管理クラス"""
     
+    # 並列生成時に複数インスタンスから同じファイルへ書き込むため共有ロックを使う
+    _file_lock = threading.Lock()
+    
     def __init__(self):
         self.preference_file = "data/user_image_preferences.json"
         self.preferences = self._load_preferences()
@@ -170,27 +561,46 @@ class UserPreferenceManager:
                         timestamp: datetime, 
                         success: bool):
         """ユーザーの選択を記録"""
-        selection = {
+        self.record_selections([{
             'genre': article_genre,
             'service': selected_service,
-            'timestamp': timestamp.isoformat(),
-            'success': success,
-            'hour': timestamp.hour,
-            'day_of_week': timestamp.weekday()
-        }
-        
-        self.preferences['selections'].append(selection)
+            'timestamp': timestamp,
+            'success': success
+        }])
+    
+    def record_selections(self, selections: List[Dict]):
+        """
+        複数の選択をまとめて記録（ファイルへの書き込みは1回）
         
-        # 最新1000件のみ保持
-        if len(self.preferences['selections']) > 1000:
-            self.preferences['selections'] = self.preferences['selections'][-1000:]
+        Args:
+            selections: genre, service, timestamp(datetime), success の辞書のリスト
+        """
+        records = [{
+            'genre': s['genre'],
+            'service': s['service'],
+            'timestamp': s['timestamp'].isoformat(),
+            'success': s['success'],
+            'hour': s['timestamp'].hour,
+            'day_of_week': s['timestamp'].weekday()
+        } for s in selections]
         
-        self._save_preferences()
+        with self._file_lock:
+            # 他インスタンスの記録を失わないようファイルから読み直して追記
+            self.preferences = self._load_preferences()
+            self.preferences['selections'].extend(records)
+            
+            # 最新1000件のみ保持
+            if len(self.preferences['selections']) > 1000:
+                self.preferences['selections'] = self.preferences['selections'][-1000:]
+            
+            self._save_preferences()
     
     def _save_preferences(self):
-        """選択履歴を保存"""
-        with open(self.preference_file, 'w', encoding='utf-8') as f:
+        """選択履歴を保存（一時ファイル経由で置き換え）"""
+        tmp_path = f"{self.preference_file}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
             json.dump(self.preferences, f, indent=2, ensure_ascii=False)
+        os.replace(tmp_path, self.preference_file)
     
     def get_recommended_service(self, 
                                article_genre: str, 
@@ -284,13 +694,159 @@ class UserPreferenceManager:
         return analysis
 
 
+class ServiceLatencyTracker:
+    """
+    画像生成サービスごとの所要時間ヒストグラムと成功率
+    
+    観測のたびに過去の値を減衰させるため、直近の傾向が強く反映される。
+    ヒストグラムは固定の区間ごとの件数のみを保存する
+    """
+    
+    # ヒストグラムの区間の上限（秒）。最後の区間はそれ以上すべて
+    BUCKET_BOUNDS = (1, 2, 3, 5, 8, 12, 20, 30, 45, 60, 90, 120, 180)
+    # 観測ごとに過去の件数に掛ける係数（約100件で影響が 1/e になる）
+    DECAY = 0.99
+    
+    _file_lock = threading.Lock()
+    
+    def __init__(self, stats_file: str = "data/image_service_stats.json"):
+        self.stats_file = stats_file
+        self.stats = self._load_stats()
+    
+    def _load_stats(self) -> Dict:
+        """統計を読み込む"""
+        if os.path.exists(self.stats_file):
+            try:
+                with open(self.stats_file, 'r', encoding='utf-8') as f:
+                    return json.load(f)
+            except Exception:
+                return {}
+        return {}
+    
+    def _save_stats(self):
+        """統計を保存（一時ファイル経由で置き換え）"""
+        os.makedirs(os.path.dirname(self.stats_file) or '.', exist_ok=True)
+        tmp_path = f"{self.stats_file}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.stats, f, ensure_ascii=False, separators=(',', ':'))
+        os.replace(tmp_path, self.stats_file)
+    
+    def record(self, service: str, latency: float, success: bool):
+        """
+        生成結果を記録
+        
+        Args:
+            service: サービス名
+            latency: 所要時間（秒）
+            success: 画像が得られたか
+        """
+        with self._file_lock:
+            # 他プロセスの記録を失わないようファイルから読み直して更新
+            self.stats = self._load_stats()
+            entry = self.stats.setdefault(service, {
+                'buckets': [0.0] * (len(self.BUCKET_BOUNDS) + 1),
+                'successes': 0.0,
+                'failures': 0.0,
+                'samples': 0
+            })
+            entry['buckets'] = [round(c * self.DECAY, 4) for c in entry['buckets']]
+            entry['successes'] = round(entry['successes'] * self.DECAY, 4)
+            entry['failures'] = round(entry['failures'] * self.DECAY, 4)
+            entry['samples'] += 1
+            if success:
+                # 失敗時の所要時間はタイムアウトなどで偏るため成功時のみ記録
+                index = next((i for i, bound in enumerate(self.BUCKET_BOUNDS) if latency <= bound),
+                             len(self.BUCKET_BOUNDS))
+                entry['buckets'][index] += 1
+                entry['successes'] += 1
+            else:
+                entry['failures'] += 1
+            entry['updated_at'] = datetime.now().isoformat()
+            try:
+                self._save_stats()
+            except Exception as e:
+                logger.error(f"画像サービス統計の保存エラー: {str(e)}")
+    
+    def sample_count(self, service: str) -> int:
+        """記録した件数"""
+        return self.stats.get(service, {}).get('samples', 0)
+    
+    def percentile(self, service: str, q: float) -> Optional[float]:
+        """
+        所要時間のパーセンタイル（区間内は線形補間）
+        
+        Args:
+            q: 0〜1（0.5でp50）
+            
+        Returns:
+            秒数、成功の記録がなければNone
+        """
+        buckets = self.stats.get(service, {}).get('buckets')
+        total = sum(buckets) if buckets else 0
+        if not total:
+            return None
+        target = total * q
+        cumulative = 0.0
+        lower = 0.0
+        for index, count in enumerate(buckets):
+            upper = self.BUCKET_BOUNDS[index] if index < len(self.BUCKET_BOUNDS) else self.BUCKET_BOUNDS[-1] * 1.5
+            if count and cumulative + count >= target:
+                return lower + (upper - lower) * (target - cumulative) / count
+            cumulative += count
+            lower = upper
+        return lower
+    
+    def error_rate(self, service: str) -> float:
+        """失敗率（記録が少ない間は0.5に寄せる）"""
+        entry = self.stats.get(service, {})
+        successes = entry.get('successes', 0.0)
+        failures = entry.get('failures', 0.0)
+        return (failures + 1) / (successes + failures + 2)
+    
+    def expected_seconds(self, service: str) -> Optional[float]:
+        """
+        画像が得られるまでの期待時間
+        
+        失敗した場合は再度同じ時間がかかるとみなし、p50 を成功率で割る
+        """
+        p50 = self.percentile(service, 0.5)
+        if p50 is None:
+            return None
+        return p50 / max(0.05, 1 - self.error_rate(service))
+    
+    def summary(self) -> Dict:
+        """サービスごとの p50・p95・失敗率"""
+        result = {}
+        for service in self.stats:
+            p50 = self.percentile(service, 0.5)
+            p95 = self.percentile(service, 0.95)
+            result[service] = {
+                'samples': self.sample_count(service),
+                'p50_seconds': round(p50, 2) if p50 is not None else None,
+                'p95_seconds': round(p95, 2) if p95 is not None else None,
+                'error_rate': round(self.error_rate(service), 3)
+            }
+        return result
+
+
 class AutoSelectionEngine:
-    """自動選択エンジン"""
+    """
+    自動選択エンジン
+    
+    各サービスの記録が十分にあれば、時間予算（p95）内で最も早く画像が得られるサービスを選び、
+    記録が少ない間は従来のスコアで選ぶ
+    """
+    
+    # 所要時間で選択するのに必要なサービスごとの記録数
+    MIN_SAMPLES = 5
     
-    def __init__(self, config: Dict):
+    def __init__(self, config: Dict, latency_tracker: Optional[ServiceLatencyTracker] = None):
         self.config = config.get('image_generation', {})
         self.rules = self.config.get('auto_selection_rules', {})
         self.user_prefs = self.config.get('user_preferences', {})
+        self.latency_tracker = latency_tracker
+        # p95 がこの秒数を超えるサービスは、他に候補があれば選ばない
+        self.latency_budget = self.config.get('latency_budget_seconds', 60)
     
     def select_optimal_service(self, context: Dict) -> str:
         """
@@ -302,10 +858,19 @@ class AutoSelectionEngine:
         Returns:
             選択されたサービス名
         """
+        services = context.get('available_services') or ['gemini_image', 'gpt_image']
+        
+        # 予算が少ない間は所要時間よりスコア（予算切り替え先の加点）を優先
+        budget_status = context.get('budget_status', {})
+        if budget_status.get('remaining', 50) >= self.rules.get('budget_low_threshold', 10):
+            selected = self._select_by_latency(services)
+            if selected:
+                return selected
+        
         scores = {}
         
         # 各サービスのスコアを計算
-        for service in ['gemini_image', 'gpt_image']:
+        for service in services:
             scores[service] = self._calculate_service_score(service, context)
         
         # 最高スコアのサービスを選択
@@ -314,6 +879,36 @@ class AutoSelectionEngine:
         
         return selected
     
+    def _select_by_latency(self, services: List[str]) -> Optional[str]:
+        """
+        観測した所要時間と失敗率から、画像が最も早く得られると見込まれるサービスを選択
+        
+        Returns:
+            サービス名（記録が足りないサービスがある場合はNone）
+        """
+        if not self.latency_tracker or len(services) < 2:
+            return None
+        if any(self.latency_tracker.sample_count(s) < self.MIN_SAMPLES for s in services):
+            return None
+        
+        expected = {s: self.latency_tracker.expected_seconds(s) for s in services}
+        expected = {s: v for s, v in expected.items() if v is not None}
+        if not expected:
+            return None
+        
+        # 時間予算内のサービスがあればその中から選ぶ
+        within_budget = {
+            s: v for s, v in expected.items()
+            if (self.latency_tracker.percentile(s, 0.95) or 0) <= self.latency_budget
+        }
+        candidates = within_budget or expected
+        
+        # サービス重み付け（重いほど優先）
+        weighted = {s: v / max(0.01, self.config.get(s, {}).get('weight', 1.0)) for s, v in candidates.items()}
+        selected = min(weighted, key=weighted.get)
+        logger.info(f"期待所要時間（秒）: { {s: round(v, 1) for s, v in weighted.items()} } → {selected}")
+        return selected
+    
     def _calculate_service_score(self, service: str, context: Dict) -> float:
         """サービスのスコアを計算"""
         base_score = 50.0
@@ -342,6 +937,11 @@ class AutoSelectionEngine:
         return base_score
 
 
+def _normalize_text(value: Any) -> str:
+    """前後・連続する空白を整理して小文字化"""
+    return ' '.join(str(value or '').split()).lower()
+
+
 class PromptGenerator:
     """プロンプト自動生成クラス"""
     
@@ -412,6 +1012,66 @@ class PromptGenerator:
         logger.info(f"生成されたプロンプト: {prompt}")
         return prompt
     
+    def with_settings(self, settings: Optional[Dict]) -> 'PromptGenerator':
+        """
+        プロンプト設定を反映したコピーを返す（共有インスタンスの設定は変更しない）
+        
+        Args:
+            settings: style, quality, tone, additional_instructions, avoid_terms（カンマ区切りまたはリスト）
+        """
+        if not settings:
+            return self
+        generator = copy.copy(self)
+        if 'style' in settings:
+            generator.default_style = settings['style']
+        if 'quality' in settings:
+            generator.quality = settings['quality']
+        if 'tone' in settings:
+            generator.tone = settings['tone']
+        if 'additional_instructions' in settings:
+            generator.additional_instructions = settings['additional_instructions']
+        if 'avoid_terms' in settings:
+            avoid_terms = settings['avoid_terms'] or []
+            if isinstance(avoid_terms, str):
+                avoid_terms = avoid_terms.split(',')
+            generator.avoid_terms = [t.strip() for t in avoid_terms if t.strip()]
+        return generator
+    
+    def normalized_key(self, title: str, keywords: List[str], genre: str) -> str:
+        """
+        同じ画像になるプロンプトを同一視するための正規化キー
+        
+        キーワードの順序・前後の空白・大文字小文字の違いを無視し、
+        サイトのスタイル設定（スタイル・トーン・品質・追加指示・回避用語）を含める
+        """
+        words = self.normalize_keywords(keywords)
+        return json.dumps({
+            **self._style_fields(genre),
+            'keywords': words,
+            # キーワードがない場合はタイトルからトピックを取るため含める
+            'topic': '' if words else _normalize_text(self._extract_topic(title, []))
+        }, ensure_ascii=False, sort_keys=True)
+    
+    def style_key(self, genre: str) -> str:
+        """ジャンルとスタイル設定だけで決まるキー（予備画像のプールに使用）"""
+        return json.dumps(self._style_fields(genre), ensure_ascii=False, sort_keys=True)
+    
+    @staticmethod
+    def normalize_keywords(keywords: List[str]) -> List[str]:
+        """キーワードを小文字化・空白を整理して重複を除き、順序をそろえる"""
+        return sorted({_normalize_text(k) for k in keywords or [] if _normalize_text(k)})
+    
+    def _style_fields(self, genre: str) -> Dict:
+        """プロンプトのうちキーワード以外を決める設定"""
+        return {
+            'genre': genre if genre in self.style_templates else 'blog',
+            'style': _normalize_text(self.default_style),
+            'tone': _normalize_text(self.tone),
+            'quality': _normalize_text(self.quality),
+            'instructions': _normalize_text(self.additional_instructions),
+            'avoid': sorted({_normalize_text(t) for t in self.avoid_terms or [] if _normalize_text(t)})
+        }
+    
     def _extract_topic(self, title: str, keywords: List[str]) -> str:
         """タイトルとキーワードからトピックを抽出"""
         # 簡易的な実装（実際はより高度な処理が必要）
@@ -446,6 +1106,20 @@ class GeminiImageAPI:
         Returns:
             保存された画像のパス、失敗時はNone
         """
+        images = self.generate_candidates(prompt, 1)
+        return images[0] if images else None
+    
+    def generate_candidates(self, prompt: str, count: int = 1) -> List[str]:
+        """
+        1回のリクエストで複数の候補画像を生成
+        
+        Args:
+            prompt: 画像生成プロンプト
+            count: 候補数（candidateCount として要求し、返された画像はすべて保存）
+            
+        Returns:
+            保存された画像のパスのリスト（失敗時は空）
+        """
         try:
             url = f"{self.api_base}/{self.model}:generateContent"
             
@@ -468,54 +1142,70 @@ class GeminiImageAPI:
                     "response_modalities": ["TEXT", "IMAGE"]  # Correct parameter
                 }
             }
+            if count > 1:
+                data["generationConfig"]["candidateCount"] = count
             
             logger.info(f"Gemini APIで画像生成中: {prompt}")
             
-            response = requests.post(url, headers=headers, json=data, timeout=60)
+            response = get_rate_limiter().call(
+                'gemini', lambda: requests.post(url, headers=headers, json=data, timeout=60)
+            )
             
             if response.status_code == 200:
                 result = response.json()
                 
-                # Extract image from response
-                if 'candidates' in result and result['candidates']:
-                    candidate = result['candidates'][0]
-                    if 'content' in candidate and 'parts' in candidate['content']:
-                        for part in candidate['content']['parts']:
-                            if 'inlineData' in part:
-                                image_data = part['inlineData']['data']
-                                mime_type = part['inlineData']['mimeType']
-                                
-                                # Save image
-                                timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-                                extension = mime_type.split('/')[-1] if '/' in mime_type else 'png'
-                                filename = f"gemini_{timestamp}.{extension}"
-                                image_path = os.path.join(self.image_dir, filename)
-                                
-                                # Decode and save
-                                import base64
-                                with open(image_path, 'wb') as f:
-                                    f.write(base64.b64decode(image_data))
-                                
-                                logger.info(f"画像保存完了: {image_path}")
-                                return image_path
+                # すべての候補から画像を取り出す
+                image_paths = []
+                timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+                for candidate in result.get('candidates') or []:
+                    for part in candidate.get('content', {}).get('parts', []):
+                        if 'inlineData' not in part:
+                            continue
+                        image_data = part['inlineData']['data']
+                        mime_type = part['inlineData']['mimeType']
+                        
+                        # Save image
+                        extension = mime_type.split('/')[-1] if '/' in mime_type else 'png'
+                        filename = f"gemini_{timestamp}_{len(image_paths)}.{extension}"
+                        image_path = os.path.join(self.image_dir, filename)
+                        
+                        # Decode and save
+                        import base64
+                        with open(image_path, 'wb') as f:
+                            f.write(base64.b64decode(image_data))
+                        
+                        logger.info(f"画像保存完了: {image_path}")
+                        image_paths.append(image_path)
                 
-                logger.error("Gemini API: 画像データが見つかりませんでした")
-                return None
+                if not image_paths:
+                    logger.error("Gemini API: 画像データが見つかりませんでした")
+                return image_paths
             else:
                 logger.error(f"Gemini API エラー: HTTP {response.status_code} - {response.text}")
-                return None
+                return []
             
         except Exception as e:
             logger.error(f"Gemini API エラー: {str(e)}")
-            return None
+            return []
 
 
 class GPTImageAPI:
     """OpenAI GPT Image 1 API クライアント"""
     
+    # モデルごとの1リクエストあたりの最大生成数（dall-e-3 は n=1 のみ）
+    MAX_IMAGES_PER_REQUEST = {
+        'dall-e-2': 10,
+        'dall-e-3': 1,
+        'gpt-image-1': 10
+    }
+    # 生成リクエスト・画像ダウンロードのタイムアウト（秒）
+    REQUEST_TIMEOUT = 120
+    DOWNLOAD_TIMEOUT = 60
+    
     def __init__(self, api_key: str):
         self.api_key = api_key
         self.api_base = "https://api.openai.com/v1"
+        self.model = "dall-e-3"  # DALL-E 3 model
         
         # 画像保存ディレクトリ
         self.image_dir = "static/generated_images/gpt"
@@ -531,6 +1221,20 @@ class GPTImageAPI:
         Returns:
             保存された画像のパス、失敗時はNone
         """
+        images = self.generate_candidates(prompt, 1)
+        return images[0] if images else None
+    
+    def generate_candidates(self, prompt: str, count: int = 1) -> List[str]:
+        """
+        1回のリクエストで複数の候補画像を生成
+        
+        Args:
+            prompt: 画像生成プロンプト
+            count: 候補数（モデルの上限を超える分は要求しない）
+            
+        Returns:
+            保存された画像のパスのリスト（失敗時は空）
+        """
         try:
             headers = {
                 "Authorization": f"Bearer {self.api_key}",
@@ -538,40 +1242,388 @@ class GPTImageAPI:
             }
             
             data = {
-                "model": "dall-e-3",  # DALL-E 3 model
+                "model": self.model,
                 "prompt": prompt,
                 "size": "1792x1024",
                 "quality": "standard",
-                "n": 1
+                "n": max(1, min(count, self.MAX_IMAGES_PER_REQUEST.get(self.model, 1)))
             }
             
             logger.info(f"GPT Image APIで画像生成中: {prompt}")
             
-            response = requests.post(
+            response = get_rate_limiter().call('gpt_image', lambda: requests.post(
                 f"{self.api_base}/images/generations",
                 headers=headers,
-                json=data
-            )
+                json=data,
+                timeout=self.REQUEST_TIMEOUT
+            ))
             
             if response.status_code == 200:
                 result = response.json()
-                image_url = result['data'][0]['url']
                 
                 # 画像をダウンロード
-                image_response = requests.get(image_url)
-                if image_response.status_code == 200:
-                    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-                    image_path = os.path.join(self.image_dir, f"gpt_{timestamp}.png")
+                image_paths = []
+                timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+                for item in result.get('data', []):
+                    image_response = requests.get(item['url'], timeout=self.DOWNLOAD_TIMEOUT)
+                    if image_response.status_code != 200:
+                        continue
+                    image_path = os.path.join(self.image_dir, f"gpt_{timestamp}_{len(image_paths)}.png")
                     
                     with open(image_path, 'wb') as f:
                         f.write(image_response.content)
                     
                     logger.info(f"画像保存完了: {image_path}")
-                    return image_path
+                    image_paths.append(image_path)
+                if image_paths:
+                    return image_paths
             
             logger.error(f"GPT Image API エラー: {response.status_code}")
-            return None
+            return []
             
         except Exception as e:
             logger.error(f"GPT Image API エラー: {str(e)}")
-            return None
\ No newline at end of file
+            return []
+
+
+class UnsplashImageAPI:
+    """Unsplashの検索結果を画像生成サービスと同じ形（保存した画像のパス）で返すクライアント"""
+    
+    DOWNLOAD_TIMEOUT = 30
+    
+    def __init__(self, fetcher: UnsplashFetcher):
+        self.fetcher = fetcher
+        
+        # 画像保存ディレクトリ
+        self.image_dir = "static/generated_images/unsplash"
+        os.makedirs(self.image_dir, exist_ok=True)
+    
+    def search(self, title: str, keywords: List[str]) -> List[Dict]:
+        """
+        記事に合う写真を検索（ファイルは保存しない）
+        
+        Returns:
+            写真情報のリスト（見つからない場合は空）
+        """
+        photo = self.fetcher.get_photo_for_article(title=title, keywords=keywords)
+        return [photo] if photo else []
+    
+    def download(self, photo: Dict) -> List[str]:
+        """
+        search で見つけた写真を保存（採用が決まった写真だけに使う）
+        
+        Returns:
+            保存された画像のパスのリスト（失敗時は空）
+        """
+        response = requests.get(photo['url'], timeout=self.DOWNLOAD_TIMEOUT)
+        if response.status_code != 200:
+            logger.error(f"Unsplash画像のダウンロードエラー: {response.status_code}")
+            return []
+        
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+        image_path = os.path.join(self.image_dir, f"unsplash_{timestamp}_{photo['id']}.jpg")
+        with open(image_path, 'wb') as f:
+            f.write(response.content)
+        
+        # ダウンロード通知（Unsplash API要件）
+        self.fetcher.download_photo(photo['id'])
+        logger.info(f"Unsplash画像を保存: {image_path} ({photo['attribution']})")
+        return [image_path]
+
+
+# サイトの画像設定で生成するサービス
+GENERATED_IMAGE_SERVICES = ('auto', 'gemini_image', 'gpt_image')
+
+
+_shared_manager: Optional[ImageGenerationManager] = None
+_shared_manager_lock = threading.Lock()
+
+
+def get_image_manager() -> ImageGenerationManager:
+    """プロセス内で共有するImageGenerationManagerを取得"""
+    global _shared_manager
+    with _shared_manager_lock:
+        if _shared_manager is None:
+            _shared_manager = ImageGenerationManager()
+        return _shared_manager
+
+
+def site_prompt_settings(site) -> Dict:
+    """サイトの画像設定をプロンプト設定に変換"""
+    return {
+        'style': site.image_style,
+        'quality': site.image_quality,
+        'tone': site.image_tone,
+        'additional_instructions': site.image_instructions,
+        'avoid_terms': site.image_avoid_terms
+    }
+
+
+def site_image_request(site, title: str, keywords: List[str]) -> Dict:
+    """サイトの画像設定で generate_article_image・generate_batch に渡す引数"""
+    return {
+        'article_title': title,
+        'keywords': keywords,
+        'genre': site.genre,
+        # ユーザー選択サービスまたは自動選択
+        'user_preference': None if site.image_service == 'auto' else site.image_service,
+        'prompt_settings': site_prompt_settings(site)
+    }
+
+
+def generate_site_image(site, title: str, keywords: List[str]) -> Optional[str]:
+    """
+    サイトの画像設定（サービス・スタイル・トーンなど）でアイキャッチ画像を生成
+    
+    Args:
+        site: サイト（image_service, image_style などを参照）
+        title: 記事タイトル
+        keywords: キーワード（記事のタグ）
+        
+    Returns:
+        生成した画像のパス（生成しない・失敗時はNone）
+    """
+    if site.image_service not in GENERATED_IMAGE_SERVICES:
+        return None
+    try:
+        image_manager = get_image_manager()
+        image_manager.refresh_config()
+        
+        if not image_manager.config.get('image_generation', {}).get('enabled', False):
+            logger.warning("画像生成が無効になっています")
+            return None
+        
+        request = site_image_request(site, title, keywords)
+        logger.info(f"画像生成サービス: {request['user_preference'] or 'auto'}")
+        
+        # 画像生成APIの同時実行数はImageGenerationManager側で制御
+        image_path = image_manager.generate_article_image(**request)
+        
+        if image_path and os.path.exists(image_path):
+            logger.info(f"画像生成成功: {image_path}")
+            return image_path
+        logger.warning("画像生成に失敗しました")
+    except Exception as e:
+        logger.error(f"画像生成エラー: {str(e)}")
+        import traceback
+        logger.error(traceback.format_exc())
+    return None
+
+
+def discard_site_image(image_path: Optional[str]):
+    """generate_site_image で用意したが使わなかった画像を破棄"""
+    if image_path:
+        get_image_manager().discard_image(image_path)
+
+
+_prefetch_executor: Optional[ThreadPoolExecutor] = None
+_prefetch_lock = threading.Lock()
+
+
+def _get_prefetch_executor() -> ThreadPoolExecutor:
+    """先行画像生成用のスレッドプールを取得"""
+    global _prefetch_executor
+    with _prefetch_lock:
+        if _prefetch_executor is None:
+            _prefetch_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="image-prefetch")
+        return _prefetch_executor
+
+
+_hedge_executor: Optional[ThreadPoolExecutor] = None
+_hedge_lock = threading.Lock()
+
+
+def _get_hedge_executor() -> ThreadPoolExecutor:
+    """ヘッジ付き画像取得用のスレッドプールを取得"""
+    global _hedge_executor
+    with _hedge_lock:
+        if _hedge_executor is None:
+            _hedge_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="image-hedge")
+        return _hedge_executor
+
+
+class FeaturedImagePrefetch:
+    """
+    本文の生成と並行してアイキャッチ画像を生成するクラス
+    
+    画像のプロンプトはタイトルとタグだけで決まるため、ストリーミングでタグを受信した時点
+    （自動運用ではテーマ決定時点）で生成を始め、本文の完成時には画像が揃っているようにする
+    """
+    
+    def __init__(self, generate: Optional[Callable[[str, List[str]], Optional[str]]] = None,
+                 discard: Optional[Callable[[Optional[str]], None]] = None,
+                 submit: Optional[Callable[[str, List[str]], Future]] = None):
+        """
+        初期化
+        
+        Args:
+            generate: (タイトル, キーワード) から画像パスを返す関数（先行生成用のスレッドで実行）
+            discard: 取り消した後に完了した画像を破棄する関数
+            submit: generate の代わりに (タイトル, キーワード) で生成を開始して Future を返す関数
+        """
+        self._submit = submit or (
+            lambda title, keywords: _get_prefetch_executor().submit(generate, title, keywords)
+        )
+        self._discard = discard
+        self._fields: Dict[str, Any] = {}
+        self._future: Optional[Future] = None
+        self._cancelled = False
+        self._lock = threading.Lock()
+    
+    @property
+    def started(self) -> bool:
+        """画像生成を開始済みか"""
+        return self._future is not None
+    
+    def start(self, title: str, keywords: List[str]) -> bool:
+        """
+        画像生成を開始（開始済みの場合は何もしない）
+        
+        Returns:
+            今回開始した場合True
+        """
+        with self._lock:
+            if self._future is not None or self._cancelled or not title:
+                return False
+            logger.info(f"アイキャッチ画像の先行生成を開始: {title}")
+            self._future = self._submit(title, list(keywords or []))
+            return True
+    
+    def cancel(self):
+        """
+        記事の生成に失敗した場合に呼ぶ
+        
+        未開始なら以後開始せず、実行待ちなら取り消す。実行中のものは完了後に画像を破棄する
+        """
+        with self._lock:
+            self._cancelled = True
+            future = self._future
+        if future is None or future.cancel():
+            return
+        logger.info("記事の生成に失敗したため、アイキャッチ画像の先行生成を破棄します")
+        
+        def discard(done: Future):
+            if self._discard and not done.cancelled() and done.exception() is None:
+                self._discard(done.result())
+        
+        future.add_done_callback(discard)
+    
+    def on_field(self, tag: str, value: Any):
+        """ストリーミング受信のコールバック（タイトルとタグが揃ったら生成を開始）"""
+        if tag in ('title', 'tags'):
+            self._fields[tag] = value
+        if 'title' in self._fields and 'tags' in self._fields:
+            self.start(self._fields['title'], self._fields['tags'])
+    
+    def result(self, title: str, keywords: List[str], timeout: Optional[float] = None) -> Optional[str]:
+        """
+        生成した画像のパスを取得（未開始ならここで開始し、完了を待つ）
+        
+        Args:
+            title: 完成した記事のタイトル（未開始の場合に使用）
+            keywords: 完成した記事のタグ（未開始の場合に使用）
+            timeout: 待機する最大秒数
+        """
+        self.start(title, keywords)
+        if self._future is None or self._cancelled:
+            return None
+        try:
+            return self._future.result(timeout=timeout)
+        except Exception as e:
+            logger.error(f"アイキャッチ画像の先行生成エラー: {str(e)}")
+            return None
+
+
+class FeaturedImageBatch:
+    """
+    バッチ内の記事のアイキャッチ画像を generate_batch でまとめて生成するクラス
+    
+    prefetch(i) で記事ごとの FeaturedImagePrefetch を返し、タイトルとタグを受信した記事から
+    順に生成を始める。選択履歴は close() の後、バッチ全体の完了時に1回だけ書き込む
+    """
+    
+    def __init__(self, site):
+        """
+        初期化
+        
+        Args:
+            site: サイト（image_service, image_style などを参照）
+        """
+        self._site = site
+        self._requests: 'queue.Queue[Optional[Dict]]' = queue.Queue()
+        # generate_batch に渡した順の、結果を受け取る Future
+        self._submitted: List[Future] = []
+        self._lock = threading.Lock()
+        self._closed = False
+        threading.Thread(target=self._run, name="image-batch", daemon=True).start()
+    
+    def __enter__(self) -> 'FeaturedImageBatch':
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.close()
+    
+    def prefetch(self, index: int) -> FeaturedImagePrefetch:
+        """バッチ内の index 番目の記事の先行生成"""
+        return FeaturedImagePrefetch(
+            discard=discard_site_image,
+            submit=lambda title, keywords: self._submit(index, title, keywords)
+        )
+    
+    def _submit(self, index: int, title: str, keywords: List[str]) -> Future:
+        """記事の画像をバッチに追加"""
+        future: Future = Future()
+        if self._site.image_service not in GENERATED_IMAGE_SERVICES:
+            future.set_result(None)
+            return future
+        image_manager = get_image_manager()
+        image_manager.refresh_config()
+        if not image_manager.config.get('image_generation', {}).get('enabled', False):
+            logger.warning("画像生成が無効になっています")
+            future.set_result(None)
+            return future
+        
+        request = site_image_request(self._site, title, keywords)
+        with self._lock:
+            if self._closed:
+                future.set_result(None)
+                return future
+            logger.info(f"画像生成サービス: {request['user_preference'] or 'auto'}（記事{index + 1}）")
+            self._submitted.append(future)
+            self._requests.put(request)
+        return future
+    
+    def close(self):
+        """これ以上記事を追加しない（開始していない記事の画像は生成しない）"""
+        with self._lock:
+            if not self._closed:
+                self._closed = True
+                self._requests.put(None)
+    
+    def _run(self):
+        """生成が終わった画像を記事ごとの Future に渡す"""
+        resolved = set()
+        try:
+            image_manager = get_image_manager()
+            for position, image_path in image_manager.generate_batch(iter(self._requests.get, None)):
+                with self._lock:
+                    future = self._submitted[position]
+                resolved.add(position)
+                if image_path and not os.path.exists(image_path):
+                    image_path = None
+                # 記事の生成に失敗して取り消された画像は破棄する
+                if not future.set_running_or_notify_cancel():
+                    discard_site_image(image_path)
+                    continue
+                future.set_result(image_path)
+        except Exception as e:
+            logger.error(f"バッチ画像生成エラー: {str(e)}")
+        finally:
+            # 結果を受け取れなかった記事は画像なしとして待機を終わらせる
+            with self._lock:
+                self._closed = True
+                pending = [future for position, future in enumerate(self._submitted)
+                           if position not in resolved]
+            for future in pending:
+                if future.set_running_or_notify_cancel():
+                    future.set_result(None)
@@ -0,0 +1,270 @@
+"""
+画像最適化パイプライン
+生成画像からWebP（対応環境ではAVIFも）のレスポンシブ用バリエーションを
+別プロセスで作成し、アップロードには条件を満たす最小のファイルを使う
+"""
+import os
+import json
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# 形式 → (Pillowの保存形式, 拡張子)
+VARIANT_FORMATS = {
+    'webp': ('WEBP', '.webp'),
+    'avif': ('AVIF', '.avif')
+}
+
+
+def build_variants(source_path: str, output_dir: str, widths: List[int],
+                   formats: List[str], quality: int, min_upload_width: int = 0) -> List[Dict]:
+    """
+    画像のバリエーションを作成（ワーカープロセスで実行）
+
+    指定の幅は元画像より小さいものだけを作る。その中に最小アップロード幅
+    （元画像の方が狭ければ元画像の幅）以上のものがなければ元画像の幅でも作る。
+    JPEGは元画像の幅を作らない場合、draft モードで必要な解像度に近いサイズでデコードする
+
+    Returns:
+        バリエーションのリスト（path, width, height, format, bytes）
+    """
+    from PIL import Image
+
+    os.makedirs(output_dir, exist_ok=True)
+    stem = Path(source_path).stem
+    variants = []
+
+    with Image.open(source_path) as img:
+        target_widths = {w for w in widths if w < img.width}
+        if not any(w >= min(min_upload_width, img.width) for w in target_widths):
+            target_widths.add(img.width)
+        target_widths = sorted(target_widths, reverse=True)
+        # 最大幅に必要な解像度までしかデコードしない（JPEG以外では何もしない）
+        largest = target_widths[0]
+        if largest < img.width:
+            img.draft('RGB', (largest, max(1, img.height * largest // img.width)))
+        img.load()
+        if img.mode not in ('RGB', 'RGBA'):
+            has_alpha = 'A' in img.getbands() or 'transparency' in img.info
+            img = img.convert('RGBA' if has_alpha else 'RGB')
+
+        # 大きい幅から順に縮小し、次の幅は前の縮小結果から作る
+        current = img
+        for width in target_widths:
+            if current.width != width:
+                height = max(1, round(current.height * width / current.width))
+                current = current.resize((width, height), Image.Resampling.LANCZOS)
+            for name in formats:
+                pil_format, extension = VARIANT_FORMATS[name]
+                output_path = os.path.join(output_dir, f"{stem}-{width}w{extension}")
+                options = {'quality': quality}
+                if name == 'webp':
+                    options['method'] = 4
+                try:
+                    current.save(output_path, pil_format, **options)
+                except (KeyError, OSError, ValueError) as e:
+                    # AVIFは Pillow のビルドによっては保存できない
+                    logger.warning(f"{name}形式で保存できません: {str(e)}")
+                    continue
+                variants.append({
+                    'path': output_path,
+                    'width': current.width,
+                    'height': current.height,
+                    'format': name,
+                    'bytes': os.path.getsize(output_path)
+                })
+
+    return variants
+
+
+class ImagePipeline:
+    """画像バリエーションをプロセスプールで作成するクラス"""
+
+    DEFAULT_SETTINGS = {
+        'enabled': True,
+        'formats': ['webp'],
+        'widths': [1200, 768],
+        'min_upload_width': 1200,
+        'quality': 80,
+        'max_workers': 2,
+        'output_dir': 'static/generated_images/variants'
+    }
+
+    def __init__(self, settings: Optional[Dict] = None):
+        """
+        初期化
+
+        Args:
+            settings: image_generation.optimization の設定
+        """
+        self.settings = dict(self.DEFAULT_SETTINGS)
+        self.settings.update(settings or {})
+        self.formats = [f for f in self.settings['formats'] if f in VARIANT_FORMATS]
+        self.widths = sorted({int(w) for w in self.settings['widths']}, reverse=True)
+        self._executor: Optional[ProcessPoolExecutor] = None
+        # 作成中・作成済みのバリエーション（キー: 元画像のパス）
+        self._futures: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config_path: str = 'config/image_apis.json') -> 'ImagePipeline':
+        """画像生成設定ファイルから生成"""
+        settings = {}
+        try:
+            with open(config_path, 'r', encoding='utf-8') as f:
+                settings = json.load(f).get('image_generation', {}).get('optimization', {})
+        except Exception as e:
+            logger.warning(f"画像最適化設定の読み込みエラー（デフォルト値を使用）: {str(e)}")
+        return cls(settings)
+
+    @property
+    def enabled(self) -> bool:
+        """最適化が有効か（作成できる形式がない場合は無効）"""
+        return bool(self.settings.get('enabled', True)) and bool(self.formats)
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        """
+        プロセスプールを取得（初回の画像で起動する）
+
+        生成ジョブなどのスレッドが動いているプロセスから fork するとロックを
+        保持したまま複製されることがあるため、ワーカーは spawn で起動する
+        """
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=max(1, int(self.settings['max_workers'])),
+                mp_context=multiprocessing.get_context('spawn')
+            )
+        return self._executor
+
+    def _discard_executor(self):
+        """プロセスプールのワーカーを終了させ、次回の画像で作り直す（_lock を保持して呼ぶ）"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def submit(self, source_path: str) -> Optional[Future]:
+        """
+        バリエーションの作成を開始（呼び出し元はすぐに戻る）
+
+        同じ画像を複数回渡しても作成は1回のみ
+        """
+        if not self.enabled or not source_path or not os.path.exists(source_path):
+            return None
+        with self._lock:
+            future = self._futures.get(source_path)
+            if future is not None and future.done() and (future.cancelled() or future.exception() is not None):
+                # 失敗した作成はやり直す
+                future = None
+            if future is None:
+                if len(self._futures) >= 64:
+                    # 受け取られなかった完了済みの結果を破棄
+                    for path in [p for p, f in self._futures.items() if f.done()]:
+                        del self._futures[path]
+                try:
+                    future = self._get_executor().submit(
+                        build_variants, source_path, self.settings['output_dir'],
+                        self.widths, self.formats, int(self.settings['quality']),
+                        int(self.settings['min_upload_width'])
+                    )
+                except BrokenProcessPool as e:
+                    # ワーカーが異常終了したプールは終了させて次回作り直す
+                    logger.error(f"画像最適化の開始エラー: {str(e)}")
+                    self._discard_executor()
+                    return None
+                except Exception as e:
+                    logger.error(f"画像最適化の開始エラー: {str(e)}")
+                    return None
+                self._futures[source_path] = future
+            return future
+
+    def select_upload_variant(self, variants: List[Dict], source_path: str) -> str:
+        """
+        最小アップロード幅（元画像の方が狭ければ元画像の幅）以上のバリエーションのうち
+        最も小さいファイル（なければ元画像）
+        """
+        from PIL import Image
+
+        try:
+            with Image.open(source_path) as img:
+                source_width = img.width
+        except Exception as e:
+            logger.warning(f"元画像の幅を取得できません（元画像を使用）: {str(e)}")
+            return source_path
+        min_width = min(int(self.settings['min_upload_width']), source_width)
+        candidates = [v for v in variants if v['width'] >= min_width]
+        if not candidates:
+            return source_path
+        best = min(candidates, key=lambda v: v['bytes'])
+        if best['bytes'] >= os.path.getsize(source_path):
+            return source_path
+        return best['path']
+
+    def prepare_upload(self, source_path: str, timeout: float = 60) -> str:
+        """
+        アップロードに使う画像のパスを取得（作成中なら完了を待つ）
+
+        Returns:
+            最適化した画像のパス、作成できなかった場合は元画像のパス
+        """
+        future = self.submit(source_path)
+        if future is None:
+            return source_path
+        try:
+            variants = future.result(timeout=timeout)
+        except Exception as e:
+            logger.error(f"画像最適化エラー（元画像を使用）: {str(e)}")
+            with self._lock:
+                self._futures.pop(source_path, None)
+            return source_path
+        with self._lock:
+            self._futures.pop(source_path, None)
+
+        upload_path = self.select_upload_variant(variants, source_path)
+        if upload_path != source_path:
+            before = os.path.getsize(source_path)
+            after = os.path.getsize(upload_path)
+            logger.info(f"最適化画像を使用: {upload_path} ({before // 1024}KB → {after // 1024}KB)")
+        return upload_path
+
+    def discard(self, source_path: str):
+        """使わなくなった画像のバリエーションを削除（作成中なら完了後に削除）"""
+        with self._lock:
+            future = self._futures.pop(source_path, None)
+        if future is None or future.cancel():
+            return
+
+        def remove_variants(done: Future):
+            if done.cancelled() or done.exception() is not None:
+                return
+            for variant in done.result():
+                try:
+                    os.remove(variant['path'])
+                except OSError:
+                    pass
+
+        future.add_done_callback(remove_variants)
+
+    def shutdown(self):
+        """ワーカープロセスを終了"""
+        with self._lock:
+            self._discard_executor()
+            self._futures.clear()
+
+
+_shared_pipeline: Optional[ImagePipeline] = None
+_shared_lock = threading.Lock()
+
+
+def get_image_pipeline() -> ImagePipeline:
+    """プロセス内で共有するImagePipelineを取得"""
+    global _shared_pipeline
+    with _shared_lock:
+        if _shared_pipeline is None:
+            _shared_pipeline = ImagePipeline.from_config()
+        return _shared_pipeline
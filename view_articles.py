@@ -2,40 +2,30 @@
 """
 生成済み記事を見やすく表示するスクリプト
 """
-import json
 import sys
 from datetime import datetime
+from modules.article_store import ArticleStore
 
-def load_articles():
-    """記事データを読み込む"""
+def load_store():
+    """記事ストアを開く"""
     try:
-        with open('data/generated_articles.json', 'r', encoding='utf-8') as f:
-            return json.load(f)
-    except FileNotFoundError:
-        print("記事データファイルが見つかりません")
-        return None
-    except json.JSONDecodeError:
-        print("記事データの読み込みエラー")
+        return ArticleStore()
+    except Exception as e:
+        print(f"記事データの読み込みエラー: {str(e)}")
         return None
 
 def display_articles(site_id=None, limit=10):
     """記事を表示"""
-    data = load_articles()
-    if not data:
+    store = load_store()
+    if not store:
         return
     
-    articles = data.get('articles', [])
-    
-    # サイトIDでフィルタ
-    if site_id:
-        articles = [a for a in articles if a.get('site_id') == site_id]
-    
-    # 最新順にソート
-    articles.sort(key=lambda x: x.get('created_at', ''), reverse=True)
+    # サイトIDで絞り込み、最新順に取得
+    articles = store.list_articles(site_id=site_id, limit=limit)
     
     print(f"\n=== 生成済み記事 (最新{limit}件) ===\n")
     
-    for i, article in enumerate(articles[:limit], 1):
+    for i, article in enumerate(articles, 1):
         print(f"{i}. {article.get('title', '不明なタイトル')}")
         print(f"   作成日時: {article.get('created_at', '不明')}")
         print(f"   ステータス: {article.get('status', '不明')}")
@@ -50,26 +40,16 @@ def display_articles(site_id=None, limit=10):
 
 def show_stats():
     """統計情報を表示"""
-    data = load_articles()
-    if not data:
+    store = load_store()
+    if not store:
         return
     
-    articles = data.get('articles', [])
-    
     # サイト別統計
-    site_stats = {}
-    for article in articles:
-        site_name = article.get('site_name', '不明')
-        if site_name not in site_stats:
-            site_stats[site_name] = {'total': 0, 'published': 0}
-        
-        site_stats[site_name]['total'] += 1
-        if article.get('status') == '公開済み':
-            site_stats[site_name]['published'] += 1
+    site_stats = store.count_by_site()
     
     print("\n=== 記事統計 ===\n")
-    print(f"総記事数: {len(articles)}")
-    print(f"公開済み: {sum(1 for a in articles if a.get('status') == '公開済み')}")
+    print(f"総記事数: {store.count_articles()}")
+    print(f"公開済み: {store.count_articles(status='公開済み')}")
     
     print("\n=== サイト別統計 ===")
     for site, stats in site_stats.items():